@@ -0,0 +1,185 @@
+# admission.py
+"""
+Admission control / load shedding per route class.
+
+Every request is classified (health, reads, plans, basket, stats, writes,
+track, bundle). Each class has its own in-flight limit, a bounded FIFO wait queue and
+a max queue time; past either bound the request gets an immediate 503 +
+Retry-After instead of piling onto the shared thread pool. Limits are per
+class, so a Sunday rush of basket builds queues (and sheds) against its own
+budget while recipe reads and /v1/health keep their capacity. Health is never
+queued.
+
+Decisions are counted per class; see admission_stats() (served at /v1/metrics).
+"""
+
+import asyncio, json, time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Optional
+
+
+@dataclass
+class ClassLimits:
+    max_inflight: int
+    max_queue: int
+    max_queue_ms: float
+    retry_after_s: int = 1
+
+
+# max_inflight of the thread-using classes (all but track) sums to 40, the
+# default thread pool for sync routes
+LIMITS: Dict[str, ClassLimits] = {
+    "reads":  ClassLimits(max_inflight=12, max_queue=64, max_queue_ms=250),
+    "plans":  ClassLimits(max_inflight=8,  max_queue=32, max_queue_ms=500),
+    "basket": ClassLimits(max_inflight=4,  max_queue=16, max_queue_ms=2000, retry_after_s=5),
+    "stats":  ClassLimits(max_inflight=4,  max_queue=16, max_queue_ms=1000, retry_after_s=2),
+    "writes": ClassLimits(max_inflight=6,  max_queue=32, max_queue_ms=1000, retry_after_s=2),
+    # POST /v1/track is async: a request waiting for its group commit holds no worker thread
+    "track":  ClassLimits(max_inflight=64, max_queue=256, max_queue_ms=1000),
+    # catalog bundle downloads stream a file for as long as the client takes
+    "bundle": ClassLimits(max_inflight=6,  max_queue=32, max_queue_ms=2000, retry_after_s=10),
+}
+UNLIMITED = {"health"}
+
+
+def classify(method: str, path: str) -> str:
+    if path in ("/v1/health", "/v1/metrics"):
+        return "health"
+    if path.startswith("/v1/catalog/bundle"):
+        return "bundle"
+    if path.startswith("/v1/basket") or path == "/v1/plans/generate" or path.endswith("/swaps"):
+        return "basket"
+    if path == "/v1/track" and method == "POST":
+        return "track"
+    if path.startswith("/v1/stats") or path.startswith("/v1/track") or path == "/v1/home":
+        return "stats"
+    if path == "/v1/recipes/pantry-match":
+        return "reads"                      # POST for the body, but a read
+    if method not in ("GET", "HEAD", "OPTIONS"):
+        return "writes"
+    if path.startswith("/v1/plans"):
+        return "plans"
+    return "reads"
+
+
+@dataclass
+class _ClassState:
+    limits: ClassLimits
+    inflight: int = 0
+    waiters: Deque[asyncio.Future] = field(default_factory=deque)
+    counters: Dict[str, int] = field(default_factory=lambda: {
+        "admitted": 0, "queued": 0, "shed_queue_full": 0, "shed_timeout": 0, "completed": 0,
+    })
+    queue_ms_total: float = 0.0
+
+
+class AdmissionController:
+    def __init__(self, limits: Optional[Dict[str, ClassLimits]] = None):
+        self.classes = {name: _ClassState(lim) for name, lim in (limits or LIMITS).items()}
+
+    async def acquire(self, cls: str) -> Optional[str]:
+        """None when admitted, else the shed reason. Runs on the event loop only."""
+        st = self.classes[cls]
+        if st.inflight < st.limits.max_inflight and not st.waiters:
+            st.inflight += 1
+            st.counters["admitted"] += 1
+            return None
+        if len(st.waiters) >= st.limits.max_queue:
+            st.counters["shed_queue_full"] += 1
+            return "queue_full"
+
+        fut = asyncio.get_running_loop().create_future()
+        st.waiters.append(fut)
+        st.counters["queued"] += 1
+        t0 = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), st.limits.max_queue_ms / 1000.0)
+        except asyncio.TimeoutError:
+            # a slot handed over just as we timed out is kept
+            if not fut.done():
+                self._drop_waiter(st, fut)
+                st.counters["shed_timeout"] += 1
+                return "timeout"
+        except asyncio.CancelledError:
+            # client went away while queued: give back a slot we were already handed
+            if fut.done() and not fut.cancelled():
+                self.release(cls, completed=False)
+            else:
+                self._drop_waiter(st, fut)
+            raise
+        st.queue_ms_total += (time.perf_counter() - t0) * 1000.0
+        st.counters["admitted"] += 1
+        return None
+
+    @staticmethod
+    def _drop_waiter(st: _ClassState, fut: asyncio.Future) -> None:
+        fut.cancel()
+        try:
+            st.waiters.remove(fut)
+        except ValueError:
+            pass
+
+    def release(self, cls: str, completed: bool = True) -> None:
+        st = self.classes[cls]
+        if completed:
+            st.counters["completed"] += 1
+        while st.waiters:
+            fut = st.waiters.popleft()
+            if not fut.done():
+                fut.set_result(True)   # hand the slot straight to the next waiter
+                return
+        st.inflight -= 1
+
+    def stats(self) -> dict:
+        out = {}
+        for name, st in self.classes.items():
+            queued = st.counters["queued"] or 1
+            out[name] = {
+                **st.counters,
+                "inflight": st.inflight,
+                "waiting": len(st.waiters),
+                "avg_queue_ms": round(st.queue_ms_total / queued, 2),
+                "limits": vars(st.limits),
+            }
+        return out
+
+
+CONTROLLER = AdmissionController()
+
+
+def admission_stats() -> dict:
+    return CONTROLLER.stats()
+
+
+class AdmissionMiddleware:
+    """Outermost ASGI middleware: classify → acquire (or 503) → run → release."""
+
+    def __init__(self, app, controller: AdmissionController = CONTROLLER):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        cls = classify(scope["method"], scope["path"])
+        if cls in UNLIMITED or cls not in self.controller.classes:
+            await self.app(scope, receive, send)
+            return
+
+        reason = await self.controller.acquire(cls)
+        if reason is not None:
+            lim = self.controller.classes[cls].limits
+            body = json.dumps({"detail": f"Server busy ({cls}: {reason}), retry shortly"}).encode("utf-8")
+            await send({"type": "http.response.start", "status": 503, "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"retry-after", str(lim.retry_after_s).encode("latin-1")),
+            ]})
+            await send({"type": "http.response.body", "body": body})
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(cls)
@@ -1,9 +1,15 @@
 # basket_builder.py
 
-import sqlite3, datetime as dt, json
+import re, datetime as dt, json
 
-def connect(db_path="/Users/lukeyp02/Desktop/scranly/api/data/scranly.db"):
-    return sqlite3.connect(db_path)
+import sqlalchemy as sa
+
+import db
+from catalog_changes import catalog_version
+from pack_optimiser import load_pack_catalog, parse_quantity, convert, optimise_item
+from singleflight import single_flight
+
+# All functions here take a SQLAlchemy connection (db.get_engine().begin()).
 PANTRY = {"salt","pepper","olive oil","oil","water","chili flakes","sugar","flour"}
 
 def normalise_name(name: str) -> str:
@@ -63,6 +69,18 @@ def clean_name(name: str):
     return name
 def sunday_of_week(d: dt.date) -> dt.date:
     return d - dt.timedelta(days=d.weekday() + 1) if d.weekday() != 6 else d
+def basket_source(conn, user_id: str, week_start: dt.date) -> tuple:
+    """(plan_id, version) of the plan a (user, week) basket is built from, or (None, None)."""
+    row = conn.execute(sa.text("""
+        SELECT id, version
+        FROM plans
+        WHERE user_id = :u AND start_date <= :w AND end_date >= :w
+        ORDER BY start_date DESC
+        LIMIT 1
+    """), {"u": user_id, "w": week_start.isoformat()}).first()
+    return (int(row[0]), int(row[1] or 1)) if row else (None, None)
+
+@single_flight("basket", ignore=("conn",))
 def build_basket_for_week(conn, user_id: str, week_start: dt.date) -> dict:
     """
     Build a basket for a user in a given week.
@@ -73,59 +91,81 @@ def build_basket_for_week(conn, user_id: str, week_start: dt.date) -> dict:
     """
     print(f"🔨 build_basket_for_week(user_id={user_id}, week_start={week_start})")
 
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT id, plan_json
-        FROM plans
-        WHERE user_id = ? AND start_date <= ? AND end_date >= ?
-        LIMIT 1
-    """, (user_id, week_start.isoformat(), week_start.isoformat()))
-    row = cur.fetchone()
-    if not row:
+    plan_id, plan_version = basket_source(conn, user_id, week_start)
+    if plan_id is None:
         print("❌ No plan found")
         return {"items": [], "estimated_total": 0.0, "source_plan_id": None}
+    print(f"📅 Found plan {plan_id} (v{plan_version})")
+    version = catalog_version(conn)
 
-    plan_id, plan_json = row
-    print(f"📅 Found plan {plan_id}")
-
-    try:
-        plan = json.loads(plan_json)
-    except Exception as e:
-        print(f"⚠️ Error parsing plan_json: {e}")
-        return {"items": [], "estimated_total": 0.0, "source_plan_id": plan_id}
-
-    # collect meal_ids
-    meal_ids = []
-    for day in plan.get("days", []):
-        for slot in ("breakfast", "lunch", "dinner"):
-            for it in day.get(slot, []):
-                if "meal_id" in it:
-                    meal_ids.append(it["meal_id"])
+    # collect meal_ids (plans_by_date is the source of truth, idx_pbd_plan)
+    meal_ids = [str(m) for (m,) in conn.execute(sa.text("""
+        SELECT meal_id
+        FROM plans_by_date
+        WHERE plan_id = :p
+        ORDER BY date,
+                 CASE slot WHEN 'breakfast' THEN 0 WHEN 'lunch' THEN 1 WHEN 'dinner' THEN 2 ELSE 99 END,
+                 idx
+    """), {"p": plan_id})]
 
     if not meal_ids:
         print("❌ No meals found in plan")
-        return {"items": [], "estimated_total": 0.0, "source_plan_id": plan_id}
+        return {"items": [], "estimated_total": 0.0, "source_plan_id": plan_id,
+                "source_plan_version": plan_version, "catalog_version": version}
+
+    rows = conn.execute(
+        sa.text("SELECT id, ingredients_json FROM meals WHERE id IN :ids").bindparams(db.in_list("ids")),
+        {"ids": sorted(set(meal_ids))},
+    ).all()
 
-    placeholders = ",".join(["?"] * len(meal_ids))
-    cur.execute(f"SELECT id, ingredients_json FROM meals WHERE id IN ({placeholders})", meal_ids)
-    rows = cur.fetchall()
+    out = basket_from_rows(rows, verbose=True, packs=load_pack_catalog(conn))
+    out.update(source_plan_id=plan_id, source_plan_version=plan_version, catalog_version=version)
+    print(f"🧺 Built basket with {len(out['items'])} items, est_total=£{out['estimated_total']:.2f}")
+    return out
 
+def basket_from_rows(rows, verbose: bool = False, packs=None) -> dict:
+    """
+    Pure part of the basket build: (meal_id, ingredients_json) rows → items + total.
+    ingredients_json may be the raw JSON string or an already-parsed list.
+    Shared by build_basket_for_week and the bulk precompute job.
+
+    With `packs` (a pack_optimiser.PackCatalog), ingredients that map to a catalog
+    product are summed in real units and bought as the cheapest pack combination;
+    anything unmapped keeps the one-portion-per-mention estimate.
+    """
     PANTRY = {"salt", "pepper", "olive oil", "oil", "water", "chili flakes"}
 
     basket = {}
+    needs = {}   # product key -> need in the product's pack_unit
     for meal_id, ing_json in rows:
         try:
-            ings = json.loads(ing_json) if ing_json else []
+            if isinstance(ing_json, list):
+                ings = ing_json
+            else:
+                ings = json.loads(ing_json) if ing_json else []
             for ing in ings:
                 raw_name = (ing.get("ingredient") or ing.get("name") or "").strip()
                 if not raw_name:
                     continue
                 norm = raw_name.lower()
-                print(f"   raw='{raw_name}' → norm='{norm}'")
+                if verbose:
+                    print(f"   raw='{raw_name}' → norm='{norm}'")
 
                 # skip pantry items
                 if norm in PANTRY:
-                    print(f"     ↳ skipped pantry: {norm}")
+                    if verbose:
+                        print(f"     ↳ skipped pantry: {norm}")
+                    continue
+
+                product = packs.product_for(norm) if packs else None
+                if product:
+                    opts = packs.products[product]
+                    amount, unit = parse_quantity(str(ing.get("quantity") or ""))
+                    need = convert(amount, unit, opts[0].pack_unit)
+                    if need is None:
+                        # e.g. "2 chicken breasts" vs a grams pack: one smallest pack per mention
+                        need = min(o.pack_amount for o in opts)
+                    needs[product] = needs.get(product, 0.0) + need
                     continue
 
                 if norm not in basket:
@@ -146,12 +186,71 @@ def build_basket_for_week(conn, user_id: str, week_start: dt.date) -> dict:
         except Exception as e:
             print(f"⚠️ Error parsing ingredients for meal {meal_id}: {e}")
 
-    items = list(basket.values())
-    est_total = sum(it["need_amount"] * it["estimate"]["price_per_pack"] for it in items)
-
-    print(f"🧺 Built basket with {len(items)} items, est_total=£{est_total:.2f}")
+    items = [
+        optimise_item(packs.products[p][0].name.lower(), need, packs.products[p])
+        for p, need in needs.items()
+    ]
+    items += list(basket.values())
+    est_total = sum(
+        it["cost"] if "cost" in it else it["need_amount"] * it["estimate"]["price_per_pack"]
+        for it in items
+    )
     return {
         "items": items,
         "estimated_total": est_total,
+    }
+
+# -----------------------
+# Stored baskets (baskets table, see basket.py for the schema)
+# -----------------------
+BASKET_KEY = ("user_id", "week_start")
+
+def basket_row(user_id: str, week_start: dt.date, out: dict) -> dict:
+    """One baskets row for save_baskets."""
+    week_end = week_start + dt.timedelta(days=6)
+    return {
+        "user_id": user_id,
+        "plan_id": out.get("source_plan_id") or 0,
+        "week_start": week_start.isoformat(),
+        "week_end": week_end.isoformat(),
+        "items_json": json.dumps(out.get("items") or [], separators=(",", ":")),
+        "estimated_total": float(out.get("estimated_total") or 0.0),
+        "plan_version": out.get("source_plan_version"),
+        "catalog_version": out.get("catalog_version"),
+        # same text format as SQLite's CURRENT_TIMESTAMP
+        "created_at": dt.datetime.now(dt.timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+def save_baskets(conn, rows: list[dict]) -> None:
+    """Upserts many basket_row() dicts; the caller holds the transaction."""
+    db.upsert(conn, "baskets", rows, key=BASKET_KEY)
+
+def load_basket(conn, user_id: str, week_start: dt.date) -> dict | None:
+    """
+    Returns the precomputed basket for (user, week), or None if nothing is stored
+    or it is stale: built from another plan, an older plan version, or before the
+    meals catalog last changed.
+    """
+    row = conn.execute(sa.text("""
+        SELECT plan_id, items_json, estimated_total, plan_version, catalog_version
+        FROM baskets
+        WHERE user_id = :u AND week_start = :w
+    """), {"u": user_id, "w": week_start.isoformat()}).first()
+    if not row:
+        return None
+    plan_id, items_json, est_total, plan_version, built_at = row
+    if (plan_id, plan_version) != basket_source(conn, user_id, week_start) or built_at != catalog_version(conn):
+        print(f"♻️ Stored basket for {user_id} @ {week_start} is stale")
+        return None
+    try:
+        items = json.loads(items_json) if items_json else []
+    except Exception as e:
+        print(f"⚠️ Stored basket for {user_id} @ {week_start} is unreadable: {e}")
+        return None
+    return {
+        "items": items,
+        "estimated_total": float(est_total or 0.0),
         "source_plan_id": plan_id,
-    }
\ No newline at end of file
+        "source_plan_version": plan_version,
+        "catalog_version": built_at,
+    }
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Precomputes the weekly basket for every user with a plan covering the target week
+and stores it in `baskets`, so GET /v1/basket is a single indexed read on Sunday.
+
+- Enumerates (user_id, plan_id) from `plans`, meal ids from `plans_by_date`
+- Prefetches + parses ingredients_json for the union of all meals ONCE
+- Loads the pack catalog once; baskets are priced with pack_optimiser
+- Builds baskets in a process pool (each worker gets the ingredient map once)
+- Upserts results into `baskets` in large batched transactions
+- --resume skips users whose stored basket is still current (same plan + version,
+  same catalog version); stale ones are rebuilt
+
+Usage:
+  python bulk_baskets.py
+  python bulk_baskets.py --week-start 2025-10-05
+  python bulk_baskets.py --workers 8 --batch-size 1000
+  python bulk_baskets.py --resume
+"""
+
+import argparse, json, os, sys, time
+import datetime as dt
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Tuple
+
+import sqlalchemy as sa
+
+import db
+import migrations
+from catalog_changes import catalog_version
+from basket_builder import sunday_of_week, basket_from_rows, basket_row, save_baskets
+from pack_optimiser import load_pack_catalog
+
+MAX_VARS = 900          # stay under SQLITE_MAX_VARIABLE_NUMBER on old builds
+CHUNK_USERS = 64        # users per worker task
+
+Job = Tuple[str, int, int, List[str]]  # (user_id, plan_id, plan version, meal_ids)
+
+
+def chunked(seq, n):
+    for i in range(0, len(seq), n):
+        yield seq[i:i + n]
+
+
+def find_jobs(conn, week_start: dt.date, resume: bool, version: int) -> List[Job]:
+    """One job per user: the latest plan covering week_start + its meal ids (plan order)."""
+    ws = week_start.isoformat()
+    rows = conn.execute(sa.text("""
+        SELECT user_id, id, version
+        FROM plans
+        WHERE start_date <= :w AND end_date >= :w
+        ORDER BY user_id, start_date DESC
+    """), {"w": ws}).all()
+
+    plan_by_user: Dict[str, int] = {}
+    plan_version: Dict[int, int] = {}
+    for user_id, plan_id, v in rows:
+        if str(user_id) not in plan_by_user:
+            plan_by_user[str(user_id)] = int(plan_id)
+            plan_version[int(plan_id)] = int(v or 1)
+
+    if resume and plan_by_user:
+        current = {
+            str(u) for u, p, v in conn.execute(sa.text("""
+                SELECT user_id, plan_id, plan_version FROM baskets
+                WHERE week_start = :w AND catalog_version = :c
+            """), {"w": ws, "c": version})
+            if plan_by_user.get(str(u)) == p and plan_version.get(p) == v
+        }
+        plan_by_user = {u: p for u, p in plan_by_user.items() if u not in current}
+
+    meals_by_plan: Dict[int, List[str]] = {p: [] for p in plan_by_user.values()}
+    plan_ids = list(meals_by_plan.keys())
+    for part in chunked(plan_ids, MAX_VARS):
+        for plan_id, meal_id in conn.execute(sa.text("""
+            SELECT plan_id, meal_id
+            FROM plans_by_date
+            WHERE plan_id IN :ids
+            ORDER BY plan_id, date,
+                     CASE slot WHEN 'breakfast' THEN 0 WHEN 'lunch' THEN 1 WHEN 'dinner' THEN 2 ELSE 99 END,
+                     idx
+        """).bindparams(db.in_list("ids")), {"ids": part}):
+            mids = meals_by_plan[int(plan_id)]
+            mid = str(meal_id)
+            if mid not in mids:
+                mids.append(mid)
+
+    return [(u, p, plan_version[p], meals_by_plan[p]) for u, p in sorted(plan_by_user.items())]
+
+
+def prefetch_ingredients(conn, meal_ids: List[str]) -> Dict[str, list]:
+    """meal_id -> parsed ingredients list, for the union of meals across all jobs."""
+    out: Dict[str, list] = {}
+    for part in chunked(meal_ids, MAX_VARS):
+        for mid, ing_json in conn.execute(
+            sa.text("SELECT id, ingredients_json FROM meals WHERE id IN :ids").bindparams(db.in_list("ids")),
+            {"ids": part},
+        ):
+            try:
+                out[str(mid)] = json.loads(ing_json) if ing_json else []
+            except Exception as e:
+                print(f"⚠️ Bad ingredients_json for meal {mid}: {e}")
+                out[str(mid)] = []
+    return out
+
+
+# ---------- worker side ----------
+_ING_BY_MEAL: Dict[str, list] = {}
+_PACKS = None
+
+
+def _init_worker(ing_by_meal: Dict[str, list], packs) -> None:
+    global _ING_BY_MEAL, _PACKS
+    _ING_BY_MEAL = ing_by_meal
+    _PACKS = packs
+
+
+def _build_chunk(jobs: List[Job], week_start: dt.date, version: int) -> List[dict]:
+    out = []
+    for user_id, plan_id, plan_version, meal_ids in jobs:
+        rows = [(m, _ING_BY_MEAL[m]) for m in meal_ids if m in _ING_BY_MEAL]
+        basket = basket_from_rows(rows, packs=_PACKS)
+        basket.update(source_plan_id=plan_id, source_plan_version=plan_version, catalog_version=version)
+        out.append(basket_row(user_id, week_start, basket))
+    return out
+
+
+# ---------- driver ----------
+def run(db_url: str, week_start: dt.date, workers: int, batch_size: int, resume: bool) -> int:
+    engine = db.make_engine(db_url)
+    try:
+        t0 = time.perf_counter()
+        with engine.begin() as conn:
+            migrations.upgrade(conn)     # baskets.plan_version / catalog_version
+        with engine.connect() as conn:
+            version = catalog_version(conn)
+            jobs = find_jobs(conn, week_start, resume, version)
+            total = len(jobs)
+            print(f"🗓️  week_start={week_start}  users to build={total}  (resume={resume})")
+            if not total:
+                return 0
+
+            union = sorted({m for _, _, _, mids in jobs for m in mids})
+            ing_by_meal = prefetch_ingredients(conn, union)
+            packs = load_pack_catalog(conn)
+        print(f"📥 Prefetched ingredients for {len(ing_by_meal)}/{len(union)} meals "
+              f"in {time.perf_counter() - t0:.2f}s")
+
+        pending: List[dict] = []
+        written = 0
+
+        def flush():
+            nonlocal pending, written
+            with engine.begin() as conn:
+                save_baskets(conn, pending)
+            written += len(pending)
+            pending = []
+            elapsed = time.perf_counter() - t0
+            rate = written / elapsed if elapsed else 0.0
+            eta = (total - written) / rate if rate else 0.0
+            print(f"   • {written}/{total} baskets saved  ({rate:.0f}/s, eta {eta:.0f}s)")
+
+        chunks = list(chunked(jobs, CHUNK_USERS))
+        if workers <= 1:
+            _init_worker(ing_by_meal, packs)
+            for ch in chunks:
+                pending.extend(_build_chunk(ch, week_start, version))
+                if len(pending) >= batch_size:
+                    flush()
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(ing_by_meal, packs)) as pool:
+                futures = [pool.submit(_build_chunk, ch, week_start, version) for ch in chunks]
+                for fut in as_completed(futures):
+                    pending.extend(fut.result())
+                    if len(pending) >= batch_size:
+                        flush()
+        if pending:
+            flush()
+
+        print(f"✅ Done. {written} baskets in {time.perf_counter() - t0:.2f}s")
+        return written
+    finally:
+        engine.dispose()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Precompute weekly baskets for all users into `baskets`.")
+    ap.add_argument("--db", help="Path to a SQLite DB (default: $DATABASE_URL, else $DB_PATH)")
+    ap.add_argument("--week-start", help="Sunday YYYY-MM-DD (default: the upcoming Sunday)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (1 = inline)")
+    ap.add_argument("--batch-size", type=int, default=1000, help="Baskets per write transaction")
+    ap.add_argument("--resume", action="store_true", help="Skip users whose stored basket for the week is still current")
+    args = ap.parse_args()
+
+    if args.db and not os.path.exists(args.db):
+        print(f"❌ DB not found: {args.db}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.week_start:
+        ws = dt.datetime.strptime(args.week_start, "%Y-%m-%d").date()
+    else:
+        ws = sunday_of_week(dt.date.today()) + dt.timedelta(days=7)
+
+    run(db.database_url(args.db), ws, max(1, args.workers), max(1, args.batch_size), args.resume)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Offline catalog bundle: the whole recipe catalog as one versioned, gzipped
+SQLite file, so a fresh install downloads once instead of paging /v1/recipes and
+fetching images one by one.
+
+The bundle is versioned by catalog_version() (MAX(meal_changes.seq)), and its
+meta table carries the matching /v1/recipes/changes token, so the app catches up
+with a delta sync from exactly where the bundle stops. Tables inside:
+
+  meta(key, value)                        format, version, sync_token, built_at, counts
+  recipes(id, json, title, calories, protein_g, time_minutes)
+                                          json = the API's RecipeOut, pre-serialised;
+                                          the other columns are indexed for the app's sorts
+  terms(term, recipe_id)                  search index: title/tag/cuisine/ingredient words
+  facets(facet, value, recipe_id)         tag / cuisine / diet / meal_type / difficulty / allergen
+  facet_counts(facet, value, n)
+  thumbnails(recipe_id, mime, data)       small JPEGs (needs Pillow + local images; else empty)
+
+Files are written to BUNDLE_DIR as catalog-v{version}.sqlite.gz plus a
+catalog-v{version}.json manifest (written last, so a manifest means the bundle
+is complete). Older bundles beyond KEEP are pruned. The API serves them at
+/v1/catalog/bundle with ETag, 304 and Range; see main.py.
+
+Usage:
+  python catalog_bundle.py                          # build for $DATABASE_URL / $DB_PATH
+  python catalog_bundle.py --db data/scranly.db --images data/scran_images
+"""
+
+import argparse, datetime as dt, gzip, hashlib, io, json, os, re, shutil, sqlite3, sys, tempfile, threading, time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+import sqlalchemy as sa
+
+from catalog_changes import catalog_version, make_token
+from catalog_matcher import normalise_ingredient
+
+try:
+    from PIL import Image
+except ImportError:   # optional: bundles are built without thumbnails
+    Image = None
+
+FORMAT = 1
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+BUNDLE_DIR = os.getenv("CATALOG_BUNDLE_DIR", os.path.join(API_DIR, "data", "bundles"))
+IMAGES_DIR = os.getenv("CATALOG_IMAGES_DIR", os.path.join(API_DIR, "data", "scran_images"))
+KEEP = 3
+THUMB_PX = 256
+THUMB_QUALITY = 70
+FACETS = ("tags", "cuisine", "diet", "meal_type", "difficulty", "allergens")
+MEDIA_TYPE = "application/gzip"
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID;
+CREATE TABLE recipes (
+    id           TEXT PRIMARY KEY,
+    json         TEXT NOT NULL,
+    title        TEXT NOT NULL,
+    calories     INTEGER NOT NULL,
+    protein_g    INTEGER NOT NULL,
+    time_minutes INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE terms (term TEXT NOT NULL, recipe_id TEXT NOT NULL, PRIMARY KEY (term, recipe_id)) WITHOUT ROWID;
+CREATE TABLE facets (
+    facet TEXT NOT NULL, value TEXT NOT NULL, recipe_id TEXT NOT NULL,
+    PRIMARY KEY (facet, value, recipe_id)
+) WITHOUT ROWID;
+CREATE TABLE facet_counts (facet TEXT NOT NULL, value TEXT NOT NULL, n INTEGER NOT NULL,
+                           PRIMARY KEY (facet, value)) WITHOUT ROWID;
+CREATE TABLE thumbnails (recipe_id TEXT PRIMARY KEY, mime TEXT NOT NULL, data BLOB NOT NULL) WITHOUT ROWID;
+CREATE INDEX idx_recipes_title ON recipes(title);
+CREATE INDEX idx_recipes_protein ON recipes(protein_g DESC);
+CREATE INDEX idx_recipes_time ON recipes(time_minutes);
+"""
+
+WORD = re.compile(r"[a-z0-9]+")
+
+
+def _words(*texts: Optional[str]) -> Iterable[str]:
+    for t in texts:
+        for w in WORD.findall((t or "").lower()):
+            if len(w) >= 2:
+                yield w
+
+
+def _ingredient_names(raw: Any) -> List[str]:
+    try:
+        blob = json.loads(raw) if isinstance(raw, (str, bytes)) else (raw or [])
+    except Exception:
+        return []
+    items = blob.get("items", []) if isinstance(blob, dict) else blob
+    return [normalise_ingredient(str(it["ingredient"])) for it in items or []
+            if isinstance(it, dict) and it.get("ingredient")]
+
+
+def _thumbnail(image_path: Optional[str], images_dir: Optional[str]) -> Optional[bytes]:
+    if Image is None or not image_path or not images_dir:
+        return None
+    src = os.path.join(images_dir, os.path.basename(urlparse(str(image_path)).path))
+    if not os.path.isfile(src):
+        return None
+    with Image.open(src) as im:
+        im = im.convert("RGB")
+        im.thumbnail((THUMB_PX, THUMB_PX))
+        out = io.BytesIO()
+        im.save(out, "JPEG", quality=THUMB_QUALITY, optimize=True)
+        return out.getvalue()
+
+
+def write_sqlite(path: str, version: int, recipes: List[Dict[str, Any]], rows: List[Any],
+                 images_dir: Optional[str]) -> Dict[str, int]:
+    """
+    recipes[i] is the serialised RecipeOut for the meals row rows[i]. The bundle
+    itself is always a plain SQLite file (the app opens it as-is), whichever
+    backend the catalog was read from, so this writes it with sqlite3 directly.
+    """
+    out = sqlite3.connect(path)
+    try:
+        out.execute("PRAGMA page_size = 4096")
+        out.executescript(SCHEMA)
+        counts: Dict[tuple, int] = {}
+        thumbs = 0
+        with out:
+            for rec, row in zip(recipes, rows):
+                rid = rec["id"]
+                out.execute("INSERT INTO recipes VALUES (?,?,?,?,?,?)", (
+                    rid, json.dumps(rec, separators=(",", ":"), ensure_ascii=False), rec["title"],
+                    rec["calories"], rec["protein_g"], rec["time_minutes"],
+                ))
+                terms = set(_words(rec["title"], rec.get("cuisine"), rec.get("sub_cuisine"), rec.get("diet"),
+                                   rec.get("meal_type"), *rec.get("tags", [])))
+                terms.update(w for name in _ingredient_names(row.get("ingredients_json")) for w in _words(name))
+                out.executemany("INSERT INTO terms VALUES (?,?)", [(t, rid) for t in sorted(terms)])
+                for facet in FACETS:
+                    vals = rec.get(facet)
+                    vals = vals if isinstance(vals, list) else ([vals] if vals else [])
+                    for v in {str(v).strip().lower() for v in vals if str(v).strip()}:
+                        out.execute("INSERT INTO facets VALUES (?,?,?)", (facet, v, rid))
+                        counts[(facet, v)] = counts.get((facet, v), 0) + 1
+                thumb = _thumbnail(row.get("image_path"), images_dir)
+                if thumb:
+                    out.execute("INSERT INTO thumbnails VALUES (?,?,?)", (rid, "image/jpeg", thumb))
+                    thumbs += 1
+            out.executemany("INSERT INTO facet_counts VALUES (?,?,?)", [(f, v, n) for (f, v), n in counts.items()])
+            meta = {
+                "format": FORMAT, "version": version, "sync_token": make_token(version),
+                "built_at": dt.datetime.now(dt.timezone.utc).replace(microsecond=0).isoformat(),
+                "recipes": len(recipes), "thumbnails": thumbs,
+            }
+            out.executemany("INSERT INTO meta VALUES (?,?)", [(k, str(v)) for k, v in meta.items()])
+        out.execute("VACUUM")
+        return {"recipes": len(recipes), "thumbnails": thumbs}
+    finally:
+        out.close()
+
+
+class BundleStore:
+    """Built bundles in one directory; latest() is cached until the next build."""
+
+    def __init__(self, directory: str = BUNDLE_DIR, keep: int = KEEP):
+        self.dir = directory
+        self.keep = keep
+        self._latest: Optional[dict] = None
+        self._lock = threading.Lock()
+
+    def _manifests(self) -> List[dict]:
+        if not os.path.isdir(self.dir):
+            return []
+        out = []
+        for name in os.listdir(self.dir):
+            if name.startswith("catalog-v") and name.endswith(".json"):
+                try:
+                    with open(os.path.join(self.dir, name)) as f:
+                        out.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return sorted(out, key=lambda m: m["version"])
+
+    def latest(self) -> Optional[dict]:
+        with self._lock:
+            if self._latest is None:
+                ms = self._manifests()
+                self._latest = ms[-1] if ms else None
+            return self._latest
+
+    def get(self, version: int) -> Optional[dict]:
+        m = self.latest()
+        if m is not None and m["version"] == version:
+            return m
+        return next((m for m in self._manifests() if m["version"] == version), None)
+
+    def path(self, manifest: dict) -> str:
+        return os.path.join(self.dir, manifest["file"])
+
+    def build(self, conn, serialise: Callable[[Any], Dict[str, Any]],
+              images_dir: Optional[str] = IMAGES_DIR) -> dict:
+        """Bundle the catalog as of this transaction. `serialise` maps a meals row to RecipeOut's dict."""
+        t0 = time.perf_counter()
+        version = catalog_version(conn)
+        rows = conn.execute(sa.text("SELECT * FROM meals ORDER BY id")).mappings().all()
+        recipes = [serialise(r) for r in rows]
+
+        os.makedirs(self.dir, exist_ok=True)
+        name = f"catalog-v{version}.sqlite.gz"
+        tmp_dir = tempfile.mkdtemp(prefix=".bundle-", dir=self.dir)
+        try:
+            raw = os.path.join(tmp_dir, "catalog.sqlite")
+            counts = write_sqlite(raw, version, recipes, rows, images_dir)
+            gz = os.path.join(tmp_dir, name)
+            sha = hashlib.sha256()
+            with open(raw, "rb") as src, open(gz, "wb") as dst:
+                with gzip.GzipFile(filename="catalog.sqlite", mode="wb", compresslevel=9, fileobj=dst, mtime=0) as z:
+                    for chunk in iter(lambda: src.read(1 << 20), b""):
+                        z.write(chunk)
+            with open(gz, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    sha.update(chunk)
+            manifest = {
+                "format": FORMAT, "version": version, "file": name, "bytes": os.path.getsize(gz),
+                "raw_bytes": os.path.getsize(raw), "sha256": sha.hexdigest(),
+                "etag": f'"cb{version}-{sha.hexdigest()[:16]}"', "sync_token": make_token(version),
+                "built_at": dt.datetime.now(dt.timezone.utc).replace(microsecond=0).isoformat(), **counts,
+            }
+            os.replace(gz, os.path.join(self.dir, name))
+            mtmp = os.path.join(tmp_dir, "manifest.json")
+            with open(mtmp, "w") as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(mtmp, os.path.join(self.dir, f"catalog-v{version}.json"))
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        with self._lock:
+            self._latest = None
+        self._prune()
+        print(f"📦 catalog bundle v{version}: {manifest['recipes']} recipes, {manifest['thumbnails']} thumbnails, "
+              f"{manifest['raw_bytes'] / 1e6:.2f}MB → {manifest['bytes'] / 1e6:.2f}MB "
+              f"in {time.perf_counter() - t0:.2f}s")
+        return manifest
+
+    def _prune(self) -> None:
+        for m in self._manifests()[:-self.keep]:
+            for name in (m["file"], f"catalog-v{m['version']}.json"):
+                try:
+                    os.remove(os.path.join(self.dir, name))
+                except FileNotFoundError:
+                    pass
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build the offline catalog bundle.")
+    ap.add_argument("--db", help="Path to a SQLite DB (default: $DATABASE_URL, else $DB_PATH)")
+    ap.add_argument("--out", default=BUNDLE_DIR, help="Bundle directory (default: $CATALOG_BUNDLE_DIR)")
+    ap.add_argument("--images", default=IMAGES_DIR, help="Local recipe images for thumbnails")
+    args = ap.parse_args()
+
+    if args.db:
+        if not os.path.exists(args.db):
+            print(f"❌ DB not found: {args.db}", file=sys.stderr)
+            sys.exit(1)
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(args.db)}"
+    if Image is None:
+        print("ℹ️ Pillow not installed: building without thumbnails")
+    # the API's own serialiser, so the bundle decodes with the app's RecipeOut model
+    from main import engine, row_to_recipe
+    with engine.begin() as conn:
+        BundleStore(args.out).build(conn, lambda r: row_to_recipe(r).model_dump(), args.images)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# catalog_changes.py
+"""
+Change log for the `meals` catalog, for delta sync.
+
+Triggers on meals append one row per insert/update/delete to `meal_changes`
+(seq is AUTOINCREMENT, so it only ever goes up). A client keeps the token from
+its last sync; changes_since() returns each meal touched after it once, with
+its latest op, in seq order, a page at a time.
+
+MAX(seq) doubles as the catalog version for caches that need to know whether
+the catalog moved; CatalogCache wraps that check for process-wide derived data.
+The table and its triggers (one plpgsql trigger function on Postgres) are
+created by migrations.py (0004); since 0009 an UPDATE is logged only when one of
+migrations.CATALOG_COLUMNS changed, so embeddings/content_hash writes are silent.
+"""
+
+import os, threading, time
+from typing import Callable, Generic, List, Optional, Tuple, TypeVar
+
+import sqlalchemy as sa
+
+TOKEN_PREFIX = "c1."
+RECHECK_S = float(os.getenv("CATALOG_RECHECK_S", "5"))
+
+T = TypeVar("T")
+
+class BadToken(ValueError):
+    pass
+
+
+def catalog_version(conn) -> int:
+    return int(conn.execute(sa.text("SELECT COALESCE(MAX(seq), 0) FROM meal_changes")).scalar_one())
+
+
+def make_token(seq: int) -> str:
+    return f"{TOKEN_PREFIX}{int(seq)}"
+
+
+def parse_token(token: Optional[str]) -> int:
+    """None/"" → 0 (full sync)."""
+    if not token:
+        return 0
+    if not token.startswith(TOKEN_PREFIX) or not token[len(TOKEN_PREFIX):].isdigit():
+        raise BadToken(f"bad sync token {token!r}")
+    return int(token[len(TOKEN_PREFIX):])
+
+
+def changes_since(conn, since: int, limit: int) -> Tuple[List[str], List[str], int, bool]:
+    """
+    → (upserted ids, deleted ids, last seq in page, has_more).
+    Each meal appears once, with its newest op; pages are ordered by that op's seq.
+    """
+    rows = conn.execute(sa.text("""
+        SELECT meal_id, op, seq
+        FROM meal_changes c
+        WHERE seq > :since
+          AND seq = (SELECT MAX(seq) FROM meal_changes WHERE meal_id = c.meal_id)
+        ORDER BY seq
+        LIMIT :lim
+    """), {"since": since, "lim": limit + 1}).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    upserted = [str(r[0]) for r in rows if r[1] == "upsert"]
+    deleted = [str(r[0]) for r in rows if r[1] == "delete"]
+    last = int(rows[-1][2]) if rows else max(since, catalog_version(conn))
+    return upserted, deleted, last, has_more
+
+
+def compact(conn) -> int:
+    """Drop rows superseded by a newer change to the same meal; sync results are unchanged."""
+    return conn.execute(sa.text("""
+        DELETE FROM meal_changes
+        WHERE seq NOT IN (SELECT MAX(seq) FROM meal_changes GROUP BY meal_id)
+    """)).rowcount
+
+
+class CatalogCache(Generic[T]):
+    """
+    One process-wide value derived from `meals` (feature matrix, suggest index…),
+    tagged with the catalog_version() it was loaded at and reloaded once the
+    version moves. The version is read at most every `recheck_s`; while one
+    request reloads, the others keep getting the previous value (only the very
+    first load blocks).
+    """
+
+    def __init__(self, name: str, load: Callable[..., T], recheck_s: float = RECHECK_S):
+        self.name = name
+        self.load = load            # load(conn) -> value
+        self.recheck_s = recheck_s
+        self.lock = threading.Lock()
+        self.value: Optional[T] = None
+        self.version = -1
+        self.checked = 0.0
+
+    def get(self, engine) -> T:
+        value = self.value
+        if value is not None and time.monotonic() - self.checked < self.recheck_s:
+            return value
+        if not self.lock.acquire(blocking=value is None):
+            return value
+        try:
+            if self.value is not None and time.monotonic() - self.checked < self.recheck_s:
+                return self.value
+            with engine.begin() as conn:
+                version = catalog_version(conn)
+                if self.value is None or version != self.version:
+                    t0 = time.perf_counter()
+                    self.value, self.version = self.load(conn), version
+                    print(f"🔄 Loaded {self.name} at catalog v{version} in {time.perf_counter() - t0:.2f}s")
+            self.checked = time.monotonic()
+            return self.value
+        finally:
+            self.lock.release()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Resolves free-text ingredient strings ("2 tablespoons olive oil", "roasted red peppers")
+to `catalog_items` rows and persists the result into `ingredient_catalog_map`.
+
+- normalise_ingredient(): strips quantities/units/prep words → the map's key
+- CatalogMatcher: character-trigram inverted index over catalog names + SYNONYMS,
+  scored with Dice overlap and a head-noun bonus (withheld when a modifier
+  makes it another product: "almond milk" is not Milk); memoised per normalised key
+- run(): streams every meal's ingredients_json/price_json, matches each distinct
+  key once and upserts (ingredient, catalog_id, confidence) in one transaction;
+  with --overwrite, stored keys that no longer match are dropped
+
+Usage:
+  python catalog_matcher.py
+  python catalog_matcher.py --min-confidence 0.7 --overwrite
+  python catalog_matcher.py --dry-run
+"""
+
+import argparse, json, os, re, sys, time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import sqlalchemy as sa
+
+import db
+import migrations
+
+MIN_CONFIDENCE = 0.65
+
+# alias → catalog_items.name (case-insensitive); indexed alongside the real names
+SYNONYMS = {
+    "chicken breasts": "Chicken breast",
+    "salmon": "Salmon fillets",
+    "jasmine rice": "Rice",
+    "basmati rice": "Rice",
+    "rice noodles": "Noodles",
+    "egg": "Eggs",
+    "tortillas": "Wraps",
+    "pita pockets": "Wraps",
+    "yogurt": "Greek yogurt",
+    "plain yogurt": "Greek yogurt",
+    "tomato": "Tomatoes",
+    "cherry tomatoes": "Tomatoes",
+    "scallions": "Spring onions",
+    "green onions": "Spring onions",
+    "yellow onion": "Onion",
+    "red onion": "Onion",
+    "garlic cloves": "Garlic",
+    "carrot": "Carrots",
+    "mixed vegetables": "Mixed veg",
+    "tamari": "Soy sauce",
+    "tamari sauce": "Soy sauce",
+    "red curry paste": "Curry paste",
+    "tomato passata": "Passata",
+}
+
+_UNITS = (
+    r"g|grams?|kg|kilograms?|mg|ml|millilit(?:er|re)s?|l|lit(?:er|re)s?|oz|ounces?|lbs?|pounds?|"
+    r"tbsp|tablespoons?|tsp|teaspoons?|cups?|cloves?|cans?|tins?|jars?|packs?|packets?|"
+    r"pinch(?:es)?|dash(?:es)?|handfuls?|bunch(?:es)?|heads?|stalks?|sprigs?|slices?|pieces?|"
+    r"fillets?|squeeze|small|medium|large|x"
+)
+_QTY_RE = re.compile(rf"^(?:[\d½¼¾⅓⅔/.\-]+\s*(?:{_UNITS})?\b\.?\s*)+", re.I)
+_LEAD_UNIT_RE = re.compile(rf"^(?:(?:{_UNITS})\b\.?\s*(?:of\s+)?)+", re.I)
+_PAREN_RE = re.compile(r"\([^)]*\)")
+_PREP_WORDS = {
+    "fresh", "freshly", "chopped", "diced", "minced", "sliced", "grated", "crushed", "ground",
+    "dried", "toasted", "roasted", "cooked", "finely", "roughly", "thinly", "large", "small",
+    "medium", "ripe", "optional", "to", "taste", "for", "serving", "garnish", "of", "a",
+}
+
+
+# modifiers that turn the head noun into a different product ("oat milk", "zucchini noodle",
+# "peanut butter", "sweet potato"): no head-noun bonus for these, whatever the trigrams say
+OTHER_PRODUCT = {
+    "almond", "oat", "soy", "soya", "coconut", "rice", "cashew", "hazelnut", "peanut", "hemp",
+    "zucchini", "courgette", "cauliflower", "broccoli", "konjac", "vegan", "plant", "sweet",
+}
+
+
+def _singular(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("oes", "shes", "ches")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def normalise_ingredient(raw: str) -> str:
+    """
+    "2 tablespoons olive oil" → "olive oil", "1 can (400 g) Chickpeas, drained" → "chickpea".
+    This is the key format stored in ingredient_catalog_map.ingredient.
+    """
+    s = (raw or "").lower().strip()
+    s = s.split("|")[0]            # price_json lines carry "| hints: ~240 g, ~240 ml"
+    s = _PAREN_RE.sub(" ", s)
+    s = s.split(",")[0]
+    s = _QTY_RE.sub("", s)
+    s = _LEAD_UNIT_RE.sub("", s)
+    words = [w for w in re.findall(r"[a-zà-ÿ]+(?:-[a-zà-ÿ]+)*", s) if w not in _PREP_WORDS]
+    return " ".join(_singular(w) for w in words)
+
+
+def trigrams(text: str) -> set:
+    t = f"  {text} "
+    return {t[i:i + 3] for i in range(len(t) - 2)}
+
+
+class CatalogMatcher:
+    """
+    Trigram inverted index over catalog names and synonyms.
+    match() touches only the postings of the query's trigrams rather than every
+    item, but common trigrams' postings grow with the catalog, so a lookup still
+    gets slower as it grows (sublinearly in practice; results are memoised).
+    """
+
+    def __init__(self, items: Iterable[Tuple[int, str]], synonyms: Optional[Dict[str, str]] = None):
+        self.names: Dict[int, str] = {}
+        self._docs: List[Tuple[int, str, frozenset, int]] = []  # (catalog_id, text, words, n_grams)
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        self._memo: Dict[str, Tuple[Optional[int], float]] = {}
+
+        by_name: Dict[str, int] = {}
+        for cid, name in items:
+            self.names[int(cid)] = name
+            by_name[name.lower()] = int(cid)
+            self._add(int(cid), name)
+        for alias, target in (synonyms if synonyms is not None else SYNONYMS).items():
+            cid = by_name.get(target.lower())
+            if cid is not None:
+                self._add(cid, alias)
+
+    def _add(self, cid: int, text: str) -> None:
+        norm = normalise_ingredient(text)
+        if not norm:
+            return
+        grams = trigrams(norm)
+        doc = len(self._docs)
+        self._docs.append((cid, norm, frozenset(norm.split()), len(grams)))
+        for g in grams:
+            self._postings[g].append(doc)
+
+    def match(self, raw: str) -> Tuple[Optional[int], float]:
+        """Best (catalog_id, confidence in 0..1) for a raw or normalised ingredient string."""
+        key = normalise_ingredient(raw)
+        hit = self._memo.get(key)
+        if hit is not None:
+            return hit
+        result = self._score(key)
+        self._memo[key] = result
+        return result
+
+    def _score(self, key: str) -> Tuple[Optional[int], float]:
+        if not key:
+            return None, 0.0
+        q = trigrams(key)
+        shared: Dict[int, int] = defaultdict(int)
+        for g in q:
+            for doc in self._postings.get(g, ()):
+                shared[doc] += 1
+
+        words = frozenset(key.split())
+        head = key.split()[-1]
+        best_cid, best = None, 0.0
+        for doc, n in shared.items():
+            cid, text, doc_words, n_doc = self._docs[doc]
+            if text == key:
+                return cid, 1.0
+            score = 2.0 * n / (len(q) + n_doc)
+            # "red onion" ⊇ "onion": every catalog word present, the head noun agrees
+            # and no extra word makes it something else
+            if doc_words <= words and head in doc_words and not (words - doc_words) & OTHER_PRODUCT:
+                score = min(1.0, score + 0.25)
+            else:
+                score *= 0.8
+            if score > best:
+                best_cid, best = cid, score
+        return best_cid, round(best, 3)
+
+
+def load_matcher(conn) -> CatalogMatcher:
+    return CatalogMatcher(conn.execute(sa.text("SELECT id, name FROM catalog_items")).all())
+
+
+def iter_ingredient_strings(conn) -> Iterable[str]:
+    """Streams every ingredient string from meals.ingredients_json and price_json."""
+    rows = conn.execution_options(stream_results=True).execute(
+        sa.text("SELECT ingredients_json, price_json FROM meals"))
+    for ing_json, price_json in rows:
+        for raw, field in ((ing_json, "ingredient"), (price_json, "ingredient")):
+            if not raw:
+                continue
+            try:
+                blob = json.loads(raw)
+            except Exception:
+                continue
+            lines = blob.get("items", []) if isinstance(blob, dict) else blob
+            for it in lines or []:
+                if isinstance(it, dict) and it.get(field):
+                    yield str(it[field])
+
+
+def run(db_url: str, min_confidence: float = MIN_CONFIDENCE, overwrite: bool = False,
+        dry_run: bool = False) -> Dict[str, Tuple[int, float]]:
+    """key → (catalog_id, confidence) for each newly matched ingredient; upserted unless dry_run."""
+    if not dry_run:
+        migrations.migrate(db_url)   # ingredient_catalog_map.confidence
+    engine = db.make_engine(db_url)
+    try:
+        t0 = time.perf_counter()
+        with engine.connect() as conn:
+            matcher = load_matcher(conn)
+            existing = {k for (k,) in conn.execute(sa.text("SELECT ingredient FROM ingredient_catalog_map"))}
+
+            seen = 0
+            rows: Dict[str, Tuple[int, float]] = {}
+            missed = set()
+            for raw in iter_ingredient_strings(conn):
+                seen += 1
+                key = normalise_ingredient(raw)
+                if not key or key in rows or key in missed or (key in existing and not overwrite):
+                    continue
+                cid, conf = matcher.match(key)
+                if cid is None or conf < min_confidence:
+                    missed.add(key)
+                    continue
+                rows[key] = (cid, conf)
+                if dry_run:
+                    print(f"   • {key!r} → {matcher.names[cid]} ({conf:.2f})")
+
+        # --overwrite re-scores stored keys too; one that no longer clears the bar is dropped
+        stale = sorted(missed & existing) if overwrite else []
+        print(f"🔎 {seen} ingredient strings, {len(matcher._memo)} distinct keys, "
+              f"{len(rows)} matched, {len(missed)} below {min_confidence} "
+              f"in {time.perf_counter() - t0:.2f}s")
+        for key in stale:
+            print(f"   • {key!r} no longer matches; {'would drop' if dry_run else 'dropping'} its map row")
+
+        if not dry_run and (rows or stale):
+            with engine.begin() as conn:
+                db.upsert(conn, "ingredient_catalog_map",
+                          [{"ingredient": k, "catalog_id": cid, "confidence": conf} for k, (cid, conf) in rows.items()],
+                          key=("ingredient",))
+                if stale:
+                    conn.execute(sa.text("DELETE FROM ingredient_catalog_map WHERE ingredient IN :keys")
+                                 .bindparams(db.in_list("keys")), {"keys": stale})
+            print(f"💾 Upserted {len(rows)} rows into ingredient_catalog_map, dropped {len(stale)}")
+        return rows
+    finally:
+        engine.dispose()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Match ingredient strings to catalog_items → ingredient_catalog_map.")
+    ap.add_argument("--db", help="Path to a SQLite DB (default: $DATABASE_URL, else $DB_PATH)")
+    ap.add_argument("--min-confidence", type=float, default=MIN_CONFIDENCE, help="Skip matches below this score")
+    ap.add_argument("--overwrite", action="store_true", help="Replace existing map rows (default: keep them)")
+    ap.add_argument("--dry-run", action="store_true", help="Print matches; no DB writes")
+    args = ap.parse_args()
+
+    if args.db and not os.path.exists(args.db):
+        print(f"❌ DB not found: {args.db}", file=sys.stderr)
+        sys.exit(1)
+
+    run(db.database_url(args.db), args.min_confidence, args.overwrite, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
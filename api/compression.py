@@ -0,0 +1,196 @@
+# compression.py
+"""
+Accept-Encoding negotiated response compression with a cache of compressed bodies.
+
+CompressionMiddleware (pure ASGI) buffers JSON/text responses, gives every 200
+GET an ETag (the route's own, or a blake2b of the body), answers If-None-Match
+with 304, and compresses bodies over `minimum_size` with the best encoding the
+client accepts: zstd, then br, then gzip. zstd/br are used only if the
+`zstandard` / `brotli` packages are installed.
+
+Compressed bytes are cached by (URL, ETag, encoding) in a byte-bounded LRU, so a
+stable payload (catalog page, expanded plan, stored basket) is compressed once
+per version; later requests only pay for hashing the body.
+"""
+
+import gzip, hashlib, threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import anyio
+
+try:
+    import brotli
+except ImportError:   # optional
+    brotli = None
+try:
+    import zstandard
+except ImportError:   # optional
+    zstandard = None
+
+MIN_SIZE = 1024
+CACHE_BYTES = 64 * 1024 * 1024
+COMPRESSIBLE = ("application/json", "text/")
+
+
+def _gzip(b: bytes) -> bytes:
+    return gzip.compress(b, compresslevel=6, mtime=0)
+
+
+CODECS: Dict[str, Callable[[bytes], bytes]] = {"gzip": _gzip}
+if brotli is not None:
+    CODECS["br"] = lambda b: brotli.compress(b, quality=6)
+if zstandard is not None:
+    _zstd = zstandard.ZstdCompressor(level=6)
+    CODECS["zstd"] = _zstd.compress
+
+PREFERENCE = [e for e in ("zstd", "br", "gzip") if e in CODECS]
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Best available encoding the client accepts (q > 0), or None."""
+    q: Dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        q[name.strip()] = weight
+    star = q.get("*", 0.0)
+    ranked = sorted(
+        (e for e in PREFERENCE if q.get(e, star) > 0),
+        key=lambda e: (-q.get(e, star), PREFERENCE.index(e)),
+    )
+    return ranked[0] if ranked else None
+
+
+class _LRU:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.data: "OrderedDict[Tuple[str, str, str], bytes]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "not_modified": 0,
+                      "bytes_in": 0, "bytes_out": 0}
+
+    def get(self, key):
+        with self.lock:
+            v = self.data.get(key)
+            if v is not None:
+                self.data.move_to_end(key)
+                self.stats["hits"] += 1
+            else:
+                self.stats["misses"] += 1
+            return v
+
+    def put(self, key, value: bytes) -> None:
+        if len(value) > self.max_bytes // 8:
+            return
+        with self.lock:
+            old = self.data.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.data[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, ev = self.data.popitem(last=False)
+                self.size -= len(ev)
+                self.stats["evictions"] += 1
+
+
+CACHE = _LRU(CACHE_BYTES)
+
+
+def compression_stats() -> dict:
+    with CACHE.lock:
+        return {**CACHE.stats, "entries": len(CACHE.data), "cached_bytes": CACHE.size,
+                "encodings": PREFERENCE}
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    tags = [t.strip() for t in if_none_match.split(",")]
+    bare = etag[2:] if etag.startswith("W/") else etag
+    return "*" in tags or any((t[2:] if t.startswith("W/") else t) == bare for t in tags)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+        req = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+        encoding = negotiate(req.get("accept-encoding", ""))
+        if_none_match = req.get("if-none-match")
+
+        start: Optional[dict] = None
+        chunks: List[bytes] = []
+        passthrough = False
+
+        async def wrapped_send(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                hdrs = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in message["headers"]}
+                ctype = hdrs.get("content-type", "")
+                passthrough = (
+                    message["status"] != 200
+                    or "content-encoding" in hdrs
+                    or "content-range" in hdrs
+                    or not ctype.startswith(COMPRESSIBLE)
+                )
+                if passthrough:
+                    await send(message)
+                else:
+                    start = message
+                return
+            if passthrough:
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                url = scope["path"] + "?" + scope.get("query_string", b"").decode("latin-1")
+                await self._finish(start, b"".join(chunks), url, encoding, if_none_match, send)
+
+        await self.app(scope, receive, wrapped_send)
+
+    async def _finish(self, start: dict, body: bytes, url: str, encoding: Optional[str],
+                      if_none_match: Optional[str], send) -> None:
+        headers = [(k, v) for k, v in start["headers"] if k.lower() not in (b"content-length",)]
+        etag = next((v.decode("latin-1") for k, v in headers if k.lower() == b"etag"), None)
+        if etag is None:
+            etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+            headers.append((b"etag", etag.encode("latin-1")))
+        headers.append((b"vary", b"Accept-Encoding"))
+
+        if if_none_match and _etag_matches(if_none_match, etag):
+            with CACHE.lock:
+                CACHE.stats["not_modified"] += 1
+            await send({"type": "http.response.start", "status": 304,
+                        "headers": [(k, v) for k, v in headers if k.lower() != b"content-type"]})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if encoding and len(body) >= self.minimum_size:
+            key = (url, etag, encoding)
+            out = CACHE.get(key)
+            if out is None:
+                out = await anyio.to_thread.run_sync(CODECS[encoding], body)
+                CACHE.put(key, out)
+            with CACHE.lock:
+                CACHE.stats["bytes_in"] += len(body)
+                CACHE.stats["bytes_out"] += len(out)
+            body = out
+            headers.append((b"content-encoding", encoding.encode("latin-1")))
+
+        headers.append((b"content-length", str(len(body)).encode("latin-1")))
+        await send({**start, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
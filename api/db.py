@@ -0,0 +1,148 @@
+# db.py
+"""
+One SQLAlchemy Core entry point for the API, the batch jobs and the scripts.
+
+DATABASE_URL picks the backend (e.g. postgresql+psycopg://scranly@db/scranly);
+without it we use the SQLite file at DB_PATH as before. Code that goes through
+here sticks to SQL both dialects accept (named :params, CAST(x AS TEXT),
+expanding IN lists) and uses the helpers below for the bits that differ:
+
+- upsert()             INSERT .. ON CONFLICT DO UPDATE via the dialect's insert()
+- insert_returning_id() instead of cursor.lastrowid (psycopg has none)
+- column_names()       instead of PRAGMA table_info
+
+Pooling: Postgres gets a QueuePool sized by DB_POOL_SIZE / DB_MAX_OVERFLOW
+with pre-ping, so several API instances can share one database. SQLite
+connections are pooled too, with WAL + a busy timeout set on each so readers
+don't block behind the single writer.
+"""
+
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import sqlalchemy as sa
+
+DB_PATH = os.getenv("DB_PATH", "/Users/lukeyp02/Desktop/scranly/api/data/scranly.db")
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+SQLITE_BUSY_MS = 5000
+
+
+def database_url(db_path: Optional[str] = None) -> str:
+    """An explicit SQLite path (a CLI's --db) wins; then $DATABASE_URL; then $DB_PATH."""
+    if db_path:
+        return f"sqlite:///{db_path}"
+    url = os.getenv("DATABASE_URL")
+    if url:
+        # Heroku-style and driverless URLs: we ship psycopg (3), not SQLAlchemy's default psycopg2
+        for prefix in ("postgres://", "postgresql://"):
+            if url.startswith(prefix):
+                return "postgresql+psycopg://" + url[len(prefix):]
+        return url
+    return f"sqlite:///{DB_PATH}"
+
+
+def make_engine(url: Optional[str] = None) -> sa.Engine:
+    url = url or database_url()
+    if url.startswith("sqlite"):
+        eng = sa.create_engine(
+            url,
+            connect_args={"check_same_thread": False},
+            pool_size=POOL_SIZE,
+            max_overflow=MAX_OVERFLOW,
+        )
+
+        @sa.event.listens_for(eng, "connect")
+        def _sqlite_pragmas(dbapi_conn, _record):
+            cur = dbapi_conn.cursor()
+            cur.execute("PRAGMA journal_mode=WAL")
+            cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_MS}")
+            cur.close()
+
+        return eng
+    return sa.create_engine(
+        url,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+    )
+
+
+_engine: Optional[sa.Engine] = None
+
+
+def get_engine() -> sa.Engine:
+    """The process-wide engine for the default URL (built on first use)."""
+    global _engine
+    if _engine is None:
+        _engine = make_engine()
+    return _engine
+
+
+def dialect(conn) -> str:
+    return conn.dialect.name
+
+
+def is_sqlite(conn) -> bool:
+    return conn.dialect.name == "sqlite"
+
+
+_tables: Dict[Tuple[str, str], sa.Table] = {}
+
+
+def table(conn, name: str) -> sa.Table:
+    """Reflected Table, cached per database."""
+    key = (str(conn.engine.url), name)
+    t = _tables.get(key)
+    if t is None:
+        t = _tables[key] = sa.Table(name, sa.MetaData(), autoload_with=conn)
+    return t
+
+
+def forget_tables() -> None:
+    """Drop reflected tables (after DDL changed a table's columns)."""
+    _tables.clear()
+
+
+def column_names(conn, name: str) -> set:
+    return {c["name"] for c in sa.inspect(conn).get_columns(name)}
+
+
+def _insert_for(conn):
+    name = conn.dialect.name
+    if name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"upsert not supported on {name}")
+    return insert
+
+
+def upsert(conn, name: str, rows: List[dict], key: Sequence[str],
+           update: Optional[Sequence[str]] = None) -> None:
+    """
+    Insert rows, or update `update` columns (default: every non-key column in the
+    rows) where `key` already exists. `key` must be a PK or UNIQUE constraint.
+    """
+    if not rows:
+        return
+    tbl = table(conn, name)
+    stmt = _insert_for(conn)(tbl)
+    cols = list(update) if update is not None else [c for c in rows[0] if c not in key]
+    if cols:
+        stmt = stmt.on_conflict_do_update(index_elements=list(key), set_={c: stmt.excluded[c] for c in cols})
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=list(key))
+    conn.execute(stmt, rows)
+
+
+def insert_returning_id(conn, name: str, values: dict, id_col: str = "id") -> int:
+    tbl = table(conn, name)
+    return int(conn.execute(sa.insert(tbl).values(**values).returning(tbl.c[id_col])).scalar_one())
+
+
+def in_list(name: str) -> sa.BindParameter:
+    """For sa.text(... IN :name).bindparams(in_list(name)); the list is expanded per dialect."""
+    return sa.bindparam(name, expanding=True)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Local recipe embeddings (no network model) + in-memory cosine search.
+
+Offline job (this script):
+  - features per meal: title words, tags, cuisine/sub_cuisine/diet/meal_type,
+    normalised ingredient names (each field prefixed, e.g. "ing:chickpea")
+  - TF-IDF weights over the whole catalog, hashed into DIM signed buckets
+  - L2-normalised float32 vectors stored as packed bytes in meals.embedding
+    (BLOB on SQLite, BYTEA on Postgres)
+
+API side:
+  - EmbeddingIndex holds every vector in one contiguous (n, DIM) float32 matrix,
+    so top-k neighbours are one matrix-vector product + argpartition.
+
+Usage:
+  python embeddings.py
+  python embeddings.py --db /path/to/scranly.db --dry-run
+"""
+
+import argparse, json, math, os, re, sys, time, zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import sqlalchemy as sa
+
+import db
+import migrations
+from catalog_matcher import normalise_ingredient
+
+DIM = 128   # 100k × 128 × 4 B = 51 MB → a matvec stays in single-digit ms
+DTYPE = np.float32
+
+# relative weight of each feature family before TF-IDF
+FIELD_WEIGHTS = {"t": 1.0, "tag": 1.5, "cui": 2.0, "sub": 1.0, "diet": 1.0, "type": 1.0, "ing": 1.0}
+
+_WORD_RE = re.compile(r"[a-z]+")
+_STOP = {"with", "and", "the", "a", "of", "in", "on", "for", "to"}
+
+
+def _listish(raw) -> List[str]:
+    if not raw:
+        return []
+    s = str(raw).strip()
+    if s.startswith("["):
+        try:
+            return [str(t).strip() for t in json.loads(s) if str(t).strip()]
+        except Exception:
+            # tags are sometimes stored as a Python repr: "['Spicy', 'Veg-forward']"
+            return [t.strip(" '\"") for t in s.strip("[]").split(",") if t.strip(" '\"")]
+    return [t.strip() for t in s.split(",") if t.strip()]
+
+
+def meal_features(row) -> Counter:
+    """row: mapping with title/tags/cuisine/sub_cuisine/diet/meal_type/ingredients_json."""
+    feats: Counter = Counter()
+    for w in _WORD_RE.findall(str(row["title"] or "").lower()):
+        if w not in _STOP:
+            feats[f"t:{w}"] += 1
+    for t in _listish(row["tags"]):
+        feats[f"tag:{t.lower()}"] += 1
+    for col, prefix in (("cuisine", "cui"), ("sub_cuisine", "sub"), ("diet", "diet"), ("meal_type", "type")):
+        v = str(row[col] or "").strip().lower()
+        if v:
+            feats[f"{prefix}:{v}"] += 1
+    try:
+        ings = json.loads(row["ingredients_json"]) if row["ingredients_json"] else []
+    except Exception:
+        ings = []
+    for ing in ings:
+        key = normalise_ingredient(str(ing.get("ingredient") or ing.get("name") or ""))
+        if key:
+            feats[f"ing:{key}"] += 1
+    return feats
+
+
+def _bucket(feature: str) -> Tuple[int, float]:
+    # crc32 is stable across processes (hash() is salted per interpreter)
+    h = zlib.crc32(feature.encode("utf-8"))
+    return h % DIM, (1.0 if (h >> 31) & 1 else -1.0)
+
+
+def compute_idf(docs: Iterable[Counter]) -> Dict[str, float]:
+    df: Counter = Counter()
+    n = 0
+    for feats in docs:
+        n += 1
+        df.update(feats.keys())
+    return {f: math.log((1 + n) / (1 + c)) + 1.0 for f, c in df.items()}
+
+
+def embed(feats: Counter, idf: Dict[str, float]) -> np.ndarray:
+    v = np.zeros(DIM, dtype=DTYPE)
+    for f, tf in feats.items():
+        i, sign = _bucket(f)
+        w = FIELD_WEIGHTS.get(f.split(":", 1)[0], 1.0)
+        v[i] += sign * w * (1.0 + math.log(tf)) * idf.get(f, 1.0)
+    norm = float(np.linalg.norm(v))
+    return v / norm if norm else v
+
+
+def to_blob(v: np.ndarray) -> bytes:
+    return np.asarray(v, dtype="<f4").tobytes()
+
+
+def from_blob(b) -> Optional[np.ndarray]:
+    if not isinstance(b, (bytes, bytearray, memoryview)) or len(b) != DIM * 4:
+        return None
+    return np.frombuffer(b, dtype="<f4")
+
+
+class EmbeddingIndex:
+    """All recipe vectors in one C-contiguous (n, DIM) float32 matrix."""
+
+    def __init__(self, ids: List[str], matrix: np.ndarray):
+        self.ids = ids
+        self.row_of = {mid: i for i, mid in enumerate(ids)}
+        self.matrix = np.ascontiguousarray(matrix, dtype=DTYPE)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[str, bytes]]) -> "EmbeddingIndex":
+        ids, vecs = [], []
+        for mid, blob in rows:
+            v = from_blob(blob)
+            if v is not None:
+                ids.append(str(mid))
+                vecs.append(v)
+        matrix = np.vstack(vecs) if vecs else np.zeros((0, DIM), dtype=DTYPE)
+        return cls(ids, matrix)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def similar(self, meal_id: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Top-k (meal_id, cosine) neighbours of meal_id, best first; [] if unknown."""
+        i = self.row_of.get(str(meal_id))
+        if i is None or len(self.ids) < 2:
+            return []
+        scores = self.matrix @ self.matrix[i]       # rows are unit length → cosine
+        scores[i] = -np.inf                          # never return the query itself
+        k = min(k, len(self.ids) - 1)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[j], float(scores[j])) for j in top]
+
+
+SELECT_EMBEDDINGS = "SELECT id, embedding FROM meals WHERE embedding IS NOT NULL AND length(embedding) > 0"
+
+
+def run(db_url: str, dry_run: bool) -> int:
+    """Embed every meal; returns how many."""
+    engine = db.make_engine(db_url)
+    try:
+        with engine.begin() as conn:
+            if not dry_run:
+                migrations.upgrade(conn)     # meals.embedding as BYTEA on Postgres
+            t0 = time.perf_counter()
+            rows = conn.execute(sa.text("""
+                SELECT CAST(id AS TEXT) AS id, title, tags, cuisine, sub_cuisine, diet, meal_type, ingredients_json
+                FROM meals
+            """)).mappings().all()
+            feats = [(r["id"], meal_features(r)) for r in rows]
+            idf = compute_idf(f for _, f in feats)
+            out = [{"e": to_blob(embed(f, idf)), "id": mid} for mid, f in feats]
+            print(f"🧮 Embedded {len(out)} meals (dim={DIM}, features={len(idf)}) "
+                  f"in {time.perf_counter() - t0:.2f}s")
+
+            if not dry_run and out:
+                conn.execute(sa.text("UPDATE meals SET embedding = :e WHERE id = :id"), out)
+                print(f"💾 Wrote {len(out)} embeddings to meals.embedding")
+        return len(out)
+    finally:
+        engine.dispose()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compute hashed TF-IDF embeddings into meals.embedding.")
+    ap.add_argument("--db", help="Path to a SQLite DB (default: $DATABASE_URL, else $DB_PATH)")
+    ap.add_argument("--dry-run", action="store_true", help="Compute only; no DB writes")
+    args = ap.parse_args()
+
+    if args.db and not os.path.exists(args.db):
+        print(f"❌ DB not found: {args.db}", file=sys.stderr)
+        sys.exit(1)
+
+    run(db.database_url(args.db), args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
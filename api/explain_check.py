@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Query-plan regression check for the API's hot paths.
+
+Runs the app in-process (TestClient) against a scratch SQLite database that
+migrations.py built, drives every endpoint the iOS client uses (reads and
+writes), and records each statement the API sends. Every recorded SELECT /
+UPDATE / DELETE is then run through EXPLAIN QUERY PLAN, and the check fails if
+any of them falls back to a full SCAN of meals, plans or plans_by_date — i.e.
+it is missing an index, or wraps an indexed column in a function.
+
+Scans that are the point of the statement are listed in ALLOWED with the
+reason, keyed by where they come from (file:function).
+
+Usage:
+  python explain_check.py                       # fresh schema + a small fixture
+  python explain_check.py --db data/scranly.db  # a scratch copy of this DB (upgraded first)
+  python explain_check.py -v                    # print every plan, not just failures
+"""
+
+import argparse, json, os, re, shutil, sys, tempfile, traceback
+import datetime as dt
+from typing import Dict, List, Optional, Tuple
+
+HOT_TABLES = ("meals", "plans", "plans_by_date")
+SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(%s)\b" % "|".join(HOT_TABLES))
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+NOT_ORIGINS = {"db.py", "singleflight.py", "explain_check.py"}
+
+ALLOWED: Dict[str, str] = {
+    "main.py:list_recipes": "catalog browse: LIKE '%q%' filter + count; pages are ETag/HTTP cached",
+    "main.py:random_deck": "ORDER BY RANDOM() samples the whole catalog",
+    "meal_features.py:load_meal_features": "catalog matrix, reloaded only when catalog_version() moves",
+    "ingredient_index.py:load_ingredient_index": "ingredient CSR, rebuilt with the catalog matrix",
+    "catalog_bundle.py:build": "offline bundle export, once per catalog version",
+}
+
+FIXTURE_MEALS = [
+    ("chk-1", "Chicken Rice Bowl", "dinner", 620, 45, 70, 14, "chicken breast", "rice"),
+    ("chk-2", "Veggie Omelette", "breakfast", 380, 24, 8, 26, "eggs", "spinach"),
+    ("chk-3", "Lentil Soup", "lunch", 450, 22, 60, 9, "red lentils", "carrots"),
+    ("chk-4", "Salmon Traybake", "dinner", 640, 40, 35, 32, "salmon", "potatoes"),
+    ("chk-5", "Greek Yogurt Pot", "breakfast", 300, 20, 35, 8, "greek yogurt", "honey"),
+    ("chk-6", "Falafel Wrap", "lunch", 520, 18, 62, 20, "chickpeas", "wraps"),
+]
+
+
+def seed(conn) -> None:
+    """Just enough rows for every endpoint to take its normal path."""
+    import sqlalchemy as sa
+    for mid, title, mtype, kcal, p, c, f, ing1, ing2 in FIXTURE_MEALS:
+        ings = [{"ingredient": ing1, "quantity": "200 g"}, {"ingredient": ing2, "quantity": "1"}]
+        conn.execute(sa.text("""
+            INSERT INTO meals (id, title, meal_type, tags, allergens, ingredients_json, nutrition_json,
+                               price_json, price_pounds, cals, proteins, carbs, fats, time_total_minutes)
+            VALUES (:id, :t, :mt, :tags, '[]', :ing, :nut, :price, 3.5, :k, :p, :c, :f, 25)
+        """), {
+            "id": mid, "t": title, "mt": mtype, "tags": json.dumps([mtype, "quick"]), "ing": json.dumps(ings),
+            "nut": json.dumps({"totals": {"kcal": kcal, "protein_g": p, "carbs_g": c, "fat_g": f}}),
+            "price": json.dumps({"items": [{"ingredient": i["ingredient"], "cost": 1.75} for i in ings]}),
+            "k": kcal, "p": p, "c": c, "f": f,
+        })
+    conn.execute(sa.text("""
+        INSERT INTO users (user_id, given_name, email, goal_daily_calories, allergens)
+        VALUES ('check', 'Check', 'check@example.com', 2000, '[]')
+    """))
+    conn.execute(sa.text("""
+        INSERT INTO user_stats (user_id, saved_gbp, time_saved_minutes, meals_planned, updated_at)
+        VALUES ('check', 10, 30, 6, '2025-01-01T00:00:00Z')
+    """))
+    conn.execute(sa.text("""
+        INSERT INTO catalog_items (name, default_unit, aisle, emoji, price_per_pack, pack_amount, pack_unit, size_label)
+        VALUES ('rice', 'grams', 'Pantry', '🍚', 1.59, 1000, 'grams', '1kg')
+    """))
+    conn.execute(sa.text("""
+        INSERT INTO ingredient_catalog_map (ingredient, catalog_id)
+        SELECT 'rice', id FROM catalog_items WHERE name = 'rice'
+    """))
+
+
+def scratch_db(src: Optional[str]) -> str:
+    path = os.path.join(tempfile.mkdtemp(prefix="explain_check_"), "scranly.db")
+    if src:
+        shutil.copyfile(src, path)
+    import db, migrations
+    engine = db.make_engine(db.database_url(path))
+    with engine.begin() as conn:
+        migrations.upgrade(conn)
+        if not src:
+            seed(conn)
+    engine.dispose()
+    return path
+
+
+def pick_user(engine) -> Tuple[str, List[str]]:
+    import sqlalchemy as sa
+    with engine.connect() as conn:
+        ids = [str(r[0]) for r in conn.execute(sa.text("SELECT id FROM meals ORDER BY id LIMIT 6"))]
+        row = conn.execute(sa.text("SELECT user_id FROM users ORDER BY user_id LIMIT 1")).first()
+    return (str(row[0]) if row else "check"), ids
+
+
+def drive(client, user_id: str, ids: List[str], record) -> None:
+    """The iOS client's calls, in roughly the order a session makes them."""
+    today = dt.date.today()
+    sunday = today - dt.timedelta(days=(today.weekday() + 1) % 7)
+    week = [(sunday + dt.timedelta(days=i)).isoformat() for i in range(7)]
+    days = [{"date": d, "breakfast": [ids[i % len(ids)]], "lunch": [ids[(i + 1) % len(ids)]],
+             "dinner": [ids[(i + 2) % len(ids)]]} for i, d in enumerate(week)]
+
+    def call(method: str, path: str, **kw):
+        record.route = f"{method} {path}"
+        r = client.request(method, path, **kw)
+        if r.status_code >= 500:
+            print(f"⚠️ {method} {path} → {r.status_code}", file=sys.stderr)
+        return r
+
+    call("GET", "/v1/recipes")
+    call("GET", "/v1/recipes", params={"sort": "protein_desc", "page": 2, "limit": 2})
+    call("GET", "/v1/recipes", params={"q": "chicken", "tag": "dinner"})
+    call("GET", "/v1/recipes/deck", params={"limit": 5})
+    call("GET", "/v1/recipes/deck", params={"mode": "ranked", "user_id": user_id, "limit": 5})
+    call("GET", "/v1/recipes/changes", params={"limit": 3})
+    call("GET", f"/v1/recipes/{ids[0]}")
+    call("GET", f"/v1/recipes/{ids[0]}/image")
+    call("GET", f"/v1/recipes/{ids[0]}/similar")
+    call("GET", "/v1/recipes/images", params={"ids": ids[:3]})
+    call("GET", "/v1/catalog/bundle/info")
+
+    plan = call("POST", "/v1/plans", json={"user_id": user_id, "start_date": week[0], "days": days}).json()
+    plan_id = int(plan.get("id", -1))
+    call("GET", "/v1/plans", params={"user_id": user_id})
+    call("GET", "/v1/plans/current", params={"user_id": user_id, "expand": True})
+    call("GET", f"/v1/plans/{plan_id}", params={"expand": True})
+    call("PATCH", f"/v1/plans/{plan_id}/days/{week[1]}/lunch",
+         json={"meal_ids": [ids[-1]], "version": plan.get("version")})
+    call("GET", f"/v1/plans/{plan_id}/swaps", params={"date": week[2], "slot": "dinner", "k": 3})
+
+    call("GET", "/v1/basket", params={"user_id": user_id, "week_start": week[0]})
+    call("POST", "/v1/basket/rebuild", params={"user_id": user_id, "week_start": week[0]})
+    call("GET", "/v1/basket", params={"user_id": user_id, "week_start": week[0]})
+    call("GET", "/v1/track", params={"user_id": user_id, "days": 7})
+    call("GET", "/v1/stats/summary", params={"user_id": user_id})
+    call("GET", "/v1/home", params={"user_id": user_id})
+    call("POST", "/v1/plans/generate", params={"user_id": user_id, "start_date": week[0], "days": 7})
+
+
+class Recorder:
+    def __init__(self):
+        self.route = "-"
+        self.seen: Dict[str, Tuple[tuple, str, str]] = {}   # sql → (params, route, origin)
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        head = statement.lstrip().split(None, 1)[0].upper()
+        if head not in ("SELECT", "UPDATE", "DELETE", "WITH") and not (head == "INSERT" and "SELECT" in statement.upper()):
+            return
+        if statement in self.seen:
+            return
+        params = parameters[0] if executemany else parameters
+        self.seen[statement] = (tuple(params or ()), self.route, _origin())
+
+
+def _origin() -> str:
+    for fr in reversed(traceback.extract_stack()):
+        d, f = os.path.split(fr.filename)
+        if os.path.abspath(d) == API_DIR and f not in NOT_ORIGINS:
+            return f"{f}:{fr.name}"
+    return "?"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Fail if a hot-path query does a full SCAN of meals/plans/plans_by_date.")
+    ap.add_argument("--db", help="Check against a scratch copy of this SQLite DB (default: fresh schema + fixture)")
+    ap.add_argument("-v", "--verbose", action="store_true", help="Print every statement's plan")
+    args = ap.parse_args()
+
+    if args.db and not os.path.exists(args.db):
+        print(f"❌ DB not found: {args.db}", file=sys.stderr)
+        sys.exit(1)
+    path = scratch_db(args.db)
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ.pop("DB_PATH", None)
+    os.environ["CATALOG_BUNDLE_DIR"] = os.path.join(os.path.dirname(path), "bundles")
+
+    import contextlib, io
+    import sqlalchemy as sa
+    from fastapi.testclient import TestClient
+    with contextlib.redirect_stdout(io.StringIO()):   # the API is chatty
+        import main as api
+    user_id, ids = pick_user(api.engine)
+    record = Recorder()
+    sa.event.listen(api.engine, "before_cursor_execute", record)
+    with contextlib.redirect_stdout(io.StringIO()):
+        drive(TestClient(api.app), user_id, ids, record)
+    sa.event.remove(api.engine, "before_cursor_execute", record)
+
+    failures = allowed = 0
+    raw = api.engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        for sql, (params, route, origin) in record.seen.items():
+            cur.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = [str(r[-1]) for r in cur.fetchall()]
+            scans = [p for p in plan if SCAN_RE.match(p)]
+            if scans and origin in ALLOWED:
+                allowed += 1
+                status = f"➖ allowed ({ALLOWED[origin]})"
+            elif scans:
+                failures += 1
+                status = "❌ " + "; ".join(scans)
+            else:
+                status = "✅"
+            if args.verbose or (scans and origin not in ALLOWED):
+                print(f"\n{status}\n   {origin}  [{route}]\n   " + " ".join(sql.split())[:300])
+                for p in plan:
+                    print(f"     · {p}")
+    finally:
+        raw.close()
+
+    print(f"\n{len(record.seen)} statements checked: {failures} full scan(s), {allowed} allowed")
+    shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
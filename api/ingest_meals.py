@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+Streams a JSONL or CSV feed of meals into `meals`.
+
+- Rows are read lazily and handled in batches of --batch-size, so memory stays flat
+  whatever the feed size (one batch in flight + the worker pool)
+- Each row is validated (id + title required, numeric columns numeric, JSON
+  columns parseable); bad rows are reported with their line number and skipped
+- A sha256 of the canonical row is kept in meals.content_hash; rows whose hash
+  is unchanged are skipped before any derived work is done
+- Derived data is computed in a process pool:
+    ingredients → meal_ingredients (normalised name, amount, unit)
+    nutrition_json totals → cals / proteins / carbs / fats (when not given)
+    price_json line costs → price_pounds (when not given)
+    embedding (embeddings.py features, IDF from the current catalog)
+- Each batch is one transaction: executemany upsert into meals + meal_ingredients
+
+Goes through db.py, so --db (SQLite) or $DATABASE_URL (Postgres) both work.
+Field names are the `meals` column names. In CSV, JSON columns hold JSON text.
+Run `python embeddings.py` after very large refreshes to recompute IDF catalog-wide.
+
+Usage:
+  python ingest_meals.py feed.jsonl
+  python ingest_meals.py feed.csv --workers 8 --batch-size 2000
+  python ingest_meals.py feed.jsonl --dry-run
+"""
+
+import argparse, csv, hashlib, json, os, sys, time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import sqlalchemy as sa
+
+import db
+import migrations
+from catalog_matcher import normalise_ingredient
+from embeddings import meal_features, compute_idf, embed, to_blob
+from pack_optimiser import parse_quantity
+
+TEXT_COLS = [
+    "title", "meal_type", "cuisine", "sub_cuisine", "diet", "category", "description",
+    "app_description", "image_path", "image_prompt", "instructions", "difficulty",
+]
+JSON_COLS = ["tags", "allergens", "instructions_json", "ingredients_json", "nutrition_json",
+             "price_json", "concept_scores"]
+NUM_COLS = ["user_rating", "price_pounds", "cals", "carbs", "proteins", "fats",
+            "time_total_minutes", "time_active_minutes"]
+MEAL_TYPES = {"breakfast", "lunch", "dinner"}
+
+SOURCE_COLS = ["id"] + TEXT_COLS + JSON_COLS + NUM_COLS
+WRITE_COLS = SOURCE_COLS + ["embedding", "content_hash"]
+
+SQLITE_MAX_VARS = 900   # ids per expanding IN list
+
+
+class RowError(ValueError):
+    pass
+
+
+# ---------- reading + validation ----------
+def read_feed(path: str) -> Iterator[Tuple[int, dict]]:
+    """(line_no, raw dict) for each record; JSONL or CSV by extension."""
+    with open(path, newline="", encoding="utf-8") as fh:
+        if path.lower().endswith(".csv"):
+            for i, rec in enumerate(csv.DictReader(fh), start=2):
+                yield i, rec
+        else:
+            for i, line in enumerate(fh, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield i, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield i, {"__error__": f"bad JSON: {e}"}
+
+
+def validate(rec: dict) -> dict:
+    """Raw feed record → row dict keyed by SOURCE_COLS, JSON columns as canonical JSON text."""
+    if "__error__" in rec:
+        raise RowError(rec["__error__"])
+    row: Dict[str, object] = {}
+    mid = str(rec.get("id") or "").strip()
+    title = str(rec.get("title") or "").strip()
+    if not mid:
+        raise RowError("missing id")
+    if not title:
+        raise RowError("missing title")
+    row["id"] = mid
+
+    for c in TEXT_COLS:
+        v = rec.get(c)
+        row[c] = str(v).strip() if v not in (None, "") else None
+    if row["meal_type"]:
+        row["meal_type"] = str(row["meal_type"]).lower()
+        if row["meal_type"] not in MEAL_TYPES:
+            raise RowError(f"meal_type {row['meal_type']!r} not one of {sorted(MEAL_TYPES)}")
+
+    for c in JSON_COLS:
+        v = rec.get(c)
+        if v in (None, ""):
+            row[c] = None
+            continue
+        if isinstance(v, str):
+            try:
+                v = json.loads(v)
+            except json.JSONDecodeError:
+                if c in ("tags", "allergens"):
+                    v = [t.strip(" '\"") for t in v.strip("[]").split(",") if t.strip(" '\"")]
+                else:
+                    raise RowError(f"{c} is not valid JSON")
+        row[c] = json.dumps(v, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    if row["ingredients_json"] and not isinstance(json.loads(row["ingredients_json"]), list):
+        raise RowError("ingredients_json must be a list")
+    if row["price_json"]:
+        _check_price(json.loads(row["price_json"]))
+    if row["nutrition_json"]:
+        _check_nutrition(json.loads(row["nutrition_json"]))
+
+    for c in NUM_COLS:
+        v = rec.get(c)
+        if v in (None, ""):
+            row[c] = None
+            continue
+        try:
+            row[c] = float(v)
+        except (TypeError, ValueError):
+            raise RowError(f"{c}={v!r} is not a number")
+    return row
+
+
+def _check_numbers(d: dict, keys, where: str) -> None:
+    for k in keys:
+        v = d.get(k)
+        if v is not None and v != "":
+            try:
+                float(v)
+            except (TypeError, ValueError):
+                raise RowError(f"{where}.{k}={v!r} is not a number")
+
+
+def _check_price(v) -> None:
+    """price_json: {"items": [{..., "line_cost_gbp": n}], ...} (what _price_total reads)."""
+    if not isinstance(v, dict):
+        raise RowError("price_json must be an object")
+    items = v.get("items")
+    if items is not None and not isinstance(items, list):
+        raise RowError("price_json.items must be a list")
+    for it in items or []:
+        if isinstance(it, dict):
+            _check_numbers(it, ("line_cost_gbp",), "price_json.items[]")
+
+
+def _check_nutrition(v) -> None:
+    """nutrition_json: {"totals": {...}} or {"by_ingredient": [...]} or a bare list (what _nutrition_totals reads)."""
+    keys = ("kcal", "protein_g", "carbs_g", "fat_g")
+    if isinstance(v, dict):
+        if v.get("totals") is not None:
+            if not isinstance(v["totals"], dict):
+                raise RowError("nutrition_json.totals must be an object")
+            _check_numbers(v["totals"], keys, "nutrition_json.totals")
+        parts = v.get("by_ingredient")
+        if parts is not None and not isinstance(parts, list):
+            raise RowError("nutrition_json.by_ingredient must be a list")
+    elif isinstance(v, list):
+        parts = v
+    else:
+        raise RowError("nutrition_json must be an object or a list")
+    for it in parts or []:
+        if isinstance(it, dict):
+            _check_numbers(it, keys, "nutrition_json[]")
+
+
+def content_hash(row: dict) -> str:
+    blob = json.dumps([row.get(c) for c in SOURCE_COLS], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+# ---------- derived data (worker side) ----------
+_IDF: Dict[str, float] = {}
+
+
+def _init_worker(idf: Dict[str, float]) -> None:
+    global _IDF
+    _IDF = idf
+
+
+def _nutrition_totals(raw: Optional[str]) -> Optional[Tuple[float, float, float, float]]:
+    if not raw:
+        return None
+    blob = json.loads(raw)
+    if isinstance(blob, dict) and isinstance(blob.get("totals"), dict):
+        t = blob["totals"]
+        return (float(t.get("kcal") or 0), float(t.get("protein_g") or 0),
+                float(t.get("carbs_g") or 0), float(t.get("fat_g") or 0))
+    parts = blob.get("by_ingredient") if isinstance(blob, dict) else blob
+    if isinstance(parts, list):
+        k = p = c = f = 0.0
+        for it in parts:
+            if isinstance(it, dict):
+                k += float(it.get("kcal") or 0); p += float(it.get("protein_g") or 0)
+                c += float(it.get("carbs_g") or 0); f += float(it.get("fat_g") or 0)
+        return k, p, c, f
+    return None
+
+
+def _price_total(raw: Optional[str]) -> Optional[float]:
+    if not raw:
+        return None
+    items = json.loads(raw).get("items") or []
+    costs = [float(it["line_cost_gbp"]) for it in items if isinstance(it, dict) and it.get("line_cost_gbp") is not None]
+    return round(sum(costs), 2) if costs else None
+
+
+def _ingredient_rows(mid: str, raw: Optional[str]) -> List[tuple]:
+    """meal_ingredients rows; repeated ingredients in the same unit are summed."""
+    agg: Dict[str, Tuple[float, str]] = {}
+    for ing in json.loads(raw) if raw else []:
+        if not isinstance(ing, dict):
+            continue
+        key = normalise_ingredient(str(ing.get("ingredient") or ing.get("name") or ""))
+        if not key:
+            continue
+        amount, unit = parse_quantity(str(ing.get("quantity") or ""))
+        if key in agg and agg[key][1] == unit:
+            amount += agg[key][0]
+        elif key in agg:
+            continue
+        agg[key] = (amount, unit)
+    return [(mid, k, round(a, 3), u) for k, (a, u) in agg.items()]
+
+
+def derive(row: dict) -> Tuple[tuple, List[tuple]]:
+    """Validated row (with content_hash) → (meals upsert params, meal_ingredients rows)."""
+    row = dict(row)
+    totals = _nutrition_totals(row["nutrition_json"])
+    if totals:
+        for col, v in zip(("cals", "proteins", "carbs", "fats"), totals):
+            if row[col] is None:
+                row[col] = round(v, 2)
+    if row["price_pounds"] is None:
+        row["price_pounds"] = _price_total(row["price_json"])
+    row["embedding"] = to_blob(embed(meal_features(row), _IDF))
+    return tuple(row[c] for c in WRITE_COLS), _ingredient_rows(row["id"], row["ingredients_json"])
+
+
+# ---------- driver ----------
+def catalog_idf(conn) -> Dict[str, float]:
+    """IDF over the current catalog, streamed from the cursor (only the DF counter is held)."""
+    rows = conn.execution_options(stream_results=True).execute(sa.text("""
+        SELECT title, tags, cuisine, sub_cuisine, diet, meal_type, ingredients_json FROM meals
+    """)).mappings()
+    return compute_idf(meal_features(r) for r in rows)
+
+
+def known_hashes(conn, ids: List[str]) -> Dict[str, str]:
+    out: Dict[str, str] = {}
+    if "content_hash" not in db.column_names(conn, "meals"):
+        return out      # dry run on a DB that predates the column: everything counts as new
+    sql = sa.text("SELECT CAST(id AS TEXT), content_hash FROM meals WHERE id IN :ids").bindparams(db.in_list("ids"))
+    for i in range(0, len(ids), SQLITE_MAX_VARS):
+        out.update(conn.execute(sql, {"ids": ids[i:i + SQLITE_MAX_VARS]}).all())
+    return out
+
+
+def write_batch(conn, results: List[Tuple[tuple, List[tuple]]]) -> None:
+    """One batch in the caller's transaction: meals upserted, meal_ingredients replaced."""
+    ids = [params[0] for params, _ in results]
+    db.upsert(conn, "meals", [dict(zip(WRITE_COLS, params)) for params, _ in results], key=("id",))
+    delete = sa.text("DELETE FROM meal_ingredients WHERE meal_id IN :ids").bindparams(db.in_list("ids"))
+    for i in range(0, len(ids), SQLITE_MAX_VARS):
+        conn.execute(delete, {"ids": ids[i:i + SQLITE_MAX_VARS]})
+    ing_rows = [r for _, rows in results for r in rows]
+    if ing_rows:
+        conn.execute(sa.text(
+            "INSERT INTO meal_ingredients (meal_id, ingredient, amount, unit) VALUES (:m, :i, :a, :u)"
+        ), [{"m": m, "i": i, "a": a, "u": u} for m, i, a, u in ing_rows])
+
+
+def run(db_url: str, feed: str, workers: int, batch_size: int, dry_run: bool, force: bool) -> Counter:
+    if not dry_run:
+        migrations.migrate(db_url)   # meals.content_hash, meal_ingredients
+    engine = db.make_engine(db_url)
+    stats: Counter = Counter()
+    t0 = time.perf_counter()
+    try:
+        with engine.connect() as conn:
+            idf = catalog_idf(conn)
+        print(f"📚 IDF over current catalog: {len(idf)} features")
+
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(idf,)) \
+            if workers > 1 else None
+        if pool is None:
+            _init_worker(idf)
+
+        def process(batch: List[dict]):
+            if force:
+                have = {}
+            else:
+                with engine.connect() as conn:
+                    have = known_hashes(conn, [r["id"] for r in batch])
+            todo = [r for r in batch if have.get(r["id"]) != r["content_hash"]]
+            stats["unchanged"] += len(batch) - len(todo)
+            if not todo:
+                return
+            if pool is not None:
+                results = list(pool.map(derive, todo, chunksize=max(1, len(todo) // (workers * 4))))
+            else:
+                results = [derive(r) for r in todo]
+            if not dry_run:
+                with engine.begin() as conn:
+                    write_batch(conn, results)
+            stats["upserted"] += len(results)
+            elapsed = time.perf_counter() - t0
+            print(f"   • read={stats['read']} upserted={stats['upserted']} unchanged={stats['unchanged']} "
+                  f"invalid={stats['invalid']} ({stats['read'] / elapsed:.0f} rows/s)")
+
+        try:
+            batch: List[dict] = []
+            seen_ids = set()
+            for line_no, rec in read_feed(feed):
+                stats["read"] += 1
+                try:
+                    row = validate(rec)
+                except RowError as e:
+                    stats["invalid"] += 1
+                    print(f"⚠️ line {line_no}: {e}")
+                    continue
+                if row["id"] in seen_ids:
+                    # a later duplicate in the same batch wins
+                    batch = [r for r in batch if r["id"] != row["id"]]
+                row["content_hash"] = content_hash(row)
+                batch.append(row)
+                seen_ids.add(row["id"])
+                if len(batch) >= batch_size:
+                    process(batch)
+                    batch, seen_ids = [], set()
+            if batch:
+                process(batch)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        print(f"✅ Done in {time.perf_counter() - t0:.1f}s: {dict(stats)}"
+              + ("  (dry run, nothing written)" if dry_run else ""))
+        return stats
+    finally:
+        engine.dispose()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Stream a JSONL/CSV meal feed into `meals` (+ derived data).")
+    ap.add_argument("feed", help="Path to .jsonl or .csv")
+    ap.add_argument("--db", help="Path to a SQLite DB (default: $DATABASE_URL, else $DB_PATH)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (1 = inline)")
+    ap.add_argument("--batch-size", type=int, default=2000, help="Rows per transaction")
+    ap.add_argument("--force", action="store_true", help="Re-derive and write even if content_hash is unchanged")
+    ap.add_argument("--dry-run", action="store_true", help="Validate + derive only; no DB writes")
+    args = ap.parse_args()
+
+    for p in (args.db, args.feed):
+        if p and not os.path.exists(p):
+            print(f"❌ Not found: {p}", file=sys.stderr)
+            sys.exit(1)
+
+    run(db.database_url(args.db), args.feed, max(1, args.workers), max(1, args.batch_size), args.dry_run, args.force)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+# ingredient_index.py
+"""
+Integer-id view of which ingredients each meal uses.
+
+Ingredient strings are normalised with catalog_matcher.normalise_ingredient and
+interned into a vocabulary; meal → ingredient ids is stored CSR-style (one flat
+int32 array + offsets) in the same row order as meal_features.MealFeatures, so
+scoring code can go from a feature row to its ingredients without touching JSON.
+Pantry staples (basket_builder's PANTRY) are flagged so they can be ignored.
+
+Each (meal, ingredient) entry also carries a £ cost — the meal's price_json line
+cost, else the ingredient's median line cost across the catalog, else the
+cheapest catalog pack mapped to it — and the transposed CSR (ingredient → meals)
+is kept as posting lists, so "what does adding this meal cost given what's
+already in the basket" is a gather + bincount over arrays.
+"""
+
+import json, statistics, threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+import sqlalchemy as sa
+
+from catalog_matcher import normalise_ingredient
+
+# same staples the basket skips, in normalised form
+STAPLES = {normalise_ingredient(s) for s in
+           ("salt", "pepper", "black pepper", "olive oil", "oil", "water", "chili flakes", "sugar", "flour")}
+
+
+@dataclass
+class IngredientIndex:
+    ids: List[str]              # meal ids, same order as MealFeatures.ids
+    vocab: Dict[str, int]       # normalised ingredient → id
+    names: List[str]            # id → normalised ingredient
+    staple: np.ndarray          # bool per ingredient id
+    meal_ptr: np.ndarray        # int64, len(ids) + 1
+    meal_ings: np.ndarray       # int32, flat ingredient ids
+    meal_cost: np.ndarray       # float32, £ per (meal, ingredient), aligned with meal_ings
+    meal_of: np.ndarray         # int32, owning meal row of each meal_ings entry
+    ing_ptr: np.ndarray         # int64, len(names) + 1 — posting lists
+    ing_meals: np.ndarray       # int32, meal rows per ingredient (ascending)
+    meal_required: np.ndarray   # int32, non-staple ingredients per meal row
+
+    def ingredients_of(self, row: int) -> np.ndarray:
+        return self.meal_ings[self.meal_ptr[row]:self.meal_ptr[row + 1]]
+
+    def shopping_ingredients_of(self, row: int) -> np.ndarray:
+        ings = self.ingredients_of(row)
+        return ings[~self.staple[ings]]
+
+    def meals_with(self, ing: int) -> np.ndarray:
+        return self.ing_meals[self.ing_ptr[ing]:self.ing_ptr[ing + 1]]
+
+    def basket_counts(self, rows) -> np.ndarray:
+        """How many of the given meal rows use each ingredient (rows may repeat)."""
+        counts = np.zeros(len(self.names), dtype=np.int32)
+        for r in rows:
+            counts[self.ingredients_of(int(r))] += 1
+        return counts
+
+    def marginal_costs(self, have: np.ndarray) -> np.ndarray:
+        """
+        £ each meal would add to a basket already holding the ingredients with
+        have > 0 (those are free; staples are always free). One value per meal row.
+        """
+        new = (have[self.meal_ings] == 0) & ~self.staple[self.meal_ings]
+        return np.bincount(self.meal_of, weights=self.meal_cost * new, minlength=len(self.ids))
+
+    def shared_counts(self, ings) -> np.ndarray:
+        """Per meal row: how many of `ings` (ingredient ids) it uses, via the posting lists."""
+        out = np.zeros(len(self.ids), dtype=np.int32)
+        for j in ings:
+            out[self.meals_with(int(j))] += 1
+        return out
+
+
+def _line_costs(price_obj) -> Dict[str, float]:
+    """normalised ingredient → £ from a parsed price_json ({"items": [...]})."""
+    out: Dict[str, float] = {}
+    items = price_obj.get("items") if isinstance(price_obj, dict) else None
+    for it in items or []:
+        try:
+            key = normalise_ingredient(str(it.get("ingredient") or ""))
+            cost = float(it.get("line_cost_gbp"))
+        except (TypeError, ValueError, AttributeError):
+            continue
+        if key:
+            out[key] = out.get(key, 0.0) + cost
+    return out
+
+
+def build_ingredient_index(ids: List[str], ingredients_by_meal: Dict[str, list],
+                           prices_by_meal: Optional[Dict[str, dict]] = None,
+                           pack_prices: Optional[Dict[str, float]] = None) -> IngredientIndex:
+    """
+    ingredients_by_meal: meal_id → parsed ingredients_json list
+    prices_by_meal:      meal_id → parsed price_json
+    pack_prices:         normalised ingredient → cheapest catalog pack £ (last-resort cost)
+    """
+    lines = {mid: _line_costs(p) for mid, p in (prices_by_meal or {}).items()}
+    samples: Dict[str, List[float]] = {}
+    for costs in lines.values():
+        for k, v in costs.items():
+            samples.setdefault(k, []).append(v)
+    typical = {k: statistics.median(v) for k, v in samples.items()}
+    pack_prices = pack_prices or {}
+
+    vocab: Dict[str, int] = {}
+    ptr = np.zeros(len(ids) + 1, dtype=np.int64)
+    flat: List[int] = []
+    cost: List[float] = []
+    for i, mid in enumerate(ids):
+        seen = set()
+        own = lines.get(mid, {})
+        for ing in ingredients_by_meal.get(mid) or []:
+            if not isinstance(ing, dict):
+                continue
+            key = normalise_ingredient(str(ing.get("ingredient") or ing.get("name") or ""))
+            if not key:
+                continue
+            j = vocab.setdefault(key, len(vocab))
+            if j not in seen:
+                seen.add(j)
+                flat.append(j)
+                cost.append(own.get(key, typical.get(key, pack_prices.get(key, 0.0))))
+        ptr[i + 1] = len(flat)
+    names = list(vocab)
+
+    meal_ings = np.array(flat, dtype=np.int32)
+    meal_of = np.repeat(np.arange(len(ids), dtype=np.int32), np.diff(ptr))
+    staple = np.array([n in STAPLES for n in names], dtype=bool)
+    order = np.argsort(meal_ings, kind="stable")     # stable → meal rows ascending per ingredient
+    ing_ptr = np.zeros(len(names) + 1, dtype=np.int64)
+    ing_ptr[1:] = np.cumsum(np.bincount(meal_ings, minlength=len(names)))
+    return IngredientIndex(
+        ids=list(ids),
+        vocab=vocab,
+        names=names,
+        staple=staple,
+        meal_ptr=ptr,
+        meal_ings=meal_ings,
+        meal_cost=np.array(cost, dtype=np.float32),
+        meal_of=meal_of,
+        ing_ptr=ing_ptr,
+        ing_meals=meal_of[order],
+        meal_required=np.bincount(meal_of[~staple[meal_ings]], minlength=len(ids)).astype(np.int32),
+    )
+
+
+def _json_or(raw, default):
+    try:
+        return json.loads(raw) if raw else default
+    except Exception:
+        return default
+
+
+def load_ingredient_index(conn, ids: List[str]) -> IngredientIndex:
+    by_meal: Dict[str, list] = {}
+    prices: Dict[str, dict] = {}
+    for mid, raw, price in conn.execute(sa.text(
+        "SELECT CAST(id AS TEXT), ingredients_json, price_json FROM meals"
+    )):
+        by_meal[str(mid)] = _json_or(raw, [])
+        prices[str(mid)] = _json_or(price, {})
+
+    pack_prices: Dict[str, float] = {}
+    if sa.inspect(conn).has_table("catalog_items"):
+        for name, price in conn.execute(sa.text(
+            "SELECT name, MIN(price_per_pack) FROM catalog_items WHERE price_per_pack > 0 GROUP BY name"
+        )):
+            key = normalise_ingredient(str(name))
+            pack_prices[key] = min(float(price), pack_prices.get(key, float("inf")))
+        if sa.inspect(conn).has_table("ingredient_catalog_map"):
+            for ing, price in conn.execute(sa.text("""
+                SELECT m.ingredient, MIN(c.price_per_pack)
+                FROM ingredient_catalog_map m JOIN catalog_items c ON c.id = m.catalog_id
+                WHERE c.price_per_pack > 0
+                GROUP BY m.ingredient
+            """)):
+                pack_prices.setdefault(str(ing), float(price))
+    return build_ingredient_index(ids, by_meal, prices, pack_prices)
+
+
+_lock = threading.Lock()
+_cached: Optional[IngredientIndex] = None
+_built_for: Optional[List[str]] = None      # the exact ids list _cached was built against
+
+
+def get_ingredient_index(engine, ids: List[str]) -> IngredientIndex:
+    """
+    Process-wide index aligned to `ids` (pass MealFeatures.ids). get_meal_features()
+    hands out a new MealFeatures — so a new ids list — whenever the catalog moves,
+    and the index is rebuilt the first time it sees one.
+    """
+    global _cached, _built_for
+    idx = _cached
+    if idx is None or _built_for is not ids:
+        with _lock:
+            if _cached is None or _built_for is not ids:
+                with engine.begin() as conn:
+                    _cached = load_ingredient_index(conn, ids)
+                _built_for = ids
+                print(f"🥕 Loaded ingredient index: {len(_cached.names)} ingredients")
+            idx = _cached
+    return idx
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test that replays the iOS app's screens (ios/Networking/APIClient.swift).
+
+Each virtual user (VU) is one phone: it picks a screen from the mix, makes that
+screen's calls (in parallel where the app uses `async let`), thinks, and repeats.
+
+  home      stats/summary ∥ plans/current?expand ∥ track?days=7 ∥ basket?week_start
+  home1     home as one round trip: GET /v1/home (compare --mix home1=35,... with home=35,...)
+  plan      plans?user_id (summaries) → plans/{id}?expand for the latest weeks, in parallel
+  discover  recipes/deck?limit=40 → recipes/{id}/image for the visible cards, in parallel
+  browse    recipes?limit=200&page=1
+  shop      basket?week_start (+ basket/rebuild now and then)
+  track     track?days=7
+  log       POST track (upsert today's totals; group-committed, see track_writer.py)
+
+By default the tool copies --db to a scratch file, generates a dataset on top
+(load-NNNN users with plans, stats and optionally a scaled-up catalog), starts
+the API with uvicorn against it, runs each --vus stage for --duration seconds
+after --warmup, and reports throughput, error/shed rates and p50/p95/p99 per
+endpoint and per screen. Everything is seeded, so the same arguments replay
+the same sessions: run once before a change with --out before.json, once
+after with --compare before.json, and read the saturation curve off the stages.
+
+Usage:
+  python load_test.py --db data/scranly.db
+  python load_test.py --db data/scranly.db --vus 1,2,4,8,16,32 --duration 20 --out before.json
+  python load_test.py --db data/scranly.db --vus 1,2,4,8,16,32 --duration 20 --compare before.json
+  python load_test.py --db data/scranly.db --mix home=60,discover=40 --users 500 --meals 2000
+  python load_test.py --db data/scranly.db --prepare /tmp/load.db     # dataset only
+  python load_test.py --url http://127.0.0.1:8000 --users 200         # API you started on a prepared DB
+"""
+
+import argparse, asyncio, datetime as dt, json, os, random, shutil, signal, subprocess, sys, tempfile, time
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+try:
+    import httpx
+except ImportError:   # optional: only this tool needs it
+    httpx = None
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MIX = "home=35,discover=25,plan=20,shop=10,browse=5,track=5"
+USER_PREFIX = "load-"
+PLAN_WEEKS = 3            # weeks of plans per generated user (this week and back)
+VISIBLE_CARDS = 10        # Discover requests images for the cards on screen
+REBUILD_P = 0.1           # share of Shop visits that pull-to-refresh (basket/rebuild)
+CONNS_PER_VU = 6          # URLSession's per-host connection limit
+PCTS = (50, 95, 99)
+
+
+# ---------- dataset ----------
+
+def prepare(src: str, dst: str, users: int, meals: int, seed: int) -> None:
+    """Copy src → dst, migrate, then add the generated users/plans (and meals, if asked)."""
+    import sqlalchemy as sa
+    import db, migrations, plan_store
+    from basket_builder import sunday_of_week
+
+    shutil.copyfile(src, dst)
+    rng = random.Random(seed)
+    engine = db.make_engine(db.database_url(dst))
+    t0 = time.perf_counter()
+    with engine.begin() as conn:
+        migrations.upgrade(conn)
+        ids = [str(r[0]) for r in conn.execute(sa.text("SELECT id FROM meals ORDER BY id"))]
+        if not ids:
+            raise SystemExit("❌ source DB has no meals")
+        if meals > len(ids):
+            tbl = db.table(conn, "meals")
+            base = conn.execute(sa.select(tbl).order_by(tbl.c.id)).mappings().all()
+            extra = [{**base[k % len(base)], "id": f"{base[k % len(base)]['id']}~{k // len(base) + 1}"}
+                     for k in range(meals - len(ids))]
+            for i in range(0, len(extra), 500):
+                conn.execute(sa.insert(tbl), extra[i:i + 500])
+            ids += [m["id"] for m in extra]
+
+        conn.execute(sa.text("DELETE FROM plans_by_date WHERE user_id LIKE :p"), {"p": USER_PREFIX + "%"})
+        conn.execute(sa.text("DELETE FROM plans WHERE user_id LIKE :p"), {"p": USER_PREFIX + "%"})
+        sunday = sunday_of_week(dt.date.today())
+        now = dt.datetime.now(dt.timezone.utc).replace(microsecond=0).isoformat()
+        user_rows, stat_rows = [], []
+        for n in range(users):
+            uid = f"{USER_PREFIX}{n:04d}"
+            user_rows.append({"user_id": uid, "given_name": f"Load {n}", "email": f"{uid}@example.com",
+                              "goal_daily_calories": rng.choice([1800, 2000, 2200, 2500]), "allergens": "[]",
+                              "created_at": now, "updated_at": now})
+            stat_rows.append({"user_id": uid, "saved_gbp": round(rng.uniform(0, 200), 2),
+                              "time_saved_minutes": rng.randrange(0, 600), "meals_planned": rng.randrange(0, 80),
+                              "personalisation_score": 65, "updated_at": now})
+            for w in range(PLAN_WEEKS):
+                days = [{s: [rng.choice(ids)] for s in plan_store.SLOTS} for _ in range(7)]
+                plan_store.create_plan(conn, uid, sunday - dt.timedelta(days=7 * w), days)
+        db.upsert(conn, "users", user_rows, key=("user_id",))
+        db.upsert(conn, "user_stats", stat_rows, key=("user_id",))
+    engine.dispose()
+    print(f"🧪 dataset: {len(ids)} meals, {users} users × {PLAN_WEEKS} weekly plans → {dst} "
+          f"in {time.perf_counter() - t0:.1f}s")
+
+
+# ---------- server ----------
+
+def start_server(db_path: str, port: int, workers: int, workdir: str) -> subprocess.Popen:
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{db_path}", "PYTHONUNBUFFERED": "1",
+           "CATALOG_BUNDLE_DIR": os.path.join(workdir, "bundles")}
+    for k in ("DB_PATH", "PROFILE_TOKEN", "PROFILE_SAMPLE_RATE"):
+        env.pop(k, None)
+    log = open(os.path.join(workdir, "api.log"), "w")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=API_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            break
+        try:
+            if httpx.get(url + "/v1/health", timeout=1).status_code == 200:
+                print(f"🚀 API up at {url} ({workers} worker(s))")
+                return proc
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    proc.terminate()
+    log.close()
+    with open(log.name) as f:
+        tail = f.read()[-2000:]
+    raise SystemExit(f"❌ API did not come up (exit {proc.poll()}):\n{tail}")
+
+
+def stop_server(proc: subprocess.Popen) -> None:
+    proc.send_signal(signal.SIGINT)
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+# ---------- recording ----------
+
+class Recorder:
+    def __init__(self):
+        self.active = False
+        self.ep_ms: Dict[str, List[float]] = defaultdict(list)
+        self.ep_err: Dict[str, int] = defaultdict(int)
+        self.ep_shed: Dict[str, int] = defaultdict(int)
+        self.sc_ms: Dict[str, List[float]] = defaultdict(list)
+        self.sc_err: Dict[str, int] = defaultdict(int)
+
+    def request(self, name: str, status: int, ms: float) -> None:
+        if not self.active:
+            return
+        self.ep_ms[name].append(ms)
+        if status == 503:
+            self.ep_shed[name] += 1
+        elif not 200 <= status < 400:
+            self.ep_err[name] += 1
+
+    def screen(self, name: str, ok: bool, ms: float) -> None:
+        if not self.active:
+            return
+        self.sc_ms[name].append(ms)
+        if not ok:
+            self.sc_err[name] += 1
+
+
+def _stats(ms: List[float], errors: int, shed: int, seconds: float) -> dict:
+    arr = np.asarray(ms, dtype=float)
+    p = np.percentile(arr, PCTS) if len(arr) else [0.0] * len(PCTS)
+    return {"n": len(arr), "per_s": round(len(arr) / seconds, 2),
+            "errors_pct": round(100 * errors / max(1, len(arr)), 2), "shed_pct": round(100 * shed / max(1, len(arr)), 2),
+            **{f"p{q}": round(float(v), 1) for q, v in zip(PCTS, p)}}
+
+
+class Client:
+    """One screen visit over the stage's shared pool; every call is recorded under its route template."""
+
+    def __init__(self, http: "httpx.AsyncClient", rec: Recorder):
+        self.http = http
+        self.rec = rec
+        self.failed = False
+
+    async def call(self, method: str, path: str, name: Optional[str] = None, **kw):
+        t0 = time.perf_counter()
+        try:
+            r = await self.http.request(method, path, **kw)
+            status = r.status_code
+        except httpx.HTTPError:
+            r, status = None, 0
+        self.rec.request(f"{method} {name or path}", status, (time.perf_counter() - t0) * 1000)
+        if not 200 <= status < 400:
+            self.failed = True
+        return r
+
+    def get(self, path: str, name: Optional[str] = None, **kw):
+        return self.call("GET", path, name, **kw)
+
+
+# ---------- screens ----------
+
+Screen = Callable[[Client, str, random.Random], Awaitable[None]]
+SCREENS: Dict[str, Screen] = {}
+
+
+def screen(name: str):
+    def deco(fn: Screen) -> Screen:
+        SCREENS[name] = fn
+        return fn
+    return deco
+
+
+def _week_start() -> str:
+    today = dt.date.today()
+    return (today - dt.timedelta(days=(today.weekday() + 1) % 7)).isoformat()
+
+
+def _json(r, default):
+    try:
+        return r.json() if r is not None and r.status_code == 200 else default
+    except ValueError:
+        return default
+
+
+@screen("home")
+async def home(c: Client, user: str, rng: random.Random) -> None:
+    await asyncio.gather(
+        c.get("/v1/stats/summary", params={"user_id": user}),
+        c.get("/v1/plans/current", params={"user_id": user, "expand": "true"}),
+        c.get("/v1/track", params={"user_id": user, "days": 7}),
+        c.get("/v1/basket", params={"user_id": user, "week_start": _week_start()}),
+    )
+
+
+@screen("home1")
+async def home1(c: Client, user: str, rng: random.Random) -> None:
+    await c.get("/v1/home", params={"user_id": user})
+
+
+@screen("plan")
+async def plan(c: Client, user: str, rng: random.Random) -> None:
+    summaries = _json(await c.get("/v1/plans", params={"user_id": user, "limit": 40}), [])
+    ids = [p["id"] for p in sorted(summaries, key=lambda p: p["start_date"], reverse=True)[:2]]
+    await asyncio.gather(*(c.get(f"/v1/plans/{i}", name="/v1/plans/{id}", params={"expand": "true"}) for i in ids))
+
+
+@screen("discover")
+async def discover(c: Client, user: str, rng: random.Random) -> None:
+    deck = _json(await c.get("/v1/recipes/deck", params={"limit": 40}), [])
+    await asyncio.gather(*(c.get(f"/v1/recipes/{r['id']}/image", name="/v1/recipes/{id}/image")
+                           for r in deck[:VISIBLE_CARDS]))
+
+
+@screen("browse")
+async def browse(c: Client, user: str, rng: random.Random) -> None:
+    await c.get("/v1/recipes", params={"limit": 200, "page": 1})
+
+
+@screen("shop")
+async def shop(c: Client, user: str, rng: random.Random) -> None:
+    ws = _week_start()
+    await c.get("/v1/basket", params={"user_id": user, "week_start": ws})
+    if rng.random() < REBUILD_P:
+        await c.call("POST", "/v1/basket/rebuild", params={"user_id": user, "week_start": ws})
+
+
+@screen("track")
+async def track(c: Client, user: str, rng: random.Random) -> None:
+    await c.get("/v1/track", params={"user_id": user, "days": 7})
+
+
+@screen("log")
+async def log(c: Client, user: str, rng: random.Random) -> None:
+    p, cb, f = rng.uniform(40, 180), rng.uniform(100, 350), rng.uniform(30, 120)
+    await c.call("POST", "/v1/track", json={"user_id": user, "date": dt.date.today().isoformat(),
+                                            "calories": p * 4 + cb * 4 + f * 9, "protein": p, "carbs": cb, "fats": f})
+
+
+# ---------- stages ----------
+
+async def run_stage(base_url: str, vus: int, users: List[str], mix: Dict[str, float], duration: float,
+                    warmup: float, think_ms: float, seed: int) -> dict:
+    rec = Recorder()
+    http = httpx.AsyncClient(base_url=base_url, timeout=30, limits=httpx.Limits(max_connections=CONNS_PER_VU * vus))
+    names, weights = list(mix), list(mix.values())
+    t_start = time.perf_counter()
+    t_measure, t_end = t_start + warmup, t_start + warmup + duration
+
+    async def vu(i: int) -> None:
+        rng = random.Random(seed * 100003 + vus * 1009 + i)
+        while time.perf_counter() < t_end:
+            name, user = rng.choices(names, weights)[0], users[rng.randrange(len(users))]
+            c = Client(http, rec)
+            t0 = time.perf_counter()
+            await SCREENS[name](c, user, rng)
+            rec.screen(name, not c.failed, (time.perf_counter() - t0) * 1000)
+            if think_ms:
+                await asyncio.sleep(rng.expovariate(1000.0 / think_ms))
+
+    async def start_measuring() -> None:
+        await asyncio.sleep(warmup)
+        rec.active = True
+
+    await asyncio.gather(start_measuring(), *(vu(i) for i in range(vus)))
+    await http.aclose()
+
+    eps = {n: _stats(ms, rec.ep_err[n], rec.ep_shed[n], duration) for n, ms in sorted(rec.ep_ms.items())}
+    scs = {n: _stats(ms, rec.sc_err[n], 0, duration) for n, ms in sorted(rec.sc_ms.items())}
+    total = sum(len(ms) for ms in rec.ep_ms.values())
+    return {
+        "vus": vus, "duration_s": duration, "requests_per_s": round(total / duration, 2),
+        "screens_per_s": round(sum(len(ms) for ms in rec.sc_ms.values()) / duration, 2),
+        "errors_pct": round(100 * sum(rec.ep_err.values()) / max(1, total), 2),
+        "shed_pct": round(100 * sum(rec.ep_shed.values()) / max(1, total), 2),
+        "endpoints": eps, "screens": scs,
+    }
+
+
+def print_stage(s: dict) -> None:
+    print(f"\n👥 {s['vus']} VUs — {s['requests_per_s']} req/s, {s['screens_per_s']} screens/s, "
+          f"{s['errors_pct']}% errors, {s['shed_pct']}% shed (503)")
+    for title, rows in (("screen", s["screens"]), ("endpoint", s["endpoints"])):
+        print(f"   {title:<38} {'n':>6} {'/s':>7} {'err%':>6} {'shed%':>6} {'p50':>8} {'p95':>8} {'p99':>8}")
+        for name, r in rows.items():
+            print(f"   {name:<38} {r['n']:>6} {r['per_s']:>7} {r['errors_pct']:>6} {r['shed_pct']:>6} "
+                  f"{r['p50']:>8} {r['p95']:>8} {r['p99']:>8}")
+
+
+def compare(before: dict, after: dict) -> None:
+    """p95 and throughput per stage/screen, baseline → this run."""
+    old = {s["vus"]: s for s in before["stages"]}
+    print(f"\n📊 vs {before['config'].get('git') or 'baseline'} (p95 ms, screens/s)")
+    for s in after["stages"]:
+        b = old.get(s["vus"])
+        if b is None:
+            continue
+        print(f"   👥 {s['vus']:>3} VUs  req/s {b['requests_per_s']} → {s['requests_per_s']}")
+        for name, r in s["screens"].items():
+            o = b["screens"].get(name)
+            if o and o["p95"]:
+                delta = 100 * (r["p95"] - o["p95"]) / o["p95"]
+                print(f"      {name:<10} p95 {o['p95']:>8} → {r['p95']:>8} ({delta:+.0f}%)   "
+                      f"{o['per_s']} → {r['per_s']}/s")
+
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=API_DIR, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def parse_mix(s: str) -> Dict[str, float]:
+    mix = {}
+    for part in s.split(","):
+        name, _, w = part.partition("=")
+        if name.strip() not in SCREENS:
+            raise argparse.ArgumentTypeError(f"unknown screen {name!r} (have: {', '.join(SCREENS)})")
+        mix[name.strip()] = float(w or 1)
+    return mix
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay iOS app sessions against the API and report latency per endpoint/screen.")
+    ap.add_argument("--db", help="Source SQLite DB to copy the dataset from (never modified)")
+    ap.add_argument("--url", help="Target an API that is already running (skips dataset + server)")
+    ap.add_argument("--prepare", metavar="PATH", help="Only write the generated dataset to PATH")
+    ap.add_argument("--users", type=int, default=100, help="Generated users (load-0000…)")
+    ap.add_argument("--meals", type=int, default=0, help="Scale the catalog up to this many meals (clones)")
+    ap.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"Screen weights (default {DEFAULT_MIX})")
+    ap.add_argument("--vus", default="1,4,16", help="Comma-separated VU counts, one stage each")
+    ap.add_argument("--duration", type=float, default=15, help="Measured seconds per stage")
+    ap.add_argument("--warmup", type=float, default=3, help="Unmeasured seconds before each stage")
+    ap.add_argument("--think-ms", type=float, default=500, help="Mean think time between screens (0 = closed loop)")
+    ap.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--out", help="Write results JSON here")
+    ap.add_argument("--compare", help="Results JSON from an earlier run to diff against")
+    args = ap.parse_args()
+
+    if httpx is None and not args.prepare:
+        print("❌ load_test.py needs httpx (pip install httpx)", file=sys.stderr)
+        sys.exit(1)
+    if not args.url and not (args.db and os.path.exists(args.db)):
+        print("❌ pass --db (an existing SQLite DB to copy) or --url", file=sys.stderr)
+        sys.exit(1)
+
+    workdir = tempfile.mkdtemp(prefix="scranly_load_")
+    proc = None
+    try:
+        if args.prepare:
+            prepare(args.db, args.prepare, args.users, args.meals, args.seed)
+            return
+        base_url = args.url
+        if not base_url:
+            db_path = os.path.join(workdir, "scranly.db")
+            prepare(args.db, db_path, args.users, args.meals, args.seed)
+            proc = start_server(db_path, args.port, args.workers, workdir)
+            base_url = f"http://127.0.0.1:{args.port}"
+
+        users = [f"{USER_PREFIX}{n:04d}" for n in range(args.users)]
+        stages = []
+        for vus in [int(v) for v in args.vus.split(",") if v.strip()]:
+            print(f"⏱️  stage: {vus} VUs, {args.warmup:g}s warmup + {args.duration:g}s")
+            s = asyncio.run(run_stage(base_url, vus, users, args.mix, args.duration, args.warmup,
+                                      args.think_ms, args.seed))
+            print_stage(s)
+            stages.append(s)
+
+        result = {"config": {"git": _git_rev(), "users": args.users, "meals": args.meals, "mix": args.mix,
+                             "think_ms": args.think_ms, "workers": args.workers, "seed": args.seed,
+                             "url": args.url, "at": dt.datetime.now().isoformat(timespec="seconds")},
+                  "stages": stages}
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(result, f, indent=2)
+            print(f"\n💾 results → {args.out}")
+        if args.compare:
+            with open(args.compare) as f:
+                compare(json.load(f), result)
+    finally:
+        if proc is not None:
+            stop_server(proc)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,51 @@
 # main.py
 from __future__ import annotations
 
-import os, math, json
+import os, math, json, zlib, asyncio
 import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date as _date
 from typing import List, Optional, Dict, Any
 
 import sqlalchemy as sa
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse
 from pydantic import BaseModel
 
 # basket builder (kept as-is, now expected to use plans_by_date internally)
-from basket_builder import connect, sunday_of_week, build_basket_for_week
+import db
+from basket_builder import (
+    sunday_of_week, build_basket_for_week, load_basket, basket_row, save_baskets,
+)
+from embeddings import EmbeddingIndex, SELECT_EMBEDDINGS
+from meal_features import get_meal_features
+from ingredient_index import get_ingredient_index
+from plan_generator import PlanSpec, PlanError, generate_plan, save_plan, load_user_profile
+from swaps import suggest_swaps
+from pantry import pantry_match, resolve_pantry
+from suggest import get_suggest_index, KINDS as SUGGEST_KINDS
+import plan_store
+import migrations
+from plan_store import PlanNotFound, PlanConflict, PlanInvalid
+from catalog_changes import changes_since, make_token, parse_token, BadToken, catalog_version
+from catalog_bundle import BundleStore, MEDIA_TYPE as BUNDLE_MEDIA_TYPE
+from compression import CompressionMiddleware, compression_stats
+import profiling
+from profiling import ProfilingMiddleware, profiling_stats
+from admission import AdmissionMiddleware, admission_stats
+from singleflight import single_flight, forget, flight_stats
+from track_writer import TrackWriter
+from result_cache import RECIPE_PAGES, recipe_cache_stats
+from ranking import load_profile, rank_for_user, rank_depth, cached_ranking, store_ranking, RECENT_DAYS
 
 # -----------------------
-# DB setup (SQLite)
+# DB setup (SQLite or Postgres, see db.py)
 # -----------------------
-DB_PATH = os.getenv("DB_PATH", "/Users/lukeyp02/Desktop/scranly/api/data/scranly.db")
-engine = sa.create_engine(
-    f"sqlite:///{DB_PATH}",
-    connect_args={"check_same_thread": False},
-    future=True,
-)
+engine = db.get_engine()
 metadata = sa.MetaData()
 with engine.begin() as conn:
+    migrations.upgrade(conn)              # every table/index/trigger lives in migrations.py
     metadata.reflect(conn)
 
 meals = metadata.tables.get("meals")
@@ -38,6 +59,11 @@ if plans is None:
 if plans_by_date is None:
     raise RuntimeError("Table 'plans_by_date' not found. Run your backfill first.")
 
+# recipe vectors (written offline by embeddings.py), one contiguous matrix
+with engine.begin() as conn:
+    EMBEDDINGS = EmbeddingIndex.from_rows(conn.execute(sa.text(SELECT_EMBEDDINGS)).all())
+print(f"🧮 Loaded {len(EMBEDDINGS)} recipe embeddings")
+
 # -----------------------
 # Helpers
 # -----------------------
@@ -108,6 +134,13 @@ app.add_middleware(
     allow_methods=["GET", "POST", "OPTIONS"],
     allow_headers=["*"],
 )
+# opt-in per-request profiling (X-Profile header / PROFILE_SAMPLE_RATE); not installed when off
+if profiling.enabled():
+    app.add_middleware(ProfilingMiddleware, engine=engine)
+# gzip/br/zstd by Accept-Encoding; ETag + 304; compressed bodies cached per ETag
+app.add_middleware(CompressionMiddleware)
+# added last = outermost: shed load before any other work (see admission.py)
+app.add_middleware(AdmissionMiddleware)
 
 # -----------------------
 # Models
@@ -142,6 +175,62 @@ class ImageOnlyOut(BaseModel):
 class ImagesOut(BaseModel):
     images: Dict[str, Optional[str]]
 
+class SimilarRecipeOut(RecipeOut):
+    score: float   # cosine similarity to the query recipe
+
+class PantryMatchIn(BaseModel):
+    ingredients: List[str]     # what the user has, free text ("2 onions", "Chicken breast")
+    k: int = 20
+    min_coverage: float = 0.0
+    expand: bool = True
+
+class PantryHitOut(BaseModel):
+    meal_id: str
+    coverage: float            # share of non-staple ingredients on hand
+    have: int
+    required: int
+    missing: List[str]
+    recipe: Optional[RecipeOut] = None
+
+class PantryMatchOut(BaseModel):
+    matched: List[str]         # normalised names used for matching
+    unknown: List[str]         # names no recipe uses
+    results: List[PantryHitOut]
+
+class SuggestionOut(BaseModel):
+    text: str
+    kind: str                  # recipe | cuisine | tag | ingredient
+    meal_id: Optional[str] = None
+    weight: float              # popularity (plans + rating), for ordering
+
+class ChangesOut(BaseModel):
+    upserted: List[RecipeOut]
+    deleted: List[str]         # meal ids to drop locally
+    next: str                  # pass as ?since= on the next sync
+    has_more: bool
+
+class BundleInfoOut(BaseModel):
+    version: int               # catalog version the bundle was built at
+    url: str                   # immutable, versioned download URL
+    bytes: int
+    sha256: str
+    etag: str
+    sync_token: str            # pass as ?since= to /v1/recipes/changes after installing
+    recipes: int
+    thumbnails: int
+    built_at: str
+    format: int
+
+class SwapOut(BaseModel):
+    meal_id: str
+    marginal_cost: float      # £ of ingredients the week doesn't already have
+    saving: float             # £ freed by dropping the current meal
+    net_cost: float
+    day_kcal: float
+    delta_kcal: float
+    shared_ingredients: int
+    recipe: Optional[RecipeOut] = None
+
 def row_to_recipe(row) -> RecipeOut:
     return RecipeOut(
         id=str(val(row, ID)),
@@ -182,6 +271,22 @@ class PlanOut(BaseModel):
     end_date: str
     length_days: int
     days: List[PlanDayOut]
+    version: Optional[int] = None   # send back on PATCH to detect concurrent edits
+
+class PlanDayIn(BaseModel):
+    date: str                  # YYYY-MM-DD, consecutive from start_date
+    breakfast: List[str] = []  # meal ids
+    lunch: List[str] = []
+    dinner: List[str] = []
+
+class PlanIn(BaseModel):
+    user_id: str
+    start_date: str
+    days: List[PlanDayIn]
+
+class PlanSlotIn(BaseModel):
+    meal_ids: List[str]
+    version: Optional[int] = None
 
 class PlanSummaryOut(BaseModel):
     id: int
@@ -199,21 +304,22 @@ SLOT_ORDER = {"breakfast": 0, "lunch": 1, "dinner": 2}
 def _recipes_by_ids(conn, ids: List[str]) -> Dict[str, RecipeOut]:
     if not ids:
         return {}
-    placeholders = ",".join([f":id{i}" for i in range(len(ids))])
-    params = {f"id{i}": ids[i] for i in range(len(ids))}
-    sql = sa.text(f"SELECT * FROM {meals.name} WHERE CAST({ID} AS TEXT) IN ({placeholders})")
-    rows = conn.execute(sql, params).mappings().all()
+    # meals.id is TEXT: compare it bare so the PK index is used (CAST() would scan)
+    sql = sa.text(f"SELECT * FROM {meals.name} WHERE {ID} IN :ids").bindparams(db.in_list("ids"))
+    rows = conn.execute(sql, {"ids": [str(i) for i in ids]}).mappings().all()
     out: Dict[str, RecipeOut] = {}
     for r in rows:
         rec = row_to_recipe(r)
         out[str(rec.id)] = rec
     return out
 
-def pbd_meal_ids_for_range(conn, user_id: str, start_iso: str, end_iso: str) -> Dict[str, Dict[str, List[str]]]:
-    rows = conn.execute(sa.text("""
+def pbd_meal_ids_for_range(conn, user_id: str, start_iso: str, end_iso: str,
+                           plan_id: Optional[int] = None) -> Dict[str, Dict[str, List[str]]]:
+    """date → slot → meal_ids for the user's range; plan_id limits it to that plan's rows."""
+    rows = conn.execute(sa.text(f"""
         SELECT date, slot, idx, meal_id
         FROM plans_by_date
-        WHERE user_id = :u AND date BETWEEN :a AND :b
+        WHERE user_id = :u AND date BETWEEN :a AND :b {"AND plan_id = :p" if plan_id is not None else ""}
         ORDER BY date ASC,
                  CASE slot
                    WHEN 'breakfast' THEN 0
@@ -221,7 +327,7 @@ def pbd_meal_ids_for_range(conn, user_id: str, start_iso: str, end_iso: str) ->
                    WHEN 'dinner' THEN 2
                    ELSE 99 END,
                  idx ASC
-    """), {"u": user_id, "a": start_iso, "b": end_iso}).mappings().all()
+    """), {"u": user_id, "a": start_iso, "b": end_iso, "p": plan_id}).mappings().all()
 
     out: Dict[str, Dict[str, List[str]]] = {}
     for r in rows:
@@ -289,6 +395,7 @@ def get_current_plan(user_id: str, as_of: Optional[str] = None, expand: bool = F
         return get_plan(plan_id=int(row["id"]), expand=expand)
 
 @app.get("/v1/plans/{plan_id}", response_model=PlanOut)
+@single_flight("plan", ttl=1.0)
 def get_plan(plan_id: int, expand: bool = False):
     """
     Fetch a specific plan by its ID.
@@ -314,8 +421,8 @@ def get_plan(plan_id: int, expand: bool = False):
         start_iso = str(row["start_date"])
         end_iso   = str(row["end_date"])
 
-        # --- Load meal IDs for each date/slot from plans_by_date ---
-        date_map = pbd_meal_ids_for_range(conn, user_id, start_iso, end_iso)
+        # --- Load this plan's meal IDs for each date/slot from plans_by_date ---
+        date_map = pbd_meal_ids_for_range(conn, user_id, start_iso, end_iso, plan_id)
 
         # --- If expand=true, fetch recipes for all unique meal_ids ---
         uniq_ids: list[str] = []
@@ -357,11 +464,134 @@ def get_plan(plan_id: int, expand: bool = False):
             start_date=start_iso,
             end_date=end_iso,
             length_days=int(row["length_days"]),
-            days=days_out
+            days=days_out,
+            version=int(row["version"]) if row.get("version") is not None else None,
         )
 
         print(f"✅ /v1/plans/{plan_id} OK → days={len(days_out)} expand={expand}")
         return plan_out
+
+def _plans_changed():
+    """Coalesced/micro-cached reads that derive from plans must not outlive a write."""
+    forget("plan", "track", "stats", "basket", "home")
+
+@app.post("/v1/plans", response_model=PlanOut)
+def create_plan(body: PlanIn, expand: bool = False):
+    """
+    Create a plan from explicit meal ids. Days must be consecutive from start_date;
+    the user's existing plans_by_date rows in that range are replaced.
+    """
+    try:
+        start = _date.fromisoformat(body.start_date)
+        for i, d in enumerate(body.days):
+            if d.date != (start + dt.timedelta(days=i)).isoformat():
+                raise PlanInvalid(f"day {i} should be {(start + dt.timedelta(days=i)).isoformat()}, got {d.date}")
+        with engine.begin() as conn:
+            plan_id = plan_store.create_plan(
+                conn, body.user_id, start,
+                [{"breakfast": d.breakfast, "lunch": d.lunch, "dinner": d.dinner} for d in body.days],
+            )
+    except (PlanInvalid, ValueError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    print(f"📝 created plan {plan_id} for {body.user_id}")
+    _plans_changed()
+    return get_plan(plan_id=plan_id, expand=expand)
+
+@app.patch("/v1/plans/{plan_id}/days/{date}/{slot}", response_model=PlanOut)
+def patch_plan_slot(plan_id: int, date: str, slot: str, body: PlanSlotIn, expand: bool = False):
+    """Replace the meals in one slot of one day. 409 if body.version is stale."""
+    try:
+        with engine.begin() as conn:
+            version = plan_store.set_slot(conn, plan_id, date, slot, body.meal_ids, body.version)
+    except PlanNotFound:
+        raise HTTPException(status_code=404, detail="Plan not found")
+    except PlanConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except PlanInvalid as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    print(f"✏️ plan {plan_id} {date}/{slot} → {body.meal_ids} (v{version})")
+    _plans_changed()
+    return get_plan(plan_id=plan_id, expand=expand)
+
+@app.post("/v1/plans/generate", response_model=PlanOut)
+def generate_user_plan(
+    user_id: str,
+    start_date: Optional[str] = None,
+    days: int = Query(7, ge=1, le=14),
+    breakfast_max_minutes: Optional[int] = Query(None, ge=1),
+    lunch_max_minutes: Optional[int] = Query(None, ge=1),
+    dinner_max_minutes: Optional[int] = Query(None, ge=1),
+    allergens: Optional[List[str]] = Query(None, description="Repeat ?allergens= to exclude; overrides the user's stored list"),
+    expand: bool = False,
+):
+    """
+    Generate a plan (see plan_generator.py) and store it in plans + plans_by_date.
+    start_date defaults to the upcoming Sunday; an existing plan with the same
+    start is replaced.
+    """
+    try:
+        start = _date.fromisoformat(start_date) if start_date else sunday_of_week(_date.today()) + dt.timedelta(days=7)
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"start_date must be YYYY-MM-DD, got {start_date!r}")
+    spec = PlanSpec(start_date=start, days=days, slot_max_minutes={
+        "breakfast": breakfast_max_minutes, "lunch": lunch_max_minutes, "dinner": dinner_max_minutes,
+    })
+    feats = get_meal_features(engine)
+    index = get_ingredient_index(engine, feats.ids)
+    with engine.begin() as conn:
+        prof = load_user_profile(conn, user_id, allergens)
+    try:
+        plan = generate_plan(feats, index, prof, spec)
+    except PlanError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    with engine.begin() as conn:
+        plan_id = save_plan(conn, plan)
+    print(f"🗓️ generated plan {plan_id} for {user_id}: {plan.stats}")
+    _plans_changed()
+    return get_plan(plan_id=plan_id, expand=expand)
+
+@app.get("/v1/plans/{plan_id}/swaps", response_model=List[SwapOut])
+def plan_swaps(
+    plan_id: int,
+    date: str,
+    slot: str = Query(..., pattern="^(breakfast|lunch|dinner)$"),
+    k: int = Query(10, ge=1, le=50),
+    expand: bool = True,
+):
+    """
+    Replacement meals for one cell of a plan, cheapest change to the week's
+    shopping first (ingredients the week already buys are free), adjusted for
+    how the swap moves the day towards the user's calorie/macro targets.
+    """
+    with engine.begin() as conn:
+        row = conn.execute(sa.select(plans).where(plans.c.id == plan_id)).mappings().first()
+        if not row:
+            raise HTTPException(status_code=404, detail="Plan not found")
+        cells = [(str(d), str(s), str(m)) for d, s, m in conn.execute(sa.text("""
+            SELECT date, slot, meal_id FROM plans_by_date
+            WHERE plan_id = :p
+            ORDER BY date, slot, idx
+        """), {"p": plan_id})]
+        prof = load_user_profile(conn, str(row["user_id"]))
+
+    feats = get_meal_features(engine)
+    index = get_ingredient_index(engine, feats.ids)
+    swaps = suggest_swaps(feats, index, cells, date, slot, prof.goal_daily_calories, prof.allergens, k)
+    if not swaps and not any(d == date and s == slot for d, s, _ in cells):
+        raise HTTPException(status_code=404, detail=f"No {slot} on {date} in plan {plan_id}")
+
+    rec_map: Dict[str, RecipeOut] = {}
+    if expand and swaps:
+        with engine.begin() as conn:
+            rec_map = _recipes_by_ids(conn, [s.meal_id for s in swaps])
+    return [
+        SwapOut(
+            meal_id=s.meal_id, marginal_cost=s.marginal_cost, saving=s.saving, net_cost=s.net_cost,
+            day_kcal=s.day_kcal, delta_kcal=s.delta_kcal, shared_ingredients=s.shared_ingredients,
+            recipe=rec_map.get(s.meal_id),
+        )
+        for s in swaps
+    ]
     
 # --- Single image by recipe/meal id ---
 @app.get("/v1/recipes/{recipe_id}/image", response_model=ImageOnlyOut)
@@ -400,16 +630,13 @@ def recipe_images(ids: List[str] = Query(..., description="Repeat ?ids= for each
     if not ids:
         return ImagesOut(images={})
 
-    placeholders = ",".join(f":id{i}" for i in range(len(ids)))
-    params = {f"id{i}": ids[i] for i in range(len(ids))}
-
     with engine.begin() as conn:
         sql = sa.text(f"""
             SELECT CAST({ID} AS TEXT) AS rid, {IMAGE_PATH} AS img
             FROM {meals.name}
-            WHERE CAST({ID} AS TEXT) IN ({placeholders})
-        """)
-        rows = conn.execute(sql, params).mappings().all()
+            WHERE {ID} IN :ids
+        """).bindparams(db.in_list("ids"))
+        rows = conn.execute(sql, {"ids": [str(i) for i in ids]}).mappings().all()
 
     out: Dict[str, Optional[str]] = {str(i): None for i in ids}
     for r in rows:
@@ -423,11 +650,19 @@ def recipe_images(ids: List[str] = Query(..., description="Repeat ?ids= for each
 def health():
     return {"ok": True}
 
+@app.get("/v1/metrics")
+def metrics():
+    """Admission decisions per route class, compression and recipe-page caches, coalescing, profiling, track writes."""
+    return {"admission": admission_stats(), "compression": compression_stats(), "single_flight": flight_stats(),
+            "profiling": profiling_stats(), "track_writes": TRACK_WRITER.stats(),
+            "recipe_cache": recipe_cache_stats()}
+
 # -----------------------
 # Recipes
 # -----------------------
 @app.get("/v1/recipes", response_model=PageOut)
 def list_recipes(
+    request: Request,
     page: int = Query(1, ge=1),
     limit: int = Query(50, ge=1, le=200),
     q: Optional[str] = None,
@@ -436,6 +671,21 @@ def list_recipes(
 ):
     try:
         with engine.begin() as conn:
+            # pages only change when the catalog does: version + params is the ETag
+            version = catalog_version(conn)
+            qkey = zlib.crc32(f"{q}|{tag}".encode("utf-8"))
+            etag = f'W/"r{version}-{page}-{limit}-{sort}-{qkey:x}"'
+            headers = {"ETag": etag, **_bundle_header()}
+            if request.headers.get("if-none-match") == etag:
+                return Response(status_code=304, headers=headers)
+
+            # same filter → same rows: q is matched lowercased, "" is no filter, unknown sorts don't order
+            ckey = (page, limit, sort if sort in ("title_asc", "protein_desc", "time_asc") else None,
+                    (q or "").lower(), tag or "")
+            body = RECIPE_PAGES.get(ckey, version)
+            if body is not None:
+                return Response(content=body, media_type="application/json", headers=headers)
+
             stmt = sa.select(meals)
             where = []
             params: Dict[str, Any] = {}
@@ -481,18 +731,34 @@ def list_recipes(
                 params
             ).mappings().all()
 
-            return PageOut(
+            body = PageOut(
                 data=[row_to_recipe(r) for r in rows],
                 page=page,
                 total_pages=total_pages
-            )
+            ).model_dump_json().encode("utf-8")
+        RECIPE_PAGES.put(ckey, version, body)
+        return Response(content=body, media_type="application/json", headers=headers)
     except Exception as e:
         print("ERROR /v1/recipes:", repr(e))
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/v1/recipes/deck", response_model=List[RecipeOut])
-def random_deck(limit: int = Query(40, ge=1, le=200)):
+def random_deck(
+    limit: int = Query(40, ge=1, le=200),
+    user_id: Optional[str] = None,
+    mode: str = Query("random", pattern="^(random|ranked)$"),
+    offset: int = Query(0, ge=0),
+    allergens: Optional[List[str]] = Query(None, description="Repeat ?allergens= to exclude; overrides the user's stored list"),
+):
+    """
+    mode=random (default): random sample, as before.
+    mode=ranked&user_id=…: personalised order (see ranking.py); pages are
+    offset/limit slices of a per-user ranking cached for a few minutes, which
+    is extended when a page reaches past its end.
+    """
     try:
+        if mode == "ranked" and user_id:
+            return _ranked_deck(user_id, offset, limit, allergens)
         with engine.begin() as conn:
             rows = conn.execute(
                 sa.text(f"SELECT * FROM {meals.name} ORDER BY RANDOM() LIMIT :lim"),
@@ -503,6 +769,115 @@ def random_deck(limit: int = Query(40, ge=1, le=200)):
         print("ERROR /v1/recipes/deck:", repr(e))
         raise HTTPException(status_code=500, detail=str(e))
 
+def _ranked_deck(user_id: str, offset: int, limit: int, allergens: Optional[List[str]]) -> List[RecipeOut]:
+    feats = get_meal_features(engine)
+    key = (user_id, tuple(sorted(a.lower() for a in allergens)) if allergens is not None else ("*",),
+           feats.version)
+    ranked, complete = cached_ranking(key) or ([], False)
+    if not complete and len(ranked) < offset + limit:
+        today = dt.date.today()
+        with engine.begin() as conn:
+            prof = load_profile(
+                conn, user_id, today.isoformat(),
+                (today - dt.timedelta(days=RECENT_DAYS)).isoformat(), allergens,
+            )
+        depth = rank_depth(offset + limit)
+        ranked = rank_for_user(feats, prof, depth)
+        complete = len(ranked) < depth
+        store_ranking(key, ranked, complete)
+        print(f"🎯 ranked deck for {user_id}: {len(ranked)} meals")
+
+    page_ids = ranked[offset:offset + limit]
+    if not page_ids:
+        return []
+    with engine.begin() as conn:
+        rec_map = _recipes_by_ids(conn, page_ids)
+    return [rec_map[mid] for mid in page_ids if mid in rec_map]
+
+@app.get("/v1/recipes/changes", response_model=ChangesOut)
+def recipe_changes(
+    response: Response,
+    since: Optional[str] = Query(None, description="Token from the previous sync; omit for a full sync"),
+    limit: int = Query(200, ge=1, le=1000),
+):
+    """
+    Delta sync: recipes inserted/updated and ids deleted since `since`, oldest
+    change first. Keep calling with `next` while has_more is true.
+    """
+    try:
+        since_seq = parse_token(since)
+    except BadToken as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers.update(_bundle_header())
+    with engine.begin() as conn:
+        up_ids, deleted, last, has_more = changes_since(conn, since_seq, limit)
+        rec_map = _recipes_by_ids(conn, up_ids) if up_ids else {}
+    # an upsert whose row is already gone was deleted after this read began
+    upserted = [rec_map[m] for m in up_ids if m in rec_map]
+    deleted += [m for m in up_ids if m not in rec_map]
+    return ChangesOut(upserted=upserted, deleted=deleted, next=make_token(last), has_more=has_more)
+
+@app.get("/v1/recipes/{recipe_id}/similar", response_model=List[SimilarRecipeOut])
+def similar_recipes(recipe_id: str, k: int = Query(10, ge=1, le=100)):
+    """
+    Top-k nearest recipes by embedding cosine (run embeddings.py to populate).
+    Unknown ids / no embeddings → [].
+    """
+    hits = EMBEDDINGS.similar(recipe_id, k)
+    if not hits:
+        return []
+    with engine.begin() as conn:
+        rec_map = _recipes_by_ids(conn, [mid for mid, _ in hits])
+    return [
+        SimilarRecipeOut(**rec_map[mid].model_dump(), score=round(score, 4))
+        for mid, score in hits if mid in rec_map
+    ]
+
+@app.get("/v1/recipes/suggest", response_model=List[SuggestionOut])
+def recipes_suggest(
+    prefix: str = Query(..., max_length=100),
+    k: int = Query(10, ge=1, le=10),
+    kind: Optional[str] = Query(None, pattern="^(" + "|".join(SUGGEST_KINDS) + ")$"),
+):
+    """
+    Search-as-you-type: the most popular titles, cuisines, tags and ingredients
+    with a word starting with `prefix`, from an in-memory index (no SQL).
+    """
+    index = get_suggest_index(engine)
+    terms = index.suggest(prefix, k if kind is None else 10 * k)
+    if kind is not None:
+        terms = [t for t in terms if t.kind == kind][:k]
+    return [SuggestionOut(text=t.text, kind=t.kind, meal_id=t.meal_id, weight=t.weight) for t in terms]
+
+@app.post("/v1/recipes/pantry-match", response_model=PantryMatchOut)
+def recipes_pantry_match(body: PantryMatchIn):
+    """
+    Recipes ranked by the share of their (non-staple) ingredients the user
+    already has, with what's missing. Scored over the ingredient posting lists.
+    """
+    if not 1 <= body.k <= 100:
+        raise HTTPException(status_code=422, detail="k must be between 1 and 100")
+    if len(body.ingredients) > 200:
+        raise HTTPException(status_code=422, detail="at most 200 ingredients")
+    feats = get_meal_features(engine)
+    index = get_ingredient_index(engine, feats.ids)
+    have, unknown = resolve_pantry(index, body.ingredients)
+    hits = pantry_match(index, have, body.k, body.min_coverage)
+
+    rec_map: Dict[str, RecipeOut] = {}
+    if body.expand and hits:
+        with engine.begin() as conn:
+            rec_map = _recipes_by_ids(conn, [h.meal_id for h in hits])
+    return PantryMatchOut(
+        matched=[index.names[j] for j in have],
+        unknown=unknown,
+        results=[
+            PantryHitOut(meal_id=h.meal_id, coverage=h.coverage, have=h.have, required=h.required,
+                         missing=h.missing, recipe=rec_map.get(h.meal_id))
+            for h in hits
+        ],
+    )
+
 @app.get("/v1/recipes/{recipe_id}", response_model=RecipeOut)
 def get_recipe(recipe_id: str):
     """
@@ -563,6 +938,66 @@ def get_recipe(recipe_id: str):
             allergens=[],
         )
 
+# -----------------------
+# Offline catalog bundle (built by catalog_bundle.py)
+# -----------------------
+BUNDLES = BundleStore()
+
+def _bundle_header() -> Dict[str, str]:
+    """Advertised on recipe responses so the app knows when to re-download."""
+    m = BUNDLES.latest()
+    return {"X-Catalog-Bundle": str(m["version"])} if m else {}
+
+@single_flight("bundle")
+def _build_bundle() -> dict:
+    with engine.begin() as conn:
+        return BUNDLES.build(conn, lambda r: row_to_recipe(r).model_dump())
+
+def _current_bundle() -> dict:
+    """Latest bundle, rebuilt first if the catalog moved since (coalesced across requests)."""
+    m = BUNDLES.latest()
+    with engine.begin() as conn:
+        version = catalog_version(conn)
+    if m is None or m["version"] < version:
+        m = _build_bundle()
+    return m
+
+def _bundle_info(m: dict) -> BundleInfoOut:
+    return BundleInfoOut(url=f"/v1/catalog/bundle/{m['version']}",
+                         **{k: m[k] for k in BundleInfoOut.model_fields if k != "url"})
+
+class _BundleFile(FileResponse):
+    """FileResponse (Range, 206/416) whose If-Range check uses our content ETag."""
+    def _should_use_range(self, http_if_range: str, stat_result) -> bool:
+        return http_if_range == self.headers.get("etag")
+
+def _serve_bundle(request: Request, m: dict, cache_control: str) -> Response:
+    headers = {"ETag": m["etag"], "Cache-Control": cache_control, "X-Catalog-Bundle": str(m["version"]),
+               "Content-Disposition": f'attachment; filename="{m["file"]}"'}
+    inm = request.headers.get("if-none-match")
+    if inm and m["etag"] in [t.strip() for t in inm.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return _BundleFile(BUNDLES.path(m), media_type=BUNDLE_MEDIA_TYPE, headers=headers)
+
+@app.get("/v1/catalog/bundle/info", response_model=BundleInfoOut)
+def catalog_bundle_info():
+    return _bundle_info(_current_bundle())
+
+@app.get("/v1/catalog/bundle")
+def catalog_bundle(request: Request):
+    """
+    The current bundle (gzipped SQLite, see catalog_bundle.py). Revalidate with
+    If-None-Match (→ 304); resume with Range + If-Range.
+    """
+    return _serve_bundle(request, _current_bundle(), "no-cache")
+
+@app.get("/v1/catalog/bundle/{version}")
+def catalog_bundle_version(request: Request, version: int):
+    m = BUNDLES.get(version)
+    if m is None:
+        raise HTTPException(status_code=404, detail=f"no bundle for catalog version {version}")
+    return _serve_bundle(request, m, "public, max-age=31536000, immutable")
+
 # -----------------------
 # Basket (unchanged surface; builder should now use plans_by_date)
 # -----------------------
@@ -578,7 +1013,6 @@ def get_basket(user_id: str = Query(...), week_start: Optional[str] = None):
             if week_start else sunday_of_week(dt.date.today())
         )
         print(f"🧺 GET /v1/basket user_id={user_id} week_start={ws}")
-        conn = connect()
     except Exception as e:
         print(f"❌ Error before DB connect: {repr(e)}")
         return {
@@ -590,8 +1024,14 @@ def get_basket(user_id: str = Query(...), week_start: Optional[str] = None):
         }
 
     try:
-        out = build_basket_for_week(conn, user_id, ws)
-        print(f"✅ build_basket_for_week output: {out}")
+        # precomputed by bulk_baskets.py / POST /v1/basket/rebuild → one indexed read
+        with engine.connect() as conn:
+            out = load_basket(conn, user_id, ws)
+            if out is not None:
+                print(f"📦 Using stored basket for user={user_id}, week={ws}")
+            else:
+                out = build_basket_for_week(conn, user_id, ws)
+                print(f"✅ build_basket_for_week output: {out}")
 
         # --- Handle missing meals safely ---
         if not out or not out.get("items"):
@@ -621,24 +1061,23 @@ def get_basket(user_id: str = Query(...), week_start: Optional[str] = None):
             "message": f"Basket error: {e}"
         }
 
-    finally:
-        conn.close()
-
 @app.post("/v1/basket/rebuild")
 def rebuild_basket(user_id: str = Query(...), week_start: Optional[str] = None):
     """
-    Rebuilds and stores a basket for the given user/week.
-    Always returns 200 OK — returns an empty basket if no meals are found.
+    Rebuilds and stores a basket for the given user/week (default: this week's
+    Sunday, the key GET /v1/basket reads). Always returns 200 OK — returns an
+    empty basket if no meals are found.
     """
     ws = (
         dt.datetime.strptime(week_start, "%Y-%m-%d").date()
-        if week_start else _date.today()
+        if week_start else sunday_of_week(_date.today())
     )
     print(f"🧺 POST /v1/basket/rebuild user_id={user_id} week_start={ws}")
 
-    conn = connect()
     try:
-        out = build_basket_for_week(conn, user_id, ws)
+        build_basket_for_week.forget()   # don't join a build that started before the rebuild was asked for
+        with engine.connect() as conn:
+            out = build_basket_for_week(conn, user_id, ws)
         print(f"✅ build_basket_for_week output: {out}")
 
         # --- Handle missing meals/items safely ---
@@ -654,17 +1093,10 @@ def rebuild_basket(user_id: str = Query(...), week_start: Optional[str] = None):
 
         # --- Persist rebuilt basket ---
         try:
-            with engine.begin() as econn:
-                econn.execute(sa.text("""
-                    INSERT INTO baskets (user_id, week_start, basket_json, estimated_total)
-                    VALUES (:u, :w, :j, :t)
-                """), {
-                    "u": user_id,
-                    "w": ws.isoformat(),
-                    "j": json.dumps(out, separators=(",", ":")),
-                    "t": out.get("estimated_total", 0.0),
-                })
+            with engine.begin() as conn:
+                save_baskets(conn, [basket_row(user_id, ws, out)])
             print(f"💾 Saved basket for {user_id} @ {ws.isoformat()}")
+            forget("home")
         except Exception as e:
             import traceback; traceback.print_exc()
             print(f"⚠️ Could not save basket to DB: {repr(e)} (continuing anyway)")
@@ -688,9 +1120,6 @@ def rebuild_basket(user_id: str = Query(...), week_start: Optional[str] = None):
             "message": f"Error rebuilding basket: {e}"
         }
 
-    finally:
-        conn.close()
-
 # -----------------------
 # Track (now sums from plans_by_date -> meals.nutrition_json)
 # -----------------------
@@ -758,93 +1187,43 @@ class TrackEntryOut(BaseModel):
     fats: float        # grams
 
 
-def _meal_ids_for_date(plan_json: str | dict | None, day_iso: str) -> list[str]:
-    if not plan_json:
-        return []
-    try:
-        plan = json.loads(plan_json) if isinstance(plan_json, str) else plan_json
-    except Exception:
-        return []
-    mids: list[str] = []
-    for d in plan.get("days", []):
-        if str(d.get("date")) != day_iso:
-            continue
-        for slot in ("breakfast", "lunch", "dinner"):
-            for it in d.get(slot, []) or []:
-                mid = it.get("meal_id")
-                if mid is not None:
-                    mids.append(str(mid))
-    # de-dupe, keep order
-    seen = set()
-    out = []
-    for m in mids:
-        if m in seen: 
-            continue
-        seen.add(m)
-        out.append(m)
-    return out
-
-
 @app.get("/v1/track", response_model=List[TrackEntryOut])
+@single_flight("track", ttl=2.0)
 def get_track(user_id: str, days: int = 7):
     """
     For each day in [today-(days-1) ... today]:
-      - find that day's plan (if any)
-      - collect the day's meal_ids
-      - sum meals.nutrition_json["totals"] (kcal, protein_g, carbs_g, fat_g)
-      - if no meals, return zeros for that day
+      - the logged totals (POST /v1/track) if the day has a track row
+      - else the day's meal_ids from plans_by_date (one indexed range read),
+        summing meals.nutrition_json["totals"] (kcal, protein_g, carbs_g, fat_g)
+      - if neither, return zeros for that day
     """
     days = max(1, int(days))
     today = dt.date.today()
     start_date = today - dt.timedelta(days=days - 1)
 
-    conn = connect()
-    cur = conn.cursor()
+    with engine.begin() as conn:
+        logged = _logged_track(conn, user_id, start_date.isoformat(), today.isoformat())
+        date_map = pbd_meal_ids_for_range(conn, user_id, start_date.isoformat(), today.isoformat())
+        all_ids = sorted({m for slots in date_map.values() for mids in slots.values() for m in mids})
+        totals_by_id: dict[str, tuple[float, float, float, float]] = {}
+        if all_ids:
+            for r in conn.execute(sa.text(
+                f"SELECT CAST(id AS TEXT) AS id, nutrition_json FROM {meals.name} WHERE id IN :ids"
+            ).bindparams(db.in_list("ids")), {"ids": all_ids}).mappings():
+                totals_by_id[str(r["id"])] = _totals_from_nutrition_json(r["nutrition_json"])
 
     out: list[dict] = []
     for i in range(days):
-        d = start_date + dt.timedelta(days=i)
-        ds = d.isoformat()
-
-        # 1) plan covering that day (if any)
-        cur.execute("""
-            SELECT plan_json
-            FROM plans
-            WHERE user_id = ?
-              AND start_date <= ?
-              AND end_date   >= ?
-            ORDER BY start_date DESC
-            LIMIT 1
-        """, (user_id, ds, ds))
-        row = cur.fetchone()
-        plan_json = row[0] if row else None
-
-        # 2) meal ids for that date
-        meal_ids = _meal_ids_for_date(plan_json, ds)
-
-        # 3) sum totals from nutrition_json
+        ds = (start_date + dt.timedelta(days=i)).isoformat()
+        slots = date_map.get(ds, {})
+        # a meal counts once per day, as before
+        mids = list(dict.fromkeys(m for s in ("breakfast", "lunch", "dinner") for m in slots.get(s, [])))
         kcal = prot = carbs = fats = 0.0
-        if meal_ids:
-            placeholders = ",".join(["?"] * len(meal_ids))
-            cur.execute(f"""
-                SELECT nutrition_json
-                FROM meals
-                WHERE CAST(id AS TEXT) IN ({placeholders})
-            """, meal_ids)
-            for (nj,) in cur.fetchall():
-                if not nj:
-                    continue
-                try:
-                    blob = json.loads(nj)
-                    t = blob.get("totals") or {}
-                    kcal  += float(t.get("kcal", 0.0))
-                    prot  += float(t.get("protein_g", 0.0))
-                    carbs += float(t.get("carbs_g", 0.0))
-                    fats  += float(t.get("fat_g", 0.0))
-                except Exception:
-                    # bad/missing json: skip
-                    pass
-        # 4) always emit a row (even if zeros)
+        for mid in mids:
+            c, p, cb, f = totals_by_id.get(mid, (0.0, 0.0, 0.0, 0.0))
+            kcal += c; prot += p; carbs += cb; fats += f
+        if ds in logged:
+            kcal, prot, carbs, fats = logged[ds]
         out.append({
             "user_id": user_id,
             "date": ds,
@@ -853,10 +1232,65 @@ def get_track(user_id: str, days: int = 7):
             "carbs": carbs,
             "fats": fats,
         })
-
-    conn.close()
     return out
 
+def _logged_track(conn, user_id: str, start: str, end: str) -> Dict[str, tuple[float, float, float, float]]:
+    """date → (calories, protein, carbs, fat) of the user's logged track rows in [start, end]."""
+    return {str(d): (float(c), float(p), float(cb), float(f)) for d, c, p, cb, f in conn.execute(sa.text(
+        "SELECT date, calories, protein, carbs, fat FROM track WHERE user_id = :u AND date BETWEEN :s AND :e"
+    ), {"u": user_id, "s": start, "e": end})}
+
+class TrackEntryIn(BaseModel):
+    user_id: str
+    date: str          # YYYY-MM-DD
+    calories: float
+    protein: float     # grams
+    carbs: float       # grams
+    fats: float        # grams
+
+# one buffered writer per process: concurrent POSTs share a commit (see track_writer.py);
+# each commit drops the micro-cached reads of track so the write is visible at once
+TRACK_WRITER = TrackWriter(engine, on_commit=lambda: forget("track", "stats", "home"))
+app.add_event_handler("shutdown", TRACK_WRITER.close)
+
+def _track_row_out(row: dict) -> TrackEntryOut:
+    return TrackEntryOut(user_id=row["user_id"], date=row["date"], calories=row["calories"],
+                         protein=row["protein"], carbs=row["carbs"], fats=row["fat"])
+
+@app.post("/v1/track", response_model=TrackEntryOut)
+async def add_track(body: TrackEntryIn, response: Response, wait: bool = True):
+    """
+    Upsert the user's logged totals for one day (one row per user_id + date).
+    Writes are group-committed: by default the response comes after the commit
+    and echoes the stored row (the last write to that day wins). wait=false
+    answers 202 once the row is buffered; it is flushed within TRACK_FLUSH_MS
+    but is not durable until then.
+    """
+    try:
+        day = _date.fromisoformat(body.date).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"date must be YYYY-MM-DD, got {body.date!r}")
+    if not all(math.isfinite(v) and v >= 0 for v in (body.calories, body.protein, body.carbs, body.fats)):
+        raise HTTPException(status_code=422, detail="calories/protein/carbs/fats must be finite and >= 0")
+    row = {
+        "user_id": body.user_id, "date": day,
+        "calories": body.calories, "protein": body.protein, "carbs": body.carbs, "fat": body.fats,
+        "updated_at": dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds"),
+    }
+    try:
+        if not wait:
+            TRACK_WRITER.submit(row)
+            response.status_code = 202
+            return _track_row_out(row)
+        saved = await TRACK_WRITER.upsert(row)
+    except asyncio.TimeoutError:
+        # the row may still commit; the upsert is idempotent, so retrying is safe
+        raise HTTPException(status_code=503, detail="track write not confirmed in time, retry",
+                            headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"track write failed: {e}", headers={"Retry-After": "1"})
+    return _track_row_out(saved)
+
 # ==== Home stats: /v1/stats/summary ==========================================
 
 class StatsSummaryOut(BaseModel):
@@ -910,6 +1344,7 @@ def _has_table(conn, name: str) -> bool:
         return False
 
 @app.get("/v1/stats/summary", response_model=StatsSummaryOut)
+@single_flight("stats", ttl=2.0)
 def stats_summary(user_id: str):
     """
     Lifetime-ish stats + quick weekly averages for the Home screen.
@@ -995,12 +1430,10 @@ def stats_summary(user_id: str):
                 print(f"  ✓ unique meal_ids={len(all_ids)}  example={all_ids[:5]}")
                 nj_by_id: dict[str, str] = {}
                 if all_ids:
-                    placeholders = ",".join(f":m{i}" for i in range(len(all_ids)))
-                    params = {f"m{i}": all_ids[i] for i in range(len(all_ids))}
+                    params = {"ids": all_ids}
                     sql_meals = sa.text(
-                        f"SELECT CAST(id AS TEXT) AS id, nutrition_json FROM {meals.name} "
-                        f"WHERE CAST(id AS TEXT) IN ({placeholders})"
-                    )
+                        f"SELECT CAST(id AS TEXT) AS id, nutrition_json FROM {meals.name} WHERE id IN :ids"
+                    ).bindparams(db.in_list("ids"))
                     print("  SQL meals(fanout):", sql_meals.text, params)
                     for rr in conn.execute(sql_meals, params).mappings():
                         nj_by_id[str(rr["id"])] = rr.get("nutrition_json")
@@ -1041,3 +1474,153 @@ def stats_summary(user_id: str):
         # surface error to client with 500 but keep logs detailed
         raise HTTPException(status_code=500, detail=str(e))
     
+
+# ==== Home: /v1/home =========================================================
+# One round trip for the Home screen instead of stats + current plan + track +
+# basket + recipe images. The current plan is resolved once and its
+# plans_by_date rows / meal rows are read once for every section; the counters
+# and the basket don't depend on them and run on HOME_POOL meanwhile.
+
+HOME_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("HOME_WORKERS", "8")), thread_name_prefix="home")
+
+class HomeRecipeOut(BaseModel):
+    id: str
+    title: str
+    calories: int
+    image_url: Optional[str] = None
+
+class HomeEventOut(BaseModel):
+    time: Optional[str] = None
+    recipe: Optional[HomeRecipeOut] = None
+
+class HomeDayOut(BaseModel):
+    date: str
+    breakfast: List[HomeEventOut] = []
+    lunch: List[HomeEventOut] = []
+    dinner: List[HomeEventOut] = []
+
+class HomePlanOut(BaseModel):
+    id: int                    # -1 when there's no current plan (as /v1/plans/current)
+    user_id: str
+    start_date: str
+    end_date: str
+    length_days: int
+    days: List[HomeDayOut] = []
+
+class HomeBasketOut(BaseModel):
+    week_start: str
+    source_plan_id: Optional[int] = None
+    item_count: int
+    estimated_total: float
+
+class HomeOut(BaseModel):
+    user_id: str
+    stats: StatsSummaryOut
+    plan: HomePlanOut
+    track: List[TrackEntryOut]           # last 7 days, oldest first
+    basket: HomeBasketOut
+
+def _home_counters(user_id: str, today: str) -> tuple[int, float, int]:
+    """meals_cooked, money_saved, time_saved_min (see stats_summary)."""
+    with engine.connect() as conn:
+        cooked = conn.execute(sa.text(
+            "SELECT COUNT(*) FROM plans_by_date WHERE user_id = :u AND date <= :t"
+        ), {"u": user_id, "t": today}).scalar_one() or 0
+        m, t = conn.execute(sa.text("""
+            SELECT COALESCE(SUM(saved_gbp),0), COALESCE(SUM(time_saved_minutes),0)
+            FROM user_stats WHERE user_id = :u
+        """), {"u": user_id}).first()
+    return int(cooked), float(m or 0.0), int(float(t or 0))
+
+def _home_basket(user_id: str, week_start: dt.date) -> HomeBasketOut:
+    """The stored basket if there is one, else built (coalesced) — as GET /v1/basket."""
+    with engine.connect() as conn:
+        out = load_basket(conn, user_id, week_start) or build_basket_for_week(conn, user_id, week_start) or {}
+    return HomeBasketOut(
+        week_start=week_start.isoformat(),
+        source_plan_id=out.get("source_plan_id"),
+        item_count=len(out.get("items") or []),
+        estimated_total=float(out.get("estimated_total") or 0.0),
+    )
+
+@app.get("/v1/home", response_model=HomeOut)
+@single_flight("home", ttl=2.0)
+def home(user_id: str, as_of: Optional[str] = None):
+    """
+    Stats, the current plan (lite: title/calories/image per event), the last 7
+    days of track (logged, else planned) and this week's basket summary, in one
+    response. Each section matches its own endpoint: /v1/stats/summary,
+    /v1/plans/current?expand=true, /v1/track?days=7, /v1/basket.
+    """
+    try:
+        day = _date.fromisoformat(as_of) if as_of else _date.today()
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"as_of must be YYYY-MM-DD, got {as_of!r}")
+    today, start_7d = day.isoformat(), (day - dt.timedelta(days=6)).isoformat()
+    counters = HOME_POOL.submit(_home_counters, user_id, today)
+    basket = HOME_POOL.submit(_home_basket, user_id, sunday_of_week(day))
+
+    with engine.connect() as conn:
+        plan = conn.execute(
+            sa.select(plans)
+            .where(plans.c.user_id == user_id, plans.c.start_date <= today, plans.c.end_date >= today)
+            .order_by(plans.c.start_date.desc())
+            .limit(1)
+        ).mappings().first()
+        # one plans_by_date read covering both the plan and the 7-day window
+        lo = min(start_7d, str(plan["start_date"])) if plan else start_7d
+        hi = max(today, str(plan["end_date"])) if plan else today
+        date_map = pbd_meal_ids_for_range(conn, user_id, lo, hi)
+        logged = _logged_track(conn, user_id, start_7d, today)
+        ids = sorted({m for slots in date_map.values() for mids in slots.values() for m in mids})
+        by_id: Dict[str, Any] = {}
+        if ids:
+            cols = ", ".join(c for c in dict.fromkeys((ID, TITLE, CAL, IMAGE_PATH, "nutrition_json")) if c)
+            for r in conn.execute(sa.text(f"SELECT {cols} FROM {meals.name} WHERE {ID} IN :ids")
+                                  .bindparams(db.in_list("ids")), {"ids": ids}).mappings():
+                by_id[str(r[ID])] = r
+    totals = {mid: _totals_from_nutrition_json(r.get("nutrition_json")) for mid, r in by_id.items()}
+    zero = (0.0, 0.0, 0.0, 0.0)
+
+    # ---------- plan (lite) ----------
+    if plan:
+        recipes = {mid: HomeRecipeOut(id=mid, title=str(val(r, TITLE) or ""), calories=int(val(r, CAL) or 0),
+                                      image_url=build_image_url(val(r, IMAGE_PATH)))
+                   for mid, r in by_id.items()}
+        plan_out = HomePlanOut(
+            id=int(plan["id"]), user_id=user_id,
+            start_date=str(plan["start_date"]), end_date=str(plan["end_date"]),
+            length_days=int(plan["length_days"]),
+            days=[HomeDayOut(date=d, **{s: [HomeEventOut(time=_DEFAULT_TIMES[s], recipe=recipes.get(mid))
+                                            for mid in date_map[d][s]] for s in SLOT_ORDER})
+                  for d in sorted(date_map) if str(plan["start_date"]) <= d <= str(plan["end_date"])],
+        )
+    else:
+        plan_out = HomePlanOut(id=-1, user_id=user_id, start_date=today, end_date=today, length_days=0)
+
+    # ---------- track (logged row, else planned: a meal counts once per day)
+    #            + 7-day averages (every planned meal, as /v1/stats/summary) ----------
+    track: List[TrackEntryOut] = []
+    cals_total = prot_total = 0.0
+    days_count = 0
+    for i in range(7):
+        ds = (day - dt.timedelta(days=6 - i)).isoformat()
+        mids = [m for s in SLOT_ORDER for m in date_map.get(ds, {}).get(s, [])]
+        sums = logged.get(ds) or [sum(col) for col in zip(zero, *(totals.get(m, zero) for m in dict.fromkeys(mids)))]
+        track.append(TrackEntryOut(user_id=user_id, date=ds, calories=sums[0], protein=sums[1],
+                                   carbs=sums[2], fats=sums[3]))
+        if mids:
+            cals_total += sum(totals.get(m, zero)[0] for m in mids)
+            prot_total += sum(totals.get(m, zero)[1] for m in mids)
+            days_count += 1
+
+    meals_cooked, money_saved, time_saved_min = counters.result()
+    stats = StatsSummaryOut(
+        user_id=user_id, meals_cooked=meals_cooked, money_saved=money_saved, time_saved_min=time_saved_min,
+        calories_avg_7d=(cals_total / days_count) if days_count else None,
+        protein_avg_7d=(prot_total / days_count) if days_count else None,
+    )
+    out = HomeOut(user_id=user_id, stats=stats, plan=plan_out, track=track, basket=basket.result())
+    print(f"🏠 /v1/home user_id={user_id} plan={plan_out.id} days={len(plan_out.days)} "
+          f"basket_items={out.basket.item_count}")
+    return out
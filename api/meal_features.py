@@ -0,0 +1,138 @@
+# meal_features.py
+"""
+Column-oriented, in-memory view of the `meals` catalog for vectorised scoring.
+
+One NumPy array per feature (row i of every array is meal ids[i]); categorical
+columns are integer codes and allergens are a uint64 bitmask, so filters like
+"no dairy, no nuts" are a single `mask & bits == 0` over the catalog. Past 64
+distinct allergens the mask spills into further uint64 words (one column each).
+"""
+
+import json
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+import sqlalchemy as sa
+
+from catalog_changes import CatalogCache, catalog_version
+
+SELECT_FEATURES = """
+    SELECT CAST(id AS TEXT) AS id, cals, proteins, carbs, fats,
+           COALESCE(time_total_minutes, time_active_minutes) AS minutes,
+           cuisine, meal_type, user_rating, price_pounds, allergens
+    FROM meals
+"""
+
+
+_WORD = (1 << 64) - 1
+
+
+def parse_allergens(raw) -> List[str]:
+    if not raw:
+        return []
+    try:
+        arr = json.loads(raw) if isinstance(raw, str) else raw
+        if isinstance(arr, list):
+            return [str(a).strip().lower() for a in arr if str(a).strip()]
+    except Exception:
+        pass
+    return [a.strip().lower() for a in str(raw).strip("[]").split(",") if a.strip(" '\"")]
+
+
+@dataclass
+class MealFeatures:
+    ids: List[str]
+    row_of: Dict[str, int]
+    cals: np.ndarray        # float32, kcal
+    protein: np.ndarray     # float32, g
+    carbs: np.ndarray
+    fat: np.ndarray
+    minutes: np.ndarray     # float32, total time (0 when unknown)
+    price: np.ndarray       # float32, £ (NaN when unknown)
+    rating: np.ndarray      # float32 (NaN when unknown)
+    cuisine: np.ndarray     # int32 code into cuisines
+    meal_type: np.ndarray   # int32 code into meal_types
+    allergen_bits: np.ndarray  # uint64 (n, words) bitmask; bit b is word b // 64, bit b % 64
+    cuisines: List[str]
+    meal_types: List[str]
+    allergens: Dict[str, int]  # allergen name → bit index
+    version: int = 0           # catalog_version() the matrix was loaded at
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def allergen_mask(self, names) -> int:
+        """Bitmask for allergen names; names the catalog never uses contribute nothing."""
+        m = 0
+        for n in names or []:
+            b = self.allergens.get(str(n).strip().lower())
+            if b is not None:
+                m |= 1 << b
+        return m
+
+    def safe_for(self, names) -> np.ndarray:
+        """Boolean array: meals containing none of the given allergens."""
+        m = self.allergen_mask(names)
+        ok = np.ones(len(self.ids), dtype=bool)
+        for w in range(self.allergen_bits.shape[1]):
+            word = (m >> (64 * w)) & _WORD
+            if word:
+                ok &= (self.allergen_bits[:, w] & np.uint64(word)) == 0
+        return ok
+
+    def indices(self, meal_ids) -> np.ndarray:
+        return np.fromiter((self.row_of[m] for m in meal_ids if m in self.row_of), dtype=np.int64)
+
+
+def load_meal_features(conn) -> MealFeatures:
+    rows = conn.execute(sa.text(SELECT_FEATURES)).mappings().all()
+    n = len(rows)
+
+    def f32(col):
+        return np.array([float(r[col]) if r[col] is not None else np.nan for r in rows], dtype=np.float32)
+
+    cuisines: Dict[str, int] = {}
+    types: Dict[str, int] = {}
+    allergens: Dict[str, int] = {}
+    cuisine = np.empty(n, dtype=np.int32)
+    mtype = np.empty(n, dtype=np.int32)
+    masks: List[int] = []
+    for i, r in enumerate(rows):
+        cuisine[i] = cuisines.setdefault(str(r["cuisine"] or "").strip().lower(), len(cuisines))
+        mtype[i] = types.setdefault(str(r["meal_type"] or "").strip().lower(), len(types))
+        m = 0
+        for a in parse_allergens(r["allergens"]):
+            m |= 1 << allergens.setdefault(a, len(allergens))
+        masks.append(m)
+    bits = np.zeros((n, max(1, -(-len(allergens) // 64))), dtype=np.uint64)
+    for w in range(bits.shape[1]):
+        bits[:, w] = [(m >> (64 * w)) & _WORD for m in masks]
+
+    ids = [str(r["id"]) for r in rows]
+    return MealFeatures(
+        ids=ids,
+        row_of={mid: i for i, mid in enumerate(ids)},
+        cals=np.nan_to_num(f32("cals")),
+        protein=np.nan_to_num(f32("proteins")),
+        carbs=np.nan_to_num(f32("carbs")),
+        fat=np.nan_to_num(f32("fats")),
+        minutes=np.nan_to_num(f32("minutes")),
+        price=f32("price_pounds"),
+        rating=f32("user_rating"),
+        cuisine=cuisine,
+        meal_type=mtype,
+        allergen_bits=bits,
+        cuisines=list(cuisines),
+        meal_types=list(types),
+        allergens=allergens,
+        version=catalog_version(conn),
+    )
+
+
+_CACHE = CatalogCache("meal features", load_meal_features)
+
+
+def get_meal_features(engine) -> MealFeatures:
+    """Process-wide MealFeatures, reloaded when the meals catalog changes (catalog_changes.CatalogCache)."""
+    return _CACHE.get(engine)
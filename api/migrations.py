@@ -0,0 +1,555 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations. This file owns every table, index and trigger;
+scripts and the API call upgrade() instead of their own CREATE/ALTER.
+
+Each Migration is an ordered list of steps:
+- a SQL string (one statement; same text on SQLite and Postgres), or
+- {"sqlite": sql, "postgresql": sql} where the dialects differ (a dialect
+  left out skips the step), or
+- AddColumn(table, column, decl): skipped if the column is already there
+  (older databases got their columns from the one-off scripts).
+
+Applied versions are recorded in `schema_migrations` with a sha256 of their
+steps. If a recorded checksum no longer matches the code, upgrade() refuses to
+run: an applied migration was edited, so the database may not have the schema
+this file describes. Add a new migration instead.
+
+0001 is CREATE ... IF NOT EXISTS, so it adopts an existing database as-is.
+
+Usage:
+  python migrations.py              # status
+  python migrations.py upgrade
+  python migrations.py verify       # exit 1 on checksum mismatch or pending migrations
+  python migrations.py --db /path/to/scranly.db upgrade
+"""
+
+import argparse, datetime as dt, hashlib, sys, textwrap
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Union
+
+import sqlalchemy as sa
+
+import db
+
+
+class MigrationError(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class AddColumn:
+    table: str
+    column: str
+    decl: str
+
+
+Step = Union[str, Dict[str, str], AddColumn]
+
+
+def _sql(s: str) -> str:
+    return textwrap.dedent(s).strip()
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    steps: Tuple[Step, ...]
+
+    @property
+    def checksum(self) -> str:
+        h = hashlib.sha256()
+        for step in self.steps:
+            if isinstance(step, AddColumn):
+                text = f"ADD COLUMN {step.table}.{step.column} {step.decl}"
+            elif isinstance(step, dict):
+                text = "\n".join(f"[{k}]\n{_sql(v)}" for k, v in sorted(step.items()))
+            else:
+                text = _sql(step)
+            h.update(text.encode("utf-8") + b"\n;\n")
+        return h.hexdigest()
+
+
+SERIAL = {"sqlite": "INTEGER PRIMARY KEY AUTOINCREMENT", "postgresql": "BIGSERIAL PRIMARY KEY"}
+
+# meals columns a client, a cache or the bundle reads. Updates that touch only
+# other columns (embedding, content_hash, image_prompt, …) don't log a change,
+# so they don't bump catalog_version() and force every client to re-sync.
+CATALOG_COLUMNS = (
+    "id", "title", "meal_type", "cuisine", "sub_cuisine", "diet", "tags", "allergens",
+    "description", "app_description", "image_path", "instructions", "instructions_json",
+    "ingredients_json", "nutrition_json", "user_rating", "price_pounds", "price_json",
+    "cals", "carbs", "proteins", "fats", "time_total_minutes", "time_active_minutes", "difficulty",
+)
+_CHANGED = " OR ".join(f"OLD.{c} IS NOT NEW.{c}" for c in CATALOG_COLUMNS)
+_CHANGED_PG = "({}) IS DISTINCT FROM ({})".format(
+    ", ".join(f"OLD.{c}" for c in CATALOG_COLUMNS), ", ".join(f"NEW.{c}" for c in CATALOG_COLUMNS))
+
+
+def _serial(sql: str) -> Dict[str, str]:
+    """CREATE TABLE whose id column is {serial}."""
+    return {d: sql.replace("{serial}", s) for d, s in SERIAL.items()}
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "baseline", (
+        # Postgres has no json_valid(); plans.plan_json's CHECK uses it
+        {"postgresql": """
+            CREATE OR REPLACE FUNCTION json_valid(t TEXT) RETURNS BOOLEAN AS $$
+            BEGIN
+                PERFORM t::json;
+                RETURN TRUE;
+            EXCEPTION WHEN others THEN
+                RETURN FALSE;
+            END
+            $$ LANGUAGE plpgsql IMMUTABLE
+        """},
+        """
+        CREATE TABLE IF NOT EXISTS meals (
+            id                  TEXT PRIMARY KEY,
+            title               TEXT NOT NULL,
+            meal_type           TEXT,
+            cuisine             TEXT,
+            sub_cuisine         TEXT,
+            diet                TEXT,
+            category            TEXT,
+            tags                TEXT,
+            allergens           TEXT,
+            description         TEXT,
+            app_description     TEXT,
+            image_path          TEXT,
+            image_prompt        TEXT,
+            instructions        TEXT,
+            instructions_json   TEXT,
+            ingredients_json    TEXT,
+            nutrition_json      TEXT,
+            user_rating         REAL,
+            price_pounds        REAL,
+            price_json          TEXT,
+            cals                REAL,
+            carbs               REAL,
+            proteins            REAL,
+            fats                REAL,
+            time_total_minutes  REAL,
+            time_active_minutes REAL,
+            difficulty          TEXT,
+            concept_scores      TEXT,
+            embedding           TEXT,
+            created_at          TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        _serial("""
+        CREATE TABLE IF NOT EXISTS plans (
+            id             {serial},
+            user_id        TEXT    NOT NULL,
+            start_date     TEXT    NOT NULL,
+            end_date       TEXT    NOT NULL,
+            length_days    INTEGER NOT NULL CHECK (length_days > 0),
+            plan_json      TEXT    NOT NULL CHECK (json_valid(plan_json)),
+            created_at     TEXT    DEFAULT CURRENT_TIMESTAMP,
+            meals_count    INTEGER DEFAULT 0,
+            money_saved    REAL    DEFAULT 0.0,
+            time_saved_min INTEGER DEFAULT 0,
+            CHECK (DATE(start_date) IS NOT NULL),
+            CHECK (DATE(end_date)   IS NOT NULL)
+        )
+        """),
+        "CREATE INDEX IF NOT EXISTS idx_plans_user_dates ON plans(user_id, start_date, end_date)",
+        "CREATE INDEX IF NOT EXISTS idx_plans_start_date ON plans(start_date)",
+        """
+        CREATE TABLE IF NOT EXISTS plans_by_date (
+            plan_id INTEGER NOT NULL,
+            user_id TEXT    NOT NULL,
+            date    TEXT    NOT NULL,
+            slot    TEXT    NOT NULL,
+            idx     INTEGER NOT NULL,
+            meal_id TEXT    NOT NULL,
+            PRIMARY KEY (user_id, date, slot, idx)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_pbd_user_date ON plans_by_date(user_id, date)",
+        "CREATE INDEX IF NOT EXISTS idx_pbd_plan ON plans_by_date(plan_id)",
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id             TEXT PRIMARY KEY,
+            given_name          TEXT,
+            family_name         TEXT,
+            email               TEXT,
+            tz                  TEXT,
+            goal_daily_calories INTEGER,
+            height_cm           REAL,
+            weight_kg           REAL,
+            gender              TEXT,
+            birthdate           TEXT,
+            marketing_opt_in    INTEGER,
+            created_at          TEXT,
+            updated_at          TEXT,
+            last_login_at       TEXT
+        )
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email_unique ON users(email)",
+        _serial("""
+        CREATE TABLE IF NOT EXISTS catalog_items (
+            id             {serial},
+            name           TEXT NOT NULL UNIQUE,
+            default_unit   TEXT NOT NULL DEFAULT 'count' CHECK (default_unit IN ('count','grams','milliliters')),
+            aisle          TEXT NOT NULL,
+            emoji          TEXT NOT NULL,
+            price_per_pack REAL NOT NULL,
+            pack_amount    REAL NOT NULL,
+            pack_unit      TEXT NOT NULL CHECK (pack_unit IN ('count','grams','milliliters')),
+            size_label     TEXT,
+            updated_at     TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """),
+        "CREATE INDEX IF NOT EXISTS idx_catalog_items_name ON catalog_items(name)",
+        "CREATE INDEX IF NOT EXISTS idx_catalog_items_aisle ON catalog_items(aisle)",
+        """
+        CREATE TABLE IF NOT EXISTS ingredient_catalog_map (
+            ingredient TEXT PRIMARY KEY,
+            catalog_id INTEGER NOT NULL REFERENCES catalog_items(id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS meal_ingredients (
+            meal_id    TEXT NOT NULL,
+            ingredient TEXT NOT NULL,
+            amount     REAL NOT NULL,
+            unit       TEXT NOT NULL,
+            PRIMARY KEY (meal_id, ingredient)
+        )
+        """,
+        _serial("""
+        CREATE TABLE IF NOT EXISTS baskets (
+            id              {serial},
+            user_id         TEXT NOT NULL,
+            plan_id         INTEGER NOT NULL,
+            week_start      TEXT NOT NULL,
+            week_end        TEXT NOT NULL,
+            items_json      TEXT NOT NULL,
+            estimated_total REAL NOT NULL,
+            created_at      TEXT DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (user_id, week_start)
+        )
+        """),
+        "CREATE INDEX IF NOT EXISTS idx_baskets_user_week ON baskets(user_id, week_start)",
+        _serial("""
+        CREATE TABLE IF NOT EXISTS track (
+            id         {serial},
+            user_id    TEXT NOT NULL,
+            date       TEXT NOT NULL,
+            calories   REAL NOT NULL,
+            protein    REAL NOT NULL,
+            carbs      REAL NOT NULL,
+            fat        REAL NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        """),
+        "CREATE INDEX IF NOT EXISTS idx_track_user_date ON track(user_id, date)",
+        """
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id            TEXT PRIMARY KEY,
+            saved_gbp          REAL    NOT NULL DEFAULT 0,
+            time_saved_minutes INTEGER NOT NULL DEFAULT 0,
+            meals_planned      INTEGER NOT NULL DEFAULT 0,
+            updated_at         TEXT    NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS plan_stats (
+            plan_id        INTEGER PRIMARY KEY,
+            time_saved_min INTEGER NOT NULL,
+            money_saved    REAL    NOT NULL,
+            created_at     TEXT    DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    )),
+    Migration(2, "columns_from_scripts", (
+        # update_plans.py / stats_by_plan.py
+        AddColumn("plans", "meals_count", "INTEGER DEFAULT 0"),
+        AddColumn("plans", "money_saved", "REAL DEFAULT 0.0"),
+        AddColumn("plans", "time_saved_min", "INTEGER DEFAULT 0"),
+        # stats_table.py
+        AddColumn("user_stats", "personalisation_score", "INTEGER NOT NULL DEFAULT 65"),
+        # make_users.py
+        AddColumn("users", "allergens", "TEXT"),
+        # catalog_matcher.py
+        AddColumn("ingredient_catalog_map", "confidence", "REAL DEFAULT 1.0"),
+        # ingest_meals.py
+        AddColumn("meals", "content_hash", "TEXT"),
+    )),
+    Migration(3, "plans_version", (
+        AddColumn("plans", "version", "INTEGER NOT NULL DEFAULT 1"),
+    )),
+    Migration(4, "meal_changes", (
+        {
+            "sqlite": """
+                CREATE TABLE IF NOT EXISTS meal_changes (
+                    seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+                    meal_id    TEXT    NOT NULL,
+                    op         TEXT    NOT NULL CHECK (op IN ('upsert', 'delete')),
+                    changed_at TEXT    DEFAULT CURRENT_TIMESTAMP
+                )
+            """,
+            "postgresql": """
+                CREATE TABLE IF NOT EXISTS meal_changes (
+                    seq        BIGSERIAL PRIMARY KEY,
+                    meal_id    TEXT      NOT NULL,
+                    op         TEXT      NOT NULL CHECK (op IN ('upsert', 'delete')),
+                    changed_at TEXT      DEFAULT CURRENT_TIMESTAMP
+                )
+            """,
+        },
+        "CREATE INDEX IF NOT EXISTS idx_meal_changes_meal ON meal_changes(meal_id, seq)",
+        # existing catalog → one 'upsert' each, so a full sync from token 0 sees it
+        """
+        INSERT INTO meal_changes (meal_id, op)
+        SELECT CAST(id AS TEXT), 'upsert' FROM meals
+        WHERE NOT EXISTS (SELECT 1 FROM meal_changes)
+        ORDER BY id
+        """,
+        {"sqlite": """
+            CREATE TRIGGER IF NOT EXISTS trg_meals_changes_ins AFTER INSERT ON meals
+            BEGIN
+                INSERT INTO meal_changes (meal_id, op) VALUES (NEW.id, 'upsert');
+            END
+        """, "postgresql": """
+            CREATE OR REPLACE FUNCTION meal_changes_log() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'DELETE' THEN
+                    INSERT INTO meal_changes (meal_id, op) VALUES (OLD.id, 'delete');
+                    RETURN OLD;
+                END IF;
+                IF TG_OP = 'UPDATE' AND OLD.id IS DISTINCT FROM NEW.id THEN
+                    INSERT INTO meal_changes (meal_id, op) VALUES (OLD.id, 'delete');
+                END IF;
+                INSERT INTO meal_changes (meal_id, op) VALUES (NEW.id, 'upsert');
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+        """},
+        {"sqlite": """
+            CREATE TRIGGER IF NOT EXISTS trg_meals_changes_upd AFTER UPDATE ON meals
+            BEGIN
+                INSERT INTO meal_changes (meal_id, op)
+                SELECT OLD.id, 'delete' WHERE OLD.id IS NOT NEW.id;
+                INSERT INTO meal_changes (meal_id, op) VALUES (NEW.id, 'upsert');
+            END
+        """, "postgresql": "DROP TRIGGER IF EXISTS trg_meals_changes ON meals"},
+        {"sqlite": """
+            CREATE TRIGGER IF NOT EXISTS trg_meals_changes_del AFTER DELETE ON meals
+            BEGIN
+                INSERT INTO meal_changes (meal_id, op) VALUES (OLD.id, 'delete');
+            END
+        """, "postgresql": """
+            CREATE TRIGGER trg_meals_changes AFTER INSERT OR UPDATE OR DELETE ON meals
+            FOR EACH ROW EXECUTE FUNCTION meal_changes_log()
+        """},
+    )),
+    Migration(5, "track_unique_day", (
+        # POST /v1/track upserts one row per (user_id, date); keep the newest of any duplicates
+        """
+        DELETE FROM track
+        WHERE id NOT IN (SELECT MAX(id) FROM track GROUP BY user_id, date)
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_track_user_date_unique ON track(user_id, date)",
+        "DROP INDEX IF EXISTS idx_track_user_date",
+        AddColumn("track", "updated_at", "TEXT"),
+    )),
+    Migration(6, "nutrient_reference", (
+        # per 100 g, keyed by FoodData Central id (nutrition.py)
+        """
+        CREATE TABLE IF NOT EXISTS nutrient_ref (
+            fdc_id     INTEGER PRIMARY KEY,
+            label      TEXT,
+            kcal       REAL NOT NULL,
+            protein_g  REAL NOT NULL,
+            carbs_g    REAL NOT NULL,
+            fat_g      REAL NOT NULL,
+            source     TEXT NOT NULL DEFAULT 'derived' CHECK (source IN ('derived', 'manual')),
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # normalised ingredient → the fdc_id to use instead of whatever the blob resolved it to
+        """
+        CREATE TABLE IF NOT EXISTS ingredient_fdc_override (
+            ingredient TEXT PRIMARY KEY,
+            fdc_id     INTEGER NOT NULL,
+            note       TEXT,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    )),
+    Migration(7, "catalog_price_applied", (
+        # the catalog_items price each meal's price_json currently reflects (pricing.py)
+        """
+        CREATE TABLE IF NOT EXISTS catalog_price_applied (
+            catalog_id     INTEGER PRIMARY KEY,
+            price_per_pack REAL NOT NULL,
+            pack_amount    REAL NOT NULL,
+            applied_at     TEXT NOT NULL
+        )
+        """,
+    )),
+    Migration(8, "basket_source_versions", (
+        # what a stored basket was built from; load_basket() serves it only while both still match
+        AddColumn("baskets", "plan_version", "INTEGER"),
+        AddColumn("baskets", "catalog_version", "INTEGER"),
+    )),
+    Migration(9, "meal_changes_catalog_columns", (
+        # log UPDATEs only when a CATALOG_COLUMNS value actually changed
+        {"sqlite": "DROP TRIGGER IF EXISTS trg_meals_changes_upd",
+         "postgresql": "DROP TRIGGER IF EXISTS trg_meals_changes ON meals"},
+        {"sqlite": f"""
+            CREATE TRIGGER IF NOT EXISTS trg_meals_changes_upd
+            AFTER UPDATE OF {", ".join(CATALOG_COLUMNS)} ON meals
+            WHEN {_CHANGED}
+            BEGIN
+                INSERT INTO meal_changes (meal_id, op)
+                SELECT OLD.id, 'delete' WHERE OLD.id IS NOT NEW.id;
+                INSERT INTO meal_changes (meal_id, op) VALUES (NEW.id, 'upsert');
+            END
+        """, "postgresql": """
+            CREATE TRIGGER trg_meals_changes AFTER INSERT OR DELETE ON meals
+            FOR EACH ROW EXECUTE FUNCTION meal_changes_log()
+        """},
+        {"postgresql": f"""
+            CREATE TRIGGER trg_meals_changes_upd
+            AFTER UPDATE OF {", ".join(CATALOG_COLUMNS)} ON meals
+            FOR EACH ROW WHEN ({_CHANGED_PG})
+            EXECUTE FUNCTION meal_changes_log()
+        """},
+    )),
+    Migration(10, "meals_embedding_bytes", (
+        # embeddings.py stores packed float32 bytes; SQLite's TEXT affinity keeps a BLOB as-is,
+        # Postgres needs BYTEA. A TEXT column there never held a valid vector: rerun embeddings.py
+        {"postgresql": "ALTER TABLE meals ALTER COLUMN embedding TYPE BYTEA USING NULL"},
+    )),
+]
+
+
+# ---------- runner ----------
+def _ensure_table(conn) -> None:
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version    INTEGER PRIMARY KEY,
+            name       TEXT NOT NULL,
+            checksum   TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+    """)
+
+
+def _lock(conn) -> None:
+    """Serialise concurrent upgrades (several API instances starting at once)."""
+    if db.is_sqlite(conn):
+        # any write takes SQLite's RESERVED lock for the rest of the transaction
+        conn.exec_driver_sql("UPDATE schema_migrations SET version = version WHERE 0")
+    else:
+        conn.exec_driver_sql("SELECT pg_advisory_xact_lock(7262301)")
+
+
+def applied(conn) -> Dict[int, Tuple[str, str]]:
+    """version → (name, checksum) as recorded in the database."""
+    if not sa.inspect(conn).has_table("schema_migrations"):
+        return {}
+    return {int(v): (str(n), str(c)) for v, n, c in conn.execute(
+        sa.text("SELECT version, name, checksum FROM schema_migrations ORDER BY version")
+    )}
+
+
+def mismatched(conn) -> List[Migration]:
+    done = applied(conn)
+    return [m for m in MIGRATIONS if m.version in done and done[m.version][1] != m.checksum]
+
+
+def pending(conn) -> List[Migration]:
+    done = applied(conn)
+    return [m for m in MIGRATIONS if m.version not in done]
+
+
+def _apply_step(conn, step: Step) -> None:
+    if isinstance(step, AddColumn):
+        if step.column not in db.column_names(conn, step.table):
+            conn.exec_driver_sql(f"ALTER TABLE {step.table} ADD COLUMN {step.column} {step.decl}")
+        return
+    if isinstance(step, dict):
+        step = step.get(db.dialect(conn))
+        if step is None:
+            return
+    conn.exec_driver_sql(_sql(step))
+
+
+def upgrade(conn, target: Optional[int] = None) -> List[int]:
+    """Apply pending migrations up to `target` (default: all). Caller holds the transaction."""
+    _ensure_table(conn)
+    _lock(conn)
+    bad = mismatched(conn)
+    if bad:
+        raise MigrationError(
+            "applied migrations changed since they ran: "
+            + ", ".join(f"{m.version:04d}_{m.name}" for m in bad)
+        )
+    done = []
+    for m in pending(conn):
+        if target is not None and m.version > target:
+            break
+        for step in m.steps:
+            _apply_step(conn, step)
+        conn.execute(sa.text("""
+            INSERT INTO schema_migrations (version, name, checksum, applied_at)
+            VALUES (:v, :n, :c, :t)
+        """), {"v": m.version, "n": m.name, "c": m.checksum,
+               "t": dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds")})
+        done.append(m.version)
+    if done:
+        db.forget_tables()
+    return done
+
+
+def migrate(db_url: Optional[str] = None) -> List[int]:
+    """upgrade() in its own engine + transaction, for scripts."""
+    engine = db.make_engine(db_url or db.database_url())
+    try:
+        with engine.begin() as conn:
+            return upgrade(conn)
+    finally:
+        engine.dispose()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Apply / check schema migrations.")
+    ap.add_argument("--db", help="Path to a SQLite DB (default: $DATABASE_URL, else $DB_PATH)")
+    ap.add_argument("command", nargs="?", default="status", choices=["status", "upgrade", "verify"])
+    ap.add_argument("--to", type=int, help="upgrade: stop after this version")
+    args = ap.parse_args()
+
+    engine = db.make_engine(db.database_url(args.db))
+    print(f"🗄️  {engine.url!r}")
+    if args.command == "upgrade":
+        try:
+            with engine.begin() as conn:
+                done = upgrade(conn, args.to)
+        except MigrationError as e:
+            print(f"❌ {e}", file=sys.stderr)
+            sys.exit(1)
+        print(f"✅ applied {len(done)} migration(s): {done}" if done else "ℹ️ already up to date")
+        return
+
+    with engine.connect() as conn:
+        done = applied(conn)
+        bad = {m.version for m in mismatched(conn)}
+        todo = pending(conn)
+    known = {m.version for m in MIGRATIONS}
+    for m in MIGRATIONS:
+        mark = "❌ checksum changed" if m.version in bad else ("✅" if m.version in done else "⏳ pending")
+        print(f"  {m.version:04d}_{m.name:<24} {mark}")
+    for v in sorted(set(done) - known):
+        print(f"  {v:04d}_{done[v][0]:<24} ⚠️ applied, but not in this code (database is ahead)")
+    if args.command == "verify" and (bad or todo):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
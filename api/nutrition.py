@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Catalog-wide nutrition recompute from per-ingredient grams + a local reference.
+
+meals.nutrition_json.by_ingredient holds, per ingredient, grams_est and the
+FoodData Central id (fdcId) it was resolved to. This job:
+
+- keeps `nutrient_ref` (per-100 g kcal/protein/carbs/fat by fdc_id); ids it
+  hasn't seen are derived from the blobs themselves (value / grams × 100,
+  median over the catalog). Rows entered with --set-ref are 'manual' and never
+  re-derived.
+- applies `ingredient_fdc_override` (normalised ingredient → fdc_id), so a bad
+  resolution such as salt → "Pecans, salted" is fixed once for every recipe.
+- builds the meal × entry grams matrix CSR-style (meal_ptr + flat fdc column +
+  grams, as ingredient_index.py does) and re-derives entries with one
+  gather-multiply (grams × ref[fdc] / 100) and a bincount per nutrient. Only
+  entries whose fdc id an override changed, or whose reference row is
+  'manual', are re-derived; the rest keep their stored values, so a first run
+  against the median-derived reference rewrites nothing.
+- writes back only the meals whose fdc ids changed or whose totals moved by
+  more than TOLERANCE: nutrition_json (entries + totals) and cals/proteins/
+  carbs/fats, in one transaction. The meals trigger logs each one to
+  meal_changes, so sync clients and the next catalog bundle pick them up.
+
+API processes cache nutrition in meal_features; restart them after a write.
+
+Usage:
+  python nutrition.py                                   # recompute, write what changed
+  python nutrition.py --dry-run                         # report only
+  python nutrition.py --suspects                        # ingredients whose fdc label shares no word with them
+  python nutrition.py --set-ref 173468 "Salt, table" 0 0 0 0
+  python nutrition.py --override salt=173468            # then recompute (same run)
+  python nutrition.py --db /path/to/scranly.db
+"""
+
+import argparse, json, os, re, sys, time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import sqlalchemy as sa
+
+import db
+import migrations
+from catalog_matcher import _singular, normalise_ingredient
+
+NUTRIENTS = ("kcal", "protein_g", "carbs_g", "fat_g")
+MEAL_COLS = ("cals", "proteins", "carbs", "fats")
+ROUND = (1, 2, 2, 2)                         # decimals the blobs use per nutrient
+TOLERANCE = np.array([1.0, 0.1, 0.1, 0.1])   # totals closer than this count as unchanged
+NO_FDC = -1
+
+_WORD_RE = re.compile(r"[a-z]+")
+
+
+@dataclass
+class NutritionMatrix:
+    ids: List[str]              # meal ids, row order
+    blobs: List[dict]           # parsed nutrition_json per meal
+    meal_ptr: np.ndarray        # int64, len(ids) + 1
+    meal_of: np.ndarray         # int32, owning meal row of each entry
+    keys: List[str]             # normalised ingredient per entry
+    fdc: np.ndarray             # int64, fdcId per entry as stored (NO_FDC if none)
+    grams: np.ndarray           # float64, grams_est per entry
+    stored: np.ndarray          # float64 (entries, 4), the blob's per-entry values
+    totals: np.ndarray          # float64 (meals, 4), the blob's totals
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+def _num(v) -> float:
+    try:
+        return float(v or 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def load_matrix(conn) -> NutritionMatrix:
+    ids, blobs, ptr, keys, fdc, grams, stored, totals = [], [], [0], [], [], [], [], []
+    for mid, raw in conn.execute(sa.text(
+        "SELECT CAST(id AS TEXT), nutrition_json FROM meals WHERE nutrition_json IS NOT NULL ORDER BY id"
+    )):
+        try:
+            blob = json.loads(raw)
+        except (TypeError, ValueError):
+            continue
+        parts = blob.get("by_ingredient") if isinstance(blob, dict) else None
+        if not isinstance(parts, list):
+            continue
+        parts = [p for p in parts if isinstance(p, dict)]
+        ids.append(str(mid))
+        blobs.append(blob)
+        for p in parts:
+            keys.append(normalise_ingredient(str(p.get("ingredient") or "")))
+            fdc.append(int(p["fdcId"]) if p.get("fdcId") is not None else NO_FDC)
+            grams.append(_num(p.get("grams_est")))
+            stored.append([_num(p.get(n)) for n in NUTRIENTS])
+        ptr.append(len(keys))
+        t = blob.get("totals") if isinstance(blob.get("totals"), dict) else {}
+        totals.append([_num(t.get(n)) for n in NUTRIENTS])
+    meal_ptr = np.asarray(ptr, dtype=np.int64)
+    return NutritionMatrix(
+        ids=ids, blobs=blobs, meal_ptr=meal_ptr,
+        meal_of=np.repeat(np.arange(len(ids), dtype=np.int32), np.diff(meal_ptr)),
+        keys=keys, fdc=np.asarray(fdc, dtype=np.int64), grams=np.asarray(grams, dtype=np.float64),
+        stored=np.asarray(stored, dtype=np.float64).reshape(-1, 4),
+        totals=np.asarray(totals, dtype=np.float64).reshape(-1, 4),
+    )
+
+
+# ---------- reference + overrides ----------
+def labels_from_blobs(m: NutritionMatrix) -> Dict[int, str]:
+    out: Dict[int, str] = {}
+    for b in m.blobs:
+        for p in b["by_ingredient"]:
+            if isinstance(p, dict) and p.get("fdcId") is not None and p.get("fdcLabel"):
+                out.setdefault(int(p["fdcId"]), str(p["fdcLabel"]))
+    return out
+
+
+def derive_reference(m: NutritionMatrix) -> Dict[int, Tuple[float, float, float, float]]:
+    """fdc_id → per-100 g values implied by the blobs (median over every entry that uses it)."""
+    ok = (m.fdc != NO_FDC) & (m.grams > 0)
+    fdc, per100 = m.fdc[ok], m.stored[ok] / m.grams[ok, None] * 100.0
+    order = np.argsort(fdc, kind="stable")
+    fdc, per100 = fdc[order], per100[order]
+    uniq, starts = np.unique(fdc, return_index=True)
+    return {int(f): tuple(float(x) for x in np.median(grp, axis=0))
+            for f, grp in zip(uniq, np.split(per100, starts[1:]))}
+
+
+def load_reference(conn) -> Dict[int, Tuple[str, str, Tuple[float, float, float, float]]]:
+    """fdc_id → (label, source, per-100 g values)."""
+    return {int(r[0]): (r[1] or "", r[2], (float(r[3]), float(r[4]), float(r[5]), float(r[6])))
+            for r in conn.execute(sa.text(
+                "SELECT fdc_id, label, source, kcal, protein_g, carbs_g, fat_g FROM nutrient_ref"))}
+
+
+def seed_reference(conn, m: NutritionMatrix) -> int:
+    """Add derived rows for fdc ids the table doesn't have yet; existing rows are kept."""
+    have = {int(r[0]) for r in conn.execute(sa.text("SELECT fdc_id FROM nutrient_ref"))}
+    labels = labels_from_blobs(m)
+    rows = [{"fdc_id": f, "label": labels.get(f), "source": "derived",
+             **{n: round(v, 4) for n, v in zip(NUTRIENTS, vals)}}
+            for f, vals in derive_reference(m).items() if f not in have]
+    if rows:
+        conn.execute(sa.text("""
+            INSERT INTO nutrient_ref (fdc_id, label, kcal, protein_g, carbs_g, fat_g, source)
+            VALUES (:fdc_id, :label, :kcal, :protein_g, :carbs_g, :fat_g, :source)
+        """), rows)
+    return len(rows)
+
+
+def load_overrides(conn) -> Dict[str, int]:
+    return {str(k): int(f) for k, f in conn.execute(sa.text("SELECT ingredient, fdc_id FROM ingredient_fdc_override"))}
+
+
+# ---------- recompute ----------
+@dataclass
+class Recompute:
+    fdc: np.ndarray             # int64 per entry after overrides
+    values: np.ndarray          # float64 (entries, 4), rounded
+    totals: np.ndarray          # float64 (meals, 4), rounded
+    changed: np.ndarray         # bool per meal
+
+
+def recompute(m: NutritionMatrix, ref: Dict[int, Tuple[str, str, Tuple[float, ...]]],
+              overrides: Dict[str, int]) -> Recompute:
+    fdc = m.fdc.copy()
+    if overrides:
+        keys = np.asarray(m.keys, dtype=object)
+        for ing, f in overrides.items():
+            fdc[keys == ing] = f
+    # reference as a dense (n_ref + 1, 4) table; the extra zero row is "no data"
+    ref_ids = np.asarray(sorted(ref), dtype=np.int64)
+    table = np.zeros((len(ref_ids) + 1, 4), dtype=np.float64)
+    pos = np.searchsorted(ref_ids, fdc)
+    found = np.zeros(len(fdc), dtype=bool)
+    if len(ref_ids):
+        table[:-1] = [ref[int(f)][2] for f in ref_ids]
+        found = ref_ids[np.minimum(pos, len(ref_ids) - 1)] == fdc
+    col = np.where(found, pos, len(ref_ids))
+    manual = np.asarray([ref[int(f)][1] == "manual" for f in ref_ids] + [False], dtype=bool)[col]
+
+    # the whole catalog: grams (entries) × per-gram nutrients in one gather-multiply
+    values = m.grams[:, None] * table[col] / 100.0
+    # only entries whose fdc id moved (an override) or whose reference is manual are
+    # re-derived; the rest keep the blob's values, so a median 'derived' row that is
+    # a hair off an entry doesn't rewrite the meal. Unresolvable entries keep theirs too.
+    redo = found & (m.grams > 0) & ((fdc != m.fdc) | manual)
+    values[~redo] = m.stored[~redo]
+    values = np.column_stack([np.round(values[:, k], d) for k, d in enumerate(ROUND)])
+    # stored totals plus what the re-derived entries moved, so untouched meals keep theirs exactly
+    delta = np.where(redo[:, None], values - m.stored, 0.0)
+    totals = np.column_stack([np.round(m.totals[:, k] + np.bincount(m.meal_of, delta[:, k], minlength=len(m)), d)
+                              for k, d in enumerate(ROUND)])
+
+    moved = (np.abs(totals - m.totals) > TOLERANCE).any(axis=1)
+    remapped = np.bincount(m.meal_of, (fdc != m.fdc).astype(np.float64), minlength=len(m)) > 0
+    return Recompute(fdc=fdc, values=values, totals=totals, changed=moved | remapped)
+
+
+def updated_rows(m: NutritionMatrix, r: Recompute, ref) -> List[dict]:
+    """UPDATE params for the changed meals: rewritten nutrition_json + the four columns."""
+    out = []
+    for i in np.flatnonzero(r.changed):
+        blob = dict(m.blobs[i])
+        parts = []
+        for j, p in zip(range(m.meal_ptr[i], m.meal_ptr[i + 1]), (p for p in blob["by_ingredient"] if isinstance(p, dict))):
+            p = dict(p)
+            f = int(r.fdc[j])
+            if f != NO_FDC:
+                p["fdcId"] = f
+                if f in ref and ref[f][0]:
+                    p["fdcLabel"] = ref[f][0]
+            p.update({n: float(v) for n, v in zip(NUTRIENTS, r.values[j])})
+            parts.append(p)
+        blob["by_ingredient"] = parts
+        blob["totals"] = {n: float(v) for n, v in zip(NUTRIENTS, r.totals[i])}
+        out.append({"id": m.ids[i], "nj": json.dumps(blob, ensure_ascii=False),
+                    **{c: round(float(v), 2) for c, v in zip(MEAL_COLS, r.totals[i])}})
+    return out
+
+
+def write(conn, rows: List[dict]) -> None:
+    if rows:
+        conn.execute(sa.text("""
+            UPDATE meals SET nutrition_json = :nj, cals = :cals, proteins = :proteins, carbs = :carbs, fats = :fats
+            WHERE id = :id
+        """), rows)
+
+
+def suspects(m: NutritionMatrix, limit: int = 30) -> List[Tuple[str, str, int]]:
+    """(ingredient, fdc label, uses) where the label shares no word with the ingredient."""
+    labels = labels_from_blobs(m)
+    seen: Counter = Counter()
+    for key, f in zip(m.keys, m.fdc.tolist()):
+        if f == NO_FDC or not key:
+            continue
+        words = {_singular(w) for w in _WORD_RE.findall(key)}
+        label = labels.get(f, "")
+        if not words & {_singular(w) for w in _WORD_RE.findall(label.lower())}:
+            seen[(key, label)] += 1
+    return [(k, lab, n) for (k, lab), n in seen.most_common(limit)]
+
+
+# ---------- CLI ----------
+def main():
+    ap = argparse.ArgumentParser(description="Recompute meals' nutrition from grams × a local fdc reference.")
+    ap.add_argument("--db", help="Path to a SQLite DB (default: $DATABASE_URL, else $DB_PATH)")
+    ap.add_argument("--dry-run", action="store_true", help="Report what would change; no DB writes")
+    ap.add_argument("--suspects", action="store_true", help="List ingredient → fdc label pairs with no word in common")
+    ap.add_argument("--set-ref", nargs=6, metavar=("FDC_ID", "LABEL", "KCAL", "PROTEIN", "CARBS", "FAT"),
+                    help="Add/replace a manual per-100 g reference row")
+    ap.add_argument("--override", action="append", default=[], metavar="INGREDIENT=FDC_ID",
+                    help="Map a (normalised) ingredient to an fdc id; FDC_ID 'none' removes the override")
+    args = ap.parse_args()
+
+    if args.db and not os.path.exists(args.db):
+        print(f"❌ DB not found: {args.db}", file=sys.stderr)
+        sys.exit(1)
+    engine = db.make_engine(db.database_url(args.db))
+    try:
+        with engine.connect() as conn:   # committed at the end unless --dry-run / --suspects
+            migrations.upgrade(conn)     # nutrient_ref / ingredient_fdc_override
+            t0 = time.perf_counter()
+            m = load_matrix(conn)
+            print(f"🧬 {len(m)} meals, {len(m.keys)} ingredient entries, "
+                  f"{len(set(m.fdc.tolist()) - {NO_FDC})} fdc ids in {time.perf_counter() - t0:.2f}s")
+
+            if args.suspects:
+                for key, label, n in suspects(m):
+                    print(f"   • {key!r} → {label!r} ×{n}")
+                return
+
+            seeded = seed_reference(conn, m)
+            if seeded:
+                print(f"📚 Derived {seeded} nutrient_ref rows from the blobs")
+            if args.set_ref:
+                f, label, *vals = args.set_ref
+                db.upsert(conn, "nutrient_ref", [{
+                    "fdc_id": int(f), "label": label, "source": "manual",
+                    **{n: float(v) for n, v in zip(NUTRIENTS, vals)},
+                }], key=("fdc_id",))
+                print(f"📚 nutrient_ref {f} = {label!r} {vals} per 100 g (manual)")
+
+            ref = load_reference(conn)
+            for spec in args.override:
+                ing, _, f = spec.partition("=")
+                key = normalise_ingredient(ing)
+                if f.strip().lower() == "none":
+                    conn.execute(sa.text("DELETE FROM ingredient_fdc_override WHERE ingredient = :i"), {"i": key})
+                    print(f"🔁 override {key!r} removed")
+                    continue
+                if not key or not f.strip().isdigit():
+                    print(f"❌ --override wants INGREDIENT=FDC_ID, got {spec!r}", file=sys.stderr)
+                    sys.exit(2)
+                if int(f) not in ref:
+                    print(f"❌ fdc {f} is not in nutrient_ref; add it with --set-ref first", file=sys.stderr)
+                    sys.exit(2)
+                db.upsert(conn, "ingredient_fdc_override", [{"ingredient": key, "fdc_id": int(f)}],
+                          key=("ingredient",))
+                print(f"🔁 override {key!r} → {f} ({ref[int(f)][0]})")
+            overrides = {k: f for k, f in load_overrides(conn).items() if f in ref}
+
+            t0 = time.perf_counter()
+            r = recompute(m, ref, overrides)
+            rows = updated_rows(m, r, ref)
+            print(f"🧮 Recomputed {len(m)} meals with {len(overrides)} override(s) in "
+                  f"{time.perf_counter() - t0:.3f}s → {len(rows)} changed")
+            for row in rows[:10]:
+                i = m.ids.index(row["id"])
+                print(f"   • {row['id']}: kcal {m.totals[i][0]:.1f} → {r.totals[i][0]:.1f}")
+
+            if args.dry_run:
+                print("ℹ️ dry run: nothing written")
+                return
+            write(conn, rows)
+            conn.commit()
+            if rows:
+                print(f"💾 Updated {len(rows)} meals (nutrition_json + cals/proteins/carbs/fats)")
+    finally:
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
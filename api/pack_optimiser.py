@@ -0,0 +1,259 @@
+# pack_optimiser.py
+"""
+Cheapest-pack stage for baskets.
+
+Weekly needs are aggregated per catalog product (in the product's pack_unit) and
+covered with the cheapest combination of the product's pack sizes. A "product" is
+every catalog_items row whose name normalises to the same key, so "Rice" and
+"Rice (2kg)" are two pack sizes of one product.
+
+The solver is an unbounded covering knapsack (min cost s.t. Σ count·amount ≥ need).
+When the pack sizes share a step that puts need within MAX_STEPS of them, an exact
+DP over that axis solves it; otherwise a branch and bound over pack counts does
+(small for realistic needs: a handful of sizes, tens of packs). Both are exact;
+the search only settles for its best cover so far if it runs past MAX_NODES.
+"""
+
+import math, re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import sqlalchemy as sa
+
+from catalog_matcher import normalise_ingredient
+
+MAX_STEPS = 2000       # longest exact DP axis
+STEP_SCALE = 1000      # pack sizes are compared to 1/1000 of a unit
+MAX_NODES = 200_000    # branch-and-bound budget when the DP axis would be longer
+
+# everything is converted to the catalog's units: grams | milliliters | count
+_TO_BASE = {
+    "g": (1.0, "grams"), "gram": (1.0, "grams"), "grams": (1.0, "grams"),
+    "kg": (1000.0, "grams"), "oz": (28.35, "grams"), "lb": (453.6, "grams"), "lbs": (453.6, "grams"),
+    "ml": (1.0, "milliliters"), "l": (1000.0, "milliliters"),
+    "tbsp": (15.0, "milliliters"), "tablespoon": (15.0, "milliliters"), "tablespoons": (15.0, "milliliters"),
+    "tsp": (5.0, "milliliters"), "teaspoon": (5.0, "milliliters"), "teaspoons": (5.0, "milliliters"),
+    "cup": (240.0, "milliliters"), "cups": (240.0, "milliliters"),
+    "pinch": (0.5, "grams"), "dash": (0.5, "milliliters"),
+    "handful": (30.0, "grams"), "squeeze": (5.0, "milliliters"),
+}
+_FRACTIONS = {"½": 0.5, "¼": 0.25, "¾": 0.75, "⅓": 1 / 3, "⅔": 2 / 3}
+_NUM_RE = re.compile(r"(\d+(?:\.\d+)?)(?:\s*/\s*(\d+))?")
+
+
+def parse_quantity(qty: str) -> Tuple[float, str]:
+    """
+    "2 tablespoons" → (30.0, "milliliters"), "1 can (400 ml)" → (400.0, "milliliters"),
+    "2 x 200 g" → (400.0, "grams"), "6" / "" → (6.0 / 1.0, "count").
+    """
+    s = (qty or "").lower().strip()
+    for sym, v in _FRACTIONS.items():
+        s = s.replace(sym, f" {v} ")
+
+    # a size in brackets wins: "1 can (400 g)" is 400 g
+    inner = re.search(r"\(([^)]*)\)", s)
+    if inner:
+        amt, unit = parse_quantity(inner.group(1))
+        if unit != "count":
+            mult = _leading_number(s[:inner.start()]) or 1.0
+            return amt * mult, unit
+        s = s[:inner.start()] + s[inner.end():]
+
+    total, unit = 1.0, "count"
+    nums = [(float(a) / float(b)) if b else float(a) for a, b in _NUM_RE.findall(s)]
+    if nums:
+        total = math.prod(nums) if " x " in f" {s} " else nums[0]
+    for word in re.findall(r"[a-z]+", s):
+        if word in _TO_BASE:
+            factor, unit = _TO_BASE[word]
+            total *= factor
+            break
+    return total, unit
+
+
+def _leading_number(s: str) -> Optional[float]:
+    m = _NUM_RE.search(s)
+    if not m:
+        return None
+    a, b = m.groups()
+    return float(a) / float(b) if b else float(a)
+
+
+def convert(amount: float, unit: str, pack_unit: str) -> Optional[float]:
+    """amount in `unit` expressed in `pack_unit`; ml↔g are treated as 1:1. None if incompatible."""
+    if unit == pack_unit:
+        return amount
+    if {unit, pack_unit} == {"grams", "milliliters"}:
+        return amount
+    return None
+
+
+@dataclass
+class PackOption:
+    catalog_id: int
+    name: str
+    aisle: str
+    emoji: str
+    pack_amount: float
+    pack_unit: str
+    price_per_pack: float
+    size_label: str
+
+
+@dataclass
+class PackCatalog:
+    """product key → pack options, plus normalised ingredient → product key."""
+    products: Dict[str, List[PackOption]] = field(default_factory=dict)
+    ingredients: Dict[str, str] = field(default_factory=dict)
+
+    def product_for(self, ingredient: str) -> Optional[str]:
+        key = normalise_ingredient(ingredient)
+        if key in self.ingredients:
+            return self.ingredients[key]
+        return key if key in self.products else None
+
+
+def load_pack_catalog(conn) -> PackCatalog:
+    """Reads catalog_items + ingredient_catalog_map (SQLAlchemy connection)."""
+    pc = PackCatalog()
+    product_of_id: Dict[int, str] = {}
+    for cid, name, aisle, emoji, amount, unit, price, label in conn.execute(sa.text("""
+        SELECT id, name, aisle, emoji, pack_amount, pack_unit, price_per_pack, size_label
+        FROM catalog_items
+        WHERE pack_amount > 0
+    """)):
+        key = normalise_ingredient(name)
+        product_of_id[int(cid)] = key
+        pc.products.setdefault(key, []).append(PackOption(
+            catalog_id=int(cid), name=str(name), aisle=str(aisle), emoji=str(emoji),
+            pack_amount=float(amount), pack_unit=str(unit), price_per_pack=float(price),
+            size_label=str(label or ""),
+        ))
+    for ingredient, cid in conn.execute(sa.text("SELECT ingredient, catalog_id FROM ingredient_catalog_map")):
+        if int(cid) in product_of_id:
+            pc.ingredients[str(ingredient)] = product_of_id[int(cid)]
+    return pc
+
+
+def cheapest_packs(need: float, options: List[PackOption]) -> Tuple[List[Tuple[PackOption, int]], float, float]:
+    """
+    Cheapest multiset of packs whose total amount covers `need`.
+    Returns ([(option, count), ...], cost, amount_bought).
+    """
+    if need <= 0 or not options:
+        return [], 0.0, 0.0
+    if len(options) == 1:
+        return _one_size(need, options)
+    step = _exact_step(options)
+    if step and need / step <= MAX_STEPS:
+        return _dp(need, options, step)
+    return _search(need, options)
+
+
+def _exact_step(options: List[PackOption]) -> float:
+    """gcd of the pack sizes (to 1/STEP_SCALE of a unit), or 0 if a size isn't on that grid."""
+    g = 0
+    for o in options:
+        scaled = round(o.pack_amount * STEP_SCALE)
+        if scaled <= 0 or abs(o.pack_amount * STEP_SCALE - scaled) > 1e-6:
+            return 0.0
+        g = math.gcd(g, scaled)
+    return g / STEP_SCALE
+
+
+def _dp(need: float, options: List[PackOption], step: float) -> Tuple[List[Tuple[PackOption, int]], float, float]:
+    """Exact DP: every pack is a whole number of steps, so covering ceil(need / step) steps is covering need."""
+    target = math.ceil(need / step - 1e-9)
+    sizes = [round(o.pack_amount / step) for o in options]
+    best = [0.0] + [math.inf] * target
+    pick = [-1] * (target + 1)
+    for x in range(1, target + 1):
+        bx, px = math.inf, -1
+        for i, size in enumerate(sizes):
+            c = best[max(0, x - size)] + options[i].price_per_pack
+            if c < bx:
+                bx, px = c, i
+        best[x], pick[x] = bx, px
+
+    counts = [0] * len(options)
+    x = target
+    while x > 0:
+        i = pick[x]
+        counts[i] += 1
+        x = max(0, x - sizes[i])
+    return _result(options, counts)
+
+
+def _search(need: float, options: List[PackOption]) -> Tuple[List[Tuple[PackOption, int]], float, float]:
+    """
+    Branch and bound over pack counts, biggest packs first, for sizes off a short
+    exact grid. A branch is cut when its cost plus the remaining need at the
+    cheapest remaining unit price can't beat the best cover so far (initially the
+    best single size). Stops after MAX_NODES nodes with the best cover found.
+    """
+    order = sorted(range(len(options)), key=lambda i: -options[i].pack_amount)
+    opts = [options[i] for i in order]
+    unit = [min(o.price_per_pack / o.pack_amount for o in opts[k:]) for k in range(len(opts))]
+    [(single, n)], best_cost, _ = _one_size(need, opts)
+    best_counts = [n if o is single else 0 for o in opts]
+    counts = [0] * len(opts)
+    nodes = 0
+
+    def go(k: int, left: float, cost: float) -> None:
+        nonlocal best_cost, best_counts, nodes
+        nodes += 1
+        if left <= 1e-9:
+            if cost < best_cost - 1e-9:
+                best_cost, best_counts = cost, counts[:]
+            return
+        if k == len(opts) or nodes > MAX_NODES or cost + left * unit[k] >= best_cost - 1e-9:
+            return
+        o = opts[k]
+        for c in range(math.ceil(left / o.pack_amount - 1e-9), -1, -1):
+            counts[k] = c
+            go(k + 1, left - c * o.pack_amount, cost + c * o.price_per_pack)
+        counts[k] = 0
+
+    go(0, need, 0.0)
+    by_option = [0] * len(options)
+    for k, i in enumerate(order):
+        by_option[i] = best_counts[k]
+    return _result(options, by_option)
+
+
+def _result(options: List[PackOption], counts: List[int]) -> Tuple[List[Tuple[PackOption, int]], float, float]:
+    chosen = [(options[i], n) for i, n in enumerate(counts) if n]
+    return chosen, sum(o.price_per_pack * n for o, n in chosen), sum(o.pack_amount * n for o, n in chosen)
+
+
+def _one_size(need: float, options: List[PackOption]) -> Tuple[List[Tuple[PackOption, int]], float, float]:
+    """Cheapest way to cover `need` with packs of a single size (always covers it)."""
+    o, n = min(((o, math.ceil(need / o.pack_amount - 1e-9)) for o in options),
+               key=lambda t: (t[1] * t[0].price_per_pack, t[1] * t[0].pack_amount))
+    return [(o, n)], n * o.price_per_pack, n * o.pack_amount
+
+
+def optimise_item(name: str, need: float, options: List[PackOption]) -> dict:
+    """Basket item (same shape as basket_builder's) for one product with its chosen packs."""
+    chosen, cost, bought = cheapest_packs(need, options)
+    main = max(chosen, key=lambda t: t[1])[0] if chosen else options[0]
+    return {
+        "name": name,
+        "need_amount": round(need, 2),
+        "need_unit": main.pack_unit,
+        "aisle": main.aisle,
+        "emoji": main.emoji,
+        "estimate": {
+            "price_per_pack": main.price_per_pack,
+            "pack_amount": main.pack_amount,
+            "pack_unit": main.pack_unit,
+            "size_label": main.size_label,
+        },
+        "packs": [
+            {"catalog_id": o.catalog_id, "size_label": o.size_label, "pack_amount": o.pack_amount,
+             "price_per_pack": o.price_per_pack, "count": n}
+            for o, n in chosen
+        ],
+        "cost": round(cost, 2),
+        "waste_amount": round(max(0.0, bought - need), 2),
+    }
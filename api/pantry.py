@@ -0,0 +1,116 @@
+# pantry.py
+"""
+"Cook with what I have": recipes ranked by how much of their shopping list the
+user already holds.
+
+Names are normalised (catalog_matcher.normalise_ingredient) and looked up in the
+IngredientIndex vocabulary; staples (salt, oil, …) are assumed to be on hand and
+don't count as required. A name with no exact vocabulary entry falls back to its
+catalog_matcher.SYNONYMS group ("scallions" → "green onion"), then to the vocabulary
+entries that narrow it down: same head noun ("rice" → "jasmine rice", "basmati rice")
+or a cut of it ("chicken" → "chicken breast", "chicken thigh"). Entries whose extra
+words make another product ("cauliflower rice", "rice vinegar", "chicken broth") are
+not expanded to. Scoring walks the posting lists of the held
+ingredients only — a meal no posting list reaches has coverage 0 and is never
+looked at — and the required count per meal is precomputed in the index, so no
+ingredients_json is parsed per request.
+
+    coverage = held non-staple ingredients / non-staple ingredients
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Set, Tuple
+
+import numpy as np
+
+from catalog_matcher import OTHER_PRODUCT, SYNONYMS, normalise_ingredient
+from ingredient_index import IngredientIndex
+
+
+@dataclass
+class PantryMatch:
+    meal_id: str
+    coverage: float           # share of required (non-staple) ingredients on hand
+    have: int
+    required: int
+    missing: List[str]        # normalised names still to buy
+
+
+# head nouns that are a cut of the word before them: "chicken" covers "chicken thigh"
+CUTS = {"breast", "thigh", "leg", "drumstick", "wing", "fillet", "mince", "steak", "loin",
+        "chop", "shoulder", "belly", "floret"}
+
+# normalised alias → every normalised name that shares its SYNONYMS target
+_SYNONYM_GROUPS: Dict[str, Set[str]] = {}
+for _alias, _target in SYNONYMS.items():
+    _group = _SYNONYM_GROUPS.setdefault(normalise_ingredient(_target), {normalise_ingredient(_target)})
+    _group.add(normalise_ingredient(_alias))
+    _SYNONYM_GROUPS[normalise_ingredient(_alias)] = _group
+
+
+def _narrower(key: str, vocab_words: List[Tuple[str, List[str]]]) -> List[str]:
+    """Vocabulary entries that are a kind ("jasmine rice") or a cut ("chicken breast") of key."""
+    words = key.split()
+    if not words:
+        return []
+    out = []
+    for name, nw in vocab_words:
+        if len(nw) <= len(words) or not set(words) <= set(nw) or (set(nw) - set(words)) & OTHER_PRODUCT:
+            continue
+        if nw[-1] == words[-1] or (nw[-1] in CUTS and nw[-2] == words[-1]):
+            out.append(name)
+    return out
+
+
+def resolve_pantry(idx: IngredientIndex, names: Sequence[str]) -> Tuple[List[int], List[str]]:
+    """
+    (ingredient ids of the non-staple names the index knows, names it doesn't know).
+    Exact vocabulary key first, then the SYNONYMS group, then narrower entries.
+    """
+    ids, unknown = [], []
+    vocab_words = None
+    for raw in names:
+        key = normalise_ingredient(str(raw))
+        if not key:
+            continue
+        found = [key] if key in idx.vocab else [n for n in _SYNONYM_GROUPS.get(key, ()) if n in idx.vocab]
+        if not found:
+            if vocab_words is None:
+                vocab_words = [(n, n.split()) for n in idx.vocab]
+            found = _narrower(key, vocab_words)
+        if not found:
+            unknown.append(key)
+        for n in found:
+            j = idx.vocab[n]
+            if not idx.staple[j] and j not in ids:
+                ids.append(j)
+    return ids, unknown
+
+
+def pantry_match(idx: IngredientIndex, have: Sequence[int], k: int = 20,
+                 min_coverage: float = 0.0) -> List[PantryMatch]:
+    """Top-k meals by coverage, then by ingredients used, then by fewest missing."""
+    if not have:
+        return []
+    held = idx.shared_counts(have)
+    rows = np.flatnonzero(held)
+    required = idx.meal_required[rows]
+    cov = held[rows] / np.maximum(required, 1)
+    keep = cov >= min_coverage
+    rows, required, cov = rows[keep], required[keep], cov[keep]
+    order = np.lexsort((required - held[rows], -held[rows], -cov))[:k]
+
+    mask = np.zeros(len(idx.names), dtype=bool)
+    mask[list(have)] = True
+    out: List[PantryMatch] = []
+    for i in order:
+        r = int(rows[i])
+        need = idx.shopping_ingredients_of(r)
+        out.append(PantryMatch(
+            meal_id=idx.ids[r],
+            coverage=round(float(cov[i]), 4),
+            have=int(held[r]),
+            required=int(required[i]),
+            missing=[idx.names[j] for j in need[~mask[need]]],
+        ))
+    return out
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+Weekly meal-plan generator.
+
+generate_plan() builds a days × (breakfast, lunch, dinner) grid for one user:
+  - candidates per slot: right meal_type, none of the user's allergens, under the
+    slot's time cap (falls back to any meal_type if a slot has too few)
+  - each slot keeps a pool of its POOL_SIZE best meals by ranking.score_catalog
+  - start from a round-robin fill of the pools, then local search: for one grid
+    cell at a time, every pool candidate is costed in one vectorised pass
+    (daily kcal vs goal, macro energy-share bounds, repeats, new shopping
+    ingredients, preference) and the best improving swap is applied; random
+    kicks once a sweep stops improving, until the time budget runs out
+  - save_plan() writes it through plan_store (plans + plans_by_date, one transaction)
+
+API: POST /v1/plans/generate. Batch (this script) builds plans for many users in a
+process pool — features and the ingredient index are loaded once per worker —
+and writes them in batched transactions.
+
+Usage:
+  python plan_generator.py --users testing u2 u3 --start-date 2025-10-12
+  python plan_generator.py --all-users --workers 8
+  python plan_generator.py --all-users --dry-run
+"""
+
+import argparse, os, sys, time, zlib
+import datetime as dt
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import sqlalchemy as sa
+
+import db
+import migrations
+from basket_builder import sunday_of_week
+from ingredient_index import IngredientIndex, load_ingredient_index
+from meal_features import MealFeatures, load_meal_features
+from plan_store import SLOTS, create_plan
+from ranking import UserProfile, load_profile, score_catalog, RECENT_DAYS
+
+
+SLOT_SHARE = np.array([0.25, 0.35, 0.40])   # of the daily calorie goal, used to seed pools
+DEFAULT_KCAL = 2000.0
+
+POOL_SIZE = 200      # candidates kept per slot
+BUDGET_MS = 50.0
+KICK_CELLS = 3       # cells re-randomised per kick once a sweep stops improving
+
+# cost weights (lower total cost is better)
+W_KCAL = 1.0         # per day, × relative deviation from the goal
+W_MACRO = 1.0        # per day, × energy-share outside the bounds
+W_REPEAT = 0.5       # per extra use of a meal already in the plan
+W_INGREDIENT = 0.02  # per distinct shopping ingredient (reuse → smaller basket)
+W_PREF = 0.2         # × ranking score
+
+
+@dataclass
+class MacroBounds:
+    """Share of daily energy. Soft: violations are penalised, not rejected."""
+    protein_min: float = 0.12
+    carbs_max: float = 0.65
+    fat_max: float = 0.55
+
+
+@dataclass
+class PlanSpec:
+    start_date: dt.date
+    days: int = 7
+    slot_max_minutes: Dict[str, Optional[int]] = field(default_factory=dict)
+    macros: MacroBounds = field(default_factory=MacroBounds)
+    budget_ms: float = BUDGET_MS
+
+
+@dataclass
+class GeneratedPlan:
+    user_id: str
+    start_date: dt.date
+    grid: List[List[str]]        # grid[day][slot] → meal_id
+    cost: float
+    stats: Dict[str, float]
+
+    @property
+    def end_date(self) -> dt.date:
+        return self.start_date + dt.timedelta(days=len(self.grid) - 1)
+
+
+class PlanError(ValueError):
+    pass
+
+
+def slot_candidates(f: MealFeatures, safe: np.ndarray, slot: str, cap: Optional[int] = None,
+                    need: int = 1) -> np.ndarray:
+    """Rows eligible for a slot: safe, under the time cap, of the slot's meal_type (any type if < need)."""
+    ok = safe & np.isfinite(f.cals)
+    if cap:
+        ok &= (f.minutes > 0) & (f.minutes <= cap)
+    code = f.meal_types.index(slot) if slot in f.meal_types else -1
+    typed = ok & (f.meal_type == code)
+    return np.flatnonzero(typed if typed.sum() >= need else ok)
+
+
+def day_cost(kcal, prot, carb, fat, goal: float, m: MacroBounds):
+    """Vectorised: relative kcal miss + macro energy-share violations for whole days."""
+    energy = np.maximum(4 * prot + 4 * carb + 9 * fat, 1.0)
+    macro = (np.maximum(0.0, m.protein_min - 4 * prot / energy)
+             + np.maximum(0.0, 4 * carb / energy - m.carbs_max)
+             + np.maximum(0.0, 9 * fat / energy - m.fat_max))
+    return W_KCAL * np.abs(kcal - goal) / goal + W_MACRO * macro
+
+
+class _Pool:
+    """One slot's candidates with their nutrient columns and shopping-ingredient CSR."""
+
+    def __init__(self, rows: np.ndarray, f: MealFeatures, idx: IngredientIndex, pref: np.ndarray):
+        self.rows = rows
+        self.kcal = f.cals[rows].astype(np.float64)
+        self.prot = f.protein[rows].astype(np.float64)
+        self.carb = f.carbs[rows].astype(np.float64)
+        self.fat = f.fat[rows].astype(np.float64)
+        self.pref = pref[rows].astype(np.float64)
+        ings = [idx.shopping_ingredients_of(int(r)) for r in rows]
+        self.ings = ings
+        self.flat = np.concatenate(ings) if ings else np.zeros(0, dtype=np.int32)
+        self.owner = np.repeat(np.arange(len(rows)), [len(a) for a in ings])
+
+
+class _Search:
+    """Grid state + incremental totals; cell_costs() prices every pool swap for one cell at once."""
+
+    def __init__(self, pools: List[_Pool], days: int, kcal_goal: float, macros: MacroBounds,
+                 n_meals: int, n_ings: int, rng: np.random.Generator):
+        self.pools, self.days, self.goal, self.m = pools, days, kcal_goal, macros
+        self.rng = rng
+        self.pos = np.zeros((days, len(SLOTS)), dtype=np.int64)   # index into the slot's pool
+        self.day = np.zeros((days, 4))                             # kcal, protein, carbs, fat
+        self.uses = np.zeros(n_meals, dtype=np.int32)
+        self.ing_count = np.zeros(n_ings, dtype=np.int32)
+        for s, p in enumerate(pools):
+            for d in range(days):
+                self._place(d, s, d % len(p.rows))
+
+    def _place(self, d: int, s: int, j: int) -> None:
+        p = self.pools[s]
+        self.pos[d, s] = j
+        self.day[d] += (p.kcal[j], p.prot[j], p.carb[j], p.fat[j])
+        self.uses[p.rows[j]] += 1
+        np.add.at(self.ing_count, p.ings[j], 1)
+
+    def _remove(self, d: int, s: int) -> None:
+        p, j = self.pools[s], self.pos[d, s]
+        self.day[d] -= (p.kcal[j], p.prot[j], p.carb[j], p.fat[j])
+        self.uses[p.rows[j]] -= 1
+        np.subtract.at(self.ing_count, p.ings[j], 1)
+
+    def _day_cost(self, kcal, prot, carb, fat):
+        return day_cost(kcal, prot, carb, fat, self.goal, self.m)
+
+    def cell_costs(self, d: int, s: int) -> np.ndarray:
+        """Cost contribution of each pool candidate in cell (d, s), given the rest of the grid."""
+        self._remove(d, s)
+        p = self.pools[s]
+        k, pr, c, ft = self.day[d]
+        cost = self._day_cost(k + p.kcal, pr + p.prot, c + p.carb, ft + p.fat)
+        cost += W_REPEAT * (self.uses[p.rows] > 0)
+        new_ings = self.ing_count[p.flat] == 0
+        cost += W_INGREDIENT * np.bincount(p.owner, weights=new_ings, minlength=len(p.rows))
+        cost -= W_PREF * p.pref
+        return cost
+
+    def total(self) -> float:
+        pref = sum(self.pools[s].pref[self.pos[d, s]] for d in range(self.days) for s in range(len(SLOTS)))
+        return float(self._day_cost(*self.day.T).sum()
+                     + W_REPEAT * np.maximum(0, self.uses - 1).sum()
+                     + W_INGREDIENT * np.count_nonzero(self.ing_count)
+                     - W_PREF * pref)
+
+    def sweep(self) -> bool:
+        improved = False
+        cells = [(d, s) for d in range(self.days) for s in range(len(SLOTS))]
+        for i in self.rng.permutation(len(cells)):
+            d, s = cells[i]
+            cur = self.pos[d, s]
+            costs = self.cell_costs(d, s)
+            best = int(np.argmin(costs))
+            if costs[best] < costs[cur] - 1e-9:
+                self._place(d, s, best)
+                improved = True
+            else:
+                self._place(d, s, cur)
+        return improved
+
+    def kick(self) -> None:
+        for _ in range(KICK_CELLS):
+            d, s = int(self.rng.integers(self.days)), int(self.rng.integers(len(SLOTS)))
+            self._remove(d, s)
+            self._place(d, s, int(self.rng.integers(len(self.pools[s].rows))))
+
+
+def generate_plan(f: MealFeatures, idx: IngredientIndex, prof: UserProfile, spec: PlanSpec) -> GeneratedPlan:
+    t0 = time.perf_counter()
+    deadline = t0 + spec.budget_ms / 1000.0
+    goal = float(prof.goal_daily_calories or DEFAULT_KCAL)
+
+    pref = score_catalog(f, prof)           # -inf where the user's allergens are present
+    safe = np.isfinite(pref)
+    pools = []
+    for s, slot in enumerate(SLOTS):
+        rows = slot_candidates(f, safe, slot, spec.slot_max_minutes.get(slot), spec.days)
+        if not len(rows):
+            raise PlanError(f"no meals available for {slot} with these allergens/time limits")
+        # best POOL_SIZE by preference, nudged towards the slot's share of the day
+        fit = pref[rows] - np.abs(f.cals[rows] - goal * SLOT_SHARE[s]) / goal
+        if len(rows) > POOL_SIZE:
+            rows = rows[np.argpartition(-fit, POOL_SIZE - 1)[:POOL_SIZE]]
+            fit = pref[rows] - np.abs(f.cals[rows] - goal * SLOT_SHARE[s]) / goal
+        pools.append(_Pool(rows[np.argsort(-fit)], f, idx, pref))
+
+    rng = np.random.default_rng(zlib.crc32(f"{prof.user_id}|{spec.start_date}".encode("utf-8")))
+    search = _Search(pools, spec.days, goal, spec.macros, len(f), len(idx.names), rng)
+
+    best_cost, best_pos = search.total(), search.pos.copy()
+    sweeps = kicks = 0
+    while time.perf_counter() < deadline:
+        sweeps += 1
+        if search.sweep():
+            continue
+        cost = search.total()
+        if cost < best_cost - 1e-9:
+            best_cost, best_pos = cost, search.pos.copy()
+        if time.perf_counter() >= deadline:
+            break
+        search.kick()
+        kicks += 1
+    cost = search.total()
+    if cost < best_cost:
+        best_cost, best_pos = cost, search.pos.copy()
+
+    grid = [[f.ids[pools[s].rows[best_pos[d, s]]] for s in range(len(SLOTS))] for d in range(spec.days)]
+    day_kcal = [sum(float(pools[s].kcal[best_pos[d, s]]) for s in range(len(SLOTS))) for d in range(spec.days)]
+    return GeneratedPlan(
+        user_id=prof.user_id,
+        start_date=spec.start_date,
+        grid=grid,
+        cost=best_cost,
+        stats={
+            "goal_kcal": goal,
+            "avg_day_kcal": round(sum(day_kcal) / len(day_kcal), 1),
+            "distinct_meals": len({m for row in grid for m in row}),
+            "sweeps": sweeps,
+            "kicks": kicks,
+            "ms": round((time.perf_counter() - t0) * 1000.0, 1),
+        },
+    )
+
+
+def save_plan(conn, plan: GeneratedPlan) -> int:
+    """Store via plan_store.create_plan (plans + plans_by_date); call inside engine.begin()."""
+    return create_plan(conn, plan.user_id, plan.start_date,
+                       [{s: [mid] for s, mid in zip(SLOTS, row)} for row in plan.grid])
+
+
+def load_user_profile(conn, user_id: str, allergens=None) -> UserProfile:
+    today = dt.date.today()
+    return load_profile(conn, user_id, today.isoformat(),
+                        (today - dt.timedelta(days=RECENT_DAYS)).isoformat(), allergens)
+
+
+# ---------- batch ----------
+_F: Optional[MealFeatures] = None
+_IDX: Optional[IngredientIndex] = None
+
+
+def _init_worker(f: MealFeatures, idx: IngredientIndex) -> None:
+    global _F, _IDX
+    _F, _IDX = f, idx
+
+
+def _generate_chunk(profiles: List[UserProfile], spec: PlanSpec) -> List[Tuple[str, Optional[GeneratedPlan], str]]:
+    out = []
+    for prof in profiles:
+        try:
+            out.append((prof.user_id, generate_plan(_F, _IDX, prof, spec), ""))
+        except PlanError as e:
+            out.append((prof.user_id, None, str(e)))
+    return out
+
+
+def run(db_url: str, user_ids: List[str], spec: PlanSpec, workers: int, batch_size: int, dry_run: bool) -> int:
+    eng = db.make_engine(db_url)
+    t0 = time.perf_counter()
+    with eng.begin() as conn:
+        migrations.upgrade(conn)
+        f = load_meal_features(conn)
+        idx = load_ingredient_index(conn, f.ids)
+        profiles = [load_user_profile(conn, u) for u in user_ids]
+    print(f"📥 {len(f)} meals, {len(idx.names)} ingredients, {len(profiles)} users "
+          f"in {time.perf_counter() - t0:.2f}s")
+
+    pending: List[GeneratedPlan] = []
+    written = failed = 0
+
+    def flush():
+        nonlocal pending, written
+        if not dry_run:
+            with eng.begin() as conn:
+                for p in pending:
+                    save_plan(conn, p)
+        written += len(pending)
+        pending = []
+        print(f"   • {written}/{len(profiles)} plans {'built' if dry_run else 'saved'}")
+
+    def collect(results):
+        nonlocal failed
+        for user_id, plan, err in results:
+            if plan is None:
+                failed += 1
+                print(f"⚠️ {user_id}: {err}")
+            else:
+                pending.append(plan)
+        if len(pending) >= batch_size:
+            flush()
+
+    chunks = [profiles[i:i + 64] for i in range(0, len(profiles), 64)]
+    if workers <= 1:
+        _init_worker(f, idx)
+        for ch in chunks:
+            collect(_generate_chunk(ch, spec))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(f, idx)) as pool:
+            for fut in as_completed([pool.submit(_generate_chunk, ch, spec) for ch in chunks]):
+                collect(fut.result())
+    if pending:
+        flush()
+
+    print(f"✅ Done. {written} plans, {failed} failed, in {time.perf_counter() - t0:.2f}s")
+    return written
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Generate weekly meal plans into plans + plans_by_date.")
+    ap.add_argument("--db", help="Path to a SQLite DB (default: $DATABASE_URL, else $DB_PATH)")
+    who = ap.add_mutually_exclusive_group(required=True)
+    who.add_argument("--users", nargs="+", help="User ids to plan for")
+    who.add_argument("--all-users", action="store_true", help="Every user in `users`")
+    ap.add_argument("--start-date", help="YYYY-MM-DD (default: the upcoming Sunday)")
+    ap.add_argument("--days", type=int, default=7)
+    ap.add_argument("--max-minutes", type=int, help="Time cap applied to every slot")
+    ap.add_argument("--budget-ms", type=float, default=BUDGET_MS, help="Local-search budget per plan")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (1 = inline)")
+    ap.add_argument("--batch-size", type=int, default=500, help="Plans per write transaction")
+    ap.add_argument("--dry-run", action="store_true", help="Generate only; no DB writes")
+    args = ap.parse_args()
+
+    if args.db and not os.path.exists(args.db):
+        print(f"❌ DB not found: {args.db}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.start_date:
+        start = dt.datetime.strptime(args.start_date, "%Y-%m-%d").date()
+    else:
+        start = sunday_of_week(dt.date.today()) + dt.timedelta(days=7)
+
+    users = args.users
+    if args.all_users:
+        eng = db.make_engine(db.database_url(args.db))
+        with eng.begin() as conn:
+            users = [str(u) for (u,) in conn.execute(sa.text("SELECT user_id FROM users ORDER BY user_id"))]
+
+    spec = PlanSpec(
+        start_date=start,
+        days=max(1, args.days),
+        slot_max_minutes={s: args.max_minutes for s in SLOTS},
+        budget_ms=args.budget_ms,
+    )
+    run(db.database_url(args.db), users, spec, max(1, args.workers), max(1, args.batch_size), args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
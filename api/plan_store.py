@@ -0,0 +1,185 @@
+# plan_store.py
+"""
+Plan writes. `plans_by_date` is the single source of truth for what's in a plan;
+`plans` holds the header (user, date range, counters) plus a `version` that every
+write bumps, so clients can send it back and get a 409 instead of clobbering a
+concurrent edit.
+
+plans.plan_json is no longer maintained: writes store "{}" (the column is
+NOT NULL + json_valid) and plan_json_for() derives the old shape from the rows
+for anything that still wants it. All functions take a SQLAlchemy connection
+and expect the caller to hold the transaction (engine.begin()).
+"""
+
+import datetime as dt
+from typing import Dict, List, Optional, Sequence
+
+import sqlalchemy as sa
+
+import db
+from plans_by_date import PBD_KEY, parse_plan_json
+
+SLOTS = ("breakfast", "lunch", "dinner")
+SLOT_TIMES = {"breakfast": "08:00", "lunch": "12:30", "dinner": "19:00"}
+DERIVED_PLAN_JSON = "{}"
+
+
+class PlanNotFound(LookupError):
+    pass
+
+
+class PlanConflict(RuntimeError):
+    """The plan's version moved on since the client read it."""
+
+
+class PlanInvalid(ValueError):
+    pass
+
+
+def _check_meals(conn, meal_ids: Sequence[str]) -> None:
+    want = sorted(set(meal_ids))
+    if not want:
+        return
+    found = {str(r[0]) for r in conn.execute(
+        sa.text("SELECT CAST(id AS TEXT) FROM meals WHERE id IN :ids").bindparams(db.in_list("ids")),
+        {"ids": [str(m) for m in want]},
+    )}
+    missing = [m for m in want if m not in found]
+    if missing:
+        raise PlanInvalid(f"unknown meal ids: {', '.join(missing[:5])}")
+
+
+def create_plan(conn, user_id: str, start: dt.date, days: Sequence[Dict[str, List[str]]]) -> int:
+    """
+    days[i] = {"breakfast": [meal_id, ...], "lunch": [...], "dinner": [...]} for start + i.
+    Replaces the user's plans_by_date rows in the range and any plan with the same start.
+    """
+    if not days:
+        raise PlanInvalid("a plan needs at least one day")
+    end = start + dt.timedelta(days=len(days) - 1)
+    rows = [
+        {"u": user_id, "d": (start + dt.timedelta(days=i)).isoformat(), "slot": slot, "idx": j, "m": str(mid)}
+        for i, day in enumerate(days) for slot in SLOTS for j, mid in enumerate(day.get(slot) or [])
+    ]
+    _check_meals(conn, [r["m"] for r in rows])
+
+    s, e = start.isoformat(), end.isoformat()
+    for (pid,) in conn.execute(
+        sa.text("SELECT id FROM plans WHERE user_id = :u AND start_date = :s"), {"u": user_id, "s": s}
+    ).all():
+        conn.execute(sa.text("DELETE FROM plans_by_date WHERE plan_id = :p"), {"p": pid})
+        conn.execute(sa.text("DELETE FROM plans WHERE id = :p"), {"p": pid})
+    conn.execute(
+        sa.text("DELETE FROM plans_by_date WHERE user_id = :u AND date BETWEEN :s AND :e"),
+        {"u": user_id, "s": s, "e": e},
+    )
+    _trim_overlapped(conn, user_id, start, end)
+    plan_id = db.insert_returning_id(conn, "plans", {
+        "user_id": user_id, "start_date": s, "end_date": e, "length_days": len(days),
+        "plan_json": DERIVED_PLAN_JSON, "meals_count": len(rows), "version": 1,
+    })
+    if rows:
+        conn.execute(sa.text("""
+            INSERT INTO plans_by_date (plan_id, user_id, date, slot, idx, meal_id)
+            VALUES (:p, :u, :d, :slot, :idx, :m)
+        """), [{**r, "p": plan_id} for r in rows])
+    return plan_id
+
+
+def _trim_overlapped(conn, user_id: str, start: dt.date, end: dt.date) -> None:
+    """
+    Headers of the user's other plans that overlap [start, end] (whose rows there
+    were just replaced): dropped if inside the range, else cut back to the days
+    outside it. A plan straddling the range keeps its dates — lookups take the
+    latest start, i.e. the new plan, inside it. Counters are recomputed and the
+    version bumped, so clients and stored baskets see the change.
+
+    A legacy plan (plan_json with days) that survives gets its remaining days
+    outside the range into plans_by_date first (filling gaps only) and its
+    plan_json set to "{}", so plans_by_date.py can't re-materialise it over the
+    new plan's rows.
+    """
+    s, e = start.isoformat(), end.isoformat()
+    for pid, ps, pe, pj in conn.execute(sa.text("""
+        SELECT id, start_date, end_date, plan_json FROM plans
+        WHERE user_id = :u AND start_date <= :e AND end_date >= :s
+    """), {"u": user_id, "s": s, "e": e}).all():
+        ps, pe = str(ps), str(pe)
+        if s <= ps and pe <= e:
+            conn.execute(sa.text("DELETE FROM plans_by_date WHERE plan_id = :p"), {"p": pid})
+            conn.execute(sa.text("DELETE FROM plans WHERE id = :p"), {"p": pid})
+            continue
+        if ps >= s:
+            ps = (end + dt.timedelta(days=1)).isoformat()
+        elif pe <= e:
+            pe = (start - dt.timedelta(days=1)).isoformat()
+        legacy = [
+            {"plan_id": pid, "user_id": user_id, "date": d["date"], "slot": slot, "idx": j, "meal_id": mid}
+            for d in parse_plan_json(pj) if ps <= d["date"] <= pe and not s <= d["date"] <= e
+            for slot in SLOTS for j, it in enumerate(d[slot])
+            if isinstance(it, dict) and (mid := str(it.get("meal_id") or "").strip())
+        ]
+        db.upsert(conn, "plans_by_date", legacy, key=PBD_KEY, update=())
+        days = (dt.date.fromisoformat(pe) - dt.date.fromisoformat(ps)).days + 1
+        conn.execute(sa.text("""
+            UPDATE plans
+            SET start_date = :ps, end_date = :pe, length_days = :n, version = version + 1, plan_json = :j,
+                meals_count = (SELECT COUNT(*) FROM plans_by_date WHERE plan_id = :p)
+            WHERE id = :p
+        """), {"p": pid, "ps": ps, "pe": pe, "n": days, "j": DERIVED_PLAN_JSON})
+
+
+def set_slot(conn, plan_id: int, date: str, slot: str, meal_ids: Sequence[str],
+             expected_version: Optional[int] = None) -> int:
+    """Replace one (date, slot) of a plan; returns the new version."""
+    if slot not in SLOTS:
+        raise PlanInvalid(f"unknown slot {slot!r}")
+    head = conn.execute(
+        sa.text("SELECT user_id, start_date, end_date, version FROM plans WHERE id = :p"), {"p": plan_id}
+    ).mappings().first()
+    if not head:
+        raise PlanNotFound(plan_id)
+    if not (str(head["start_date"]) <= date <= str(head["end_date"])):
+        raise PlanInvalid(f"{date} is outside plan {plan_id} ({head['start_date']}..{head['end_date']})")
+    _check_meals(conn, meal_ids)
+
+    version = int(head["version"] or 1)
+    if expected_version is not None and expected_version != version:
+        raise PlanConflict(f"plan {plan_id} is at version {version}, not {expected_version}")
+    bumped = conn.execute(sa.text("""
+        UPDATE plans SET version = version + 1, plan_json = :j
+        WHERE id = :p AND version = :v
+    """), {"p": plan_id, "v": version, "j": DERIVED_PLAN_JSON}).rowcount
+    if not bumped:
+        raise PlanConflict(f"plan {plan_id} changed concurrently")
+
+    user_id = str(head["user_id"])
+    conn.execute(
+        sa.text("DELETE FROM plans_by_date WHERE user_id = :u AND date = :d AND slot = :s"),
+        {"u": user_id, "d": date, "s": slot},
+    )
+    if meal_ids:
+        conn.execute(sa.text("""
+            INSERT INTO plans_by_date (plan_id, user_id, date, slot, idx, meal_id)
+            VALUES (:p, :u, :d, :s, :i, :m)
+        """), [{"p": plan_id, "u": user_id, "d": date, "s": slot, "i": i, "m": str(m)}
+               for i, m in enumerate(meal_ids)])
+    conn.execute(sa.text("""
+        UPDATE plans SET meals_count = (SELECT COUNT(*) FROM plans_by_date WHERE plan_id = :p)
+        WHERE id = :p
+    """), {"p": plan_id})
+    return version + 1
+
+
+def plan_json_for(conn, plan_id: int) -> dict:
+    """The legacy {"days": [{date, breakfast: [{meal_id, time}], ...}]} shape, built from plans_by_date."""
+    days: Dict[str, Dict[str, list]] = {}
+    for d, slot, mid in conn.execute(sa.text("""
+        SELECT date, slot, meal_id FROM plans_by_date
+        WHERE plan_id = :p
+        ORDER BY date, idx
+    """), {"p": plan_id}):
+        day = days.setdefault(str(d), {s: [] for s in SLOTS})
+        if slot in day:
+            day[slot].append({"meal_id": str(mid), "time": SLOT_TIMES[slot]})
+    return {"days": [{"date": d, **slots} for d, slots in sorted(days.items())]}
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Propagates catalog_items price changes into meals.price_pounds / price_json.
+
+price_json lines are priced snapshots ("150 g chorizo", assumed_qty 150 g,
+line_cost_gbp 2.40). Lines whose ingredient resolves to a catalog item
+(ingredient_catalog_map, else a catalog name) become entries of a meal × item
+quantity matrix, stored CSR-style like ingredient_index.py: meal_ptr + flat
+item column + quantity in the item's pack_unit. The transpose (item → entries)
+is the reverse index. Lines that don't resolve keep their snapshot cost.
+
+    line cost  = qty × price_per_pack / pack_amount
+    meal price = Σ unresolved snapshot costs + Σ line costs   (rounded per line, as before)
+
+`catalog_price_applied` records the price each item had when it was last
+propagated. A run diffs catalog_items against it, walks the reverse index from
+the changed items to the meals that use them, reprices only those (a gather,
+a multiply and a bincount), and rewrites their price_json lines (unit/line
+cost + catalog_id) and price_pounds in one transaction. The meals trigger logs
+them to meal_changes for sync clients.
+
+--watch keeps the matrix in memory and polls, so an edit costs milliseconds.
+Rebuild (restart, or --full) after ingesting meals or changing the map.
+
+Usage:
+  python pricing.py                     # propagate whatever changed since the last run
+  python pricing.py --full              # reprice every meal against current prices
+  python pricing.py --set 3=1.75        # set catalog item 3's price_per_pack, then propagate
+  python pricing.py --watch 5           # poll catalog_items every 5 s
+  python pricing.py --dry-run --db /path/to/scranly.db
+"""
+
+import argparse, datetime as dt, json, os, sys, time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import sqlalchemy as sa
+
+import db
+import migrations
+from catalog_matcher import normalise_ingredient
+from pack_optimiser import convert
+
+# price_json assumed_unit → (factor, base unit); "pack" is one catalog pack
+LINE_UNITS = {
+    "g": (1.0, "grams"), "kg": (1000.0, "grams"),
+    "ml": (1.0, "milliliters"), "l": (1000.0, "milliliters"),
+    "each": (1.0, "count"),
+}
+PACK = "pack"
+
+
+@dataclass
+class CatalogItem:
+    price_per_pack: float
+    pack_amount: float
+    pack_unit: str
+
+    @property
+    def unit_price(self) -> float:
+        return self.price_per_pack / self.pack_amount if self.pack_amount > 0 else 0.0
+
+
+@dataclass
+class PriceMatrix:
+    ids: List[str]              # meal ids, row order
+    blobs: List[dict]           # parsed price_json per meal (kept in sync with what's written)
+    meal_ptr: np.ndarray        # int64, len(ids) + 1
+    meal_of: np.ndarray         # int32, owning meal row per entry
+    line: np.ndarray            # int32, index of the entry's line in its meal's price_json items
+    item: np.ndarray            # int32, column into item_ids
+    qty: np.ndarray             # float64, quantity in the item's pack_unit
+    per_unit: np.ndarray        # float64, assumed units per pack_unit (for unit_price_gbp)
+    cost: np.ndarray            # float64, current (rounded) line cost per entry
+    fixed: np.ndarray           # float64 per meal, Σ snapshot cost of lines with no catalog item
+    total: np.ndarray           # float64 per meal, current price_pounds
+    item_ids: np.ndarray        # int64, catalog_items.id per column
+    item_ptr: np.ndarray        # int64, len(item_ids) + 1 — reverse index
+    item_entries: np.ndarray    # int32, entry indices per item column (ascending)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def meals_using(self, cols) -> np.ndarray:
+        """Meal rows that have a line priced off any of the given item columns."""
+        if not len(cols):
+            return np.zeros(0, dtype=np.int32)
+        ents = np.concatenate([self.item_entries[self.item_ptr[c]:self.item_ptr[c + 1]] for c in cols])
+        return np.unique(self.meal_of[ents])
+
+
+def load_catalog(conn) -> Dict[int, CatalogItem]:
+    return {int(i): CatalogItem(float(p or 0.0), float(a or 0.0), str(u))
+            for i, p, a, u in conn.execute(sa.text(
+                "SELECT id, price_per_pack, pack_amount, pack_unit FROM catalog_items"))}
+
+
+def _resolver(conn, catalog: Dict[int, CatalogItem]):
+    """normalised ingredient → catalog id: the map first, else a catalog item with that name (cheapest per unit)."""
+    by_name: Dict[str, int] = {}
+    for cid, name in conn.execute(sa.text("SELECT id, name FROM catalog_items WHERE pack_amount > 0")):
+        key, cid = normalise_ingredient(str(name)), int(cid)
+        if key not in by_name or catalog[cid].unit_price < catalog[by_name[key]].unit_price:
+            by_name[key] = cid
+    mapped = {str(k): int(c) for k, c in conn.execute(sa.text(
+        "SELECT ingredient, catalog_id FROM ingredient_catalog_map"))}
+    return lambda key: mapped.get(key, by_name.get(key))
+
+
+def _quantity(line: dict, it: CatalogItem) -> Optional[Tuple[float, float]]:
+    """(qty in the item's pack_unit, assumed units per pack_unit) or None if the units don't meet."""
+    try:
+        amount = float(line.get("assumed_qty"))
+    except (TypeError, ValueError):
+        return None
+    unit = str(line.get("assumed_unit") or "").lower()
+    if unit == PACK:
+        return amount * it.pack_amount, 1.0 / it.pack_amount
+    if unit not in LINE_UNITS:
+        return None
+    factor, base = LINE_UNITS[unit]
+    qty = convert(amount * factor, base, it.pack_unit)
+    return (qty, 1.0 / factor) if qty is not None else None
+
+
+def load_price_matrix(conn, catalog: Optional[Dict[int, CatalogItem]] = None) -> PriceMatrix:
+    catalog = catalog if catalog is not None else load_catalog(conn)
+    resolve = _resolver(conn, catalog)
+    cols: Dict[int, int] = {}
+    ids, blobs, ptr, fixed, total = [], [], [0], [], []
+    meal_of, line, item, qty, per_unit, cost = [], [], [], [], [], []
+    for mid, raw in conn.execute(sa.text(
+        "SELECT CAST(id AS TEXT), price_json FROM meals WHERE price_json IS NOT NULL ORDER BY id"
+    )):
+        try:
+            blob = json.loads(raw)
+        except (TypeError, ValueError):
+            continue
+        items = blob.get("items") if isinstance(blob, dict) else None
+        if not isinstance(items, list):
+            continue
+        row, snap = len(ids), 0.0
+        for j, ln in enumerate(items):
+            if not isinstance(ln, dict):
+                continue
+            try:
+                c = float(ln.get("line_cost_gbp") or 0.0)
+            except (TypeError, ValueError):
+                c = 0.0
+            cid = resolve(normalise_ingredient(str(ln.get("ingredient") or "").split("|")[0]))
+            q = _quantity(ln, catalog[cid]) if cid in catalog else None
+            if q is None:
+                snap += c
+                continue
+            meal_of.append(row); line.append(j); item.append(cols.setdefault(cid, len(cols)))
+            qty.append(q[0]); per_unit.append(q[1]); cost.append(c)
+        ids.append(str(mid)); blobs.append(blob); fixed.append(snap)
+        total.append(float(blob.get("total_gbp") or 0.0) if isinstance(blob.get("total_gbp"), (int, float))
+                     else snap + sum(cost[ptr[-1]:]))
+        ptr.append(len(meal_of))
+
+    item_arr = np.asarray(item, dtype=np.int32)
+    order = np.argsort(item_arr, kind="stable")        # stable → entries ascending per item
+    item_ptr = np.zeros(len(cols) + 1, dtype=np.int64)
+    item_ptr[1:] = np.cumsum(np.bincount(item_arr, minlength=len(cols)))
+    return PriceMatrix(
+        ids=ids, blobs=blobs, meal_ptr=np.asarray(ptr, dtype=np.int64),
+        meal_of=np.asarray(meal_of, dtype=np.int32), line=np.asarray(line, dtype=np.int32), item=item_arr,
+        qty=np.asarray(qty, dtype=np.float64), per_unit=np.asarray(per_unit, dtype=np.float64),
+        cost=np.asarray(cost, dtype=np.float64), fixed=np.asarray(fixed, dtype=np.float64),
+        total=np.asarray(total, dtype=np.float64),
+        item_ids=np.fromiter(cols, dtype=np.int64, count=len(cols)),
+        item_ptr=item_ptr, item_entries=order.astype(np.int32),
+    )
+
+
+def reprice(m: PriceMatrix, catalog: Dict[int, CatalogItem], rows: np.ndarray) -> np.ndarray:
+    """
+    Recompute the given meal rows against `catalog`, update m in place (costs,
+    totals, blobs) and return the rows whose price_json actually changed.
+    """
+    if not len(rows):
+        return rows
+    unit = np.array([catalog[int(c)].unit_price if int(c) in catalog else np.nan for c in m.item_ids])
+    ents = np.concatenate([np.arange(m.meal_ptr[r], m.meal_ptr[r + 1]) for r in rows])
+    ents = ents[~np.isnan(unit[m.item[ents]])]            # items deleted from the catalog keep their cost
+    new = np.round(m.qty[ents] * unit[m.item[ents]], 2)
+    moved = ents[new != m.cost[ents]]
+    m.cost[ents] = new
+
+    sums = np.bincount(m.meal_of[ents], weights=new, minlength=len(m))
+    has = np.bincount(m.meal_of[ents], minlength=len(m)) > 0
+    cand = rows[has[rows]]
+    totals = np.round(m.fixed[cand] + sums[cand], 2)
+    changed = np.union1d(cand[totals != m.total[cand]], m.meal_of[moved]).astype(np.int32)
+    m.total[cand] = totals
+
+    for r in changed:
+        items = m.blobs[r]["items"]
+        for e in range(m.meal_ptr[r], m.meal_ptr[r + 1]):
+            if np.isnan(unit[m.item[e]]):
+                continue
+            ln = items[m.line[e]]
+            ln["catalog_id"] = int(m.item_ids[m.item[e]])
+            ln["unit_price_gbp"] = round(float(unit[m.item[e]] / m.per_unit[e]), 4)
+            ln["line_cost_gbp"] = float(m.cost[e])
+        m.blobs[r]["total_gbp"] = float(m.total[r])
+    return changed
+
+
+def update_params(m: PriceMatrix, rows: np.ndarray) -> List[dict]:
+    return [{"id": m.ids[r], "pj": json.dumps(m.blobs[r], ensure_ascii=False), "p": float(m.total[r])}
+            for r in rows]
+
+
+def changed_items(conn, m: PriceMatrix, catalog: Dict[int, CatalogItem]) -> List[int]:
+    """Matrix columns whose catalog price/pack differs from what was last propagated."""
+    applied = {int(c): (float(p), float(a)) for c, p, a in conn.execute(sa.text(
+        "SELECT catalog_id, price_per_pack, pack_amount FROM catalog_price_applied"))}
+    return [col for col, cid in enumerate(m.item_ids.tolist())
+            if cid in catalog and applied.get(cid) != (catalog[cid].price_per_pack, catalog[cid].pack_amount)]
+
+
+def write(conn, m: PriceMatrix, rows: np.ndarray, catalog: Dict[int, CatalogItem]) -> None:
+    """Changed meals + the prices they now reflect, in the caller's transaction."""
+    params = update_params(m, rows)
+    if params:
+        conn.execute(sa.text("UPDATE meals SET price_json = :pj, price_pounds = :p WHERE id = :id"), params)
+    now = dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds")
+    db.upsert(conn, "catalog_price_applied", [
+        {"catalog_id": cid, "price_per_pack": it.price_per_pack, "pack_amount": it.pack_amount, "applied_at": now}
+        for cid, it in catalog.items()
+    ], key=("catalog_id",))
+
+
+def propagate(engine, m: PriceMatrix, full: bool = False, dry_run: bool = False) -> Tuple[int, int, float]:
+    """One pass: (items changed, meals rewritten, seconds)."""
+    t0 = time.perf_counter()
+    with engine.begin() as conn:
+        catalog = load_catalog(conn)
+        cols = list(range(len(m.item_ids))) if full else changed_items(conn, m, catalog)
+        rows = np.arange(len(m), dtype=np.int32) if full else m.meals_using(cols)
+        changed = reprice(m, catalog, rows)
+        if not dry_run and (cols or full):
+            write(conn, m, changed, catalog)
+    return len(cols), len(changed), time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Reprice meals from catalog_items (incremental via a reverse index).")
+    ap.add_argument("--db", help="Path to a SQLite DB (default: $DATABASE_URL, else $DB_PATH)")
+    ap.add_argument("--full", action="store_true", help="Reprice every meal, not just those using changed items")
+    ap.add_argument("--set", action="append", default=[], metavar="ID=PRICE",
+                    help="Set catalog_items.price_per_pack before propagating (repeatable)")
+    ap.add_argument("--watch", type=float, metavar="SECONDS", help="Keep running, polling catalog_items")
+    ap.add_argument("--dry-run", action="store_true", help="Report only; no DB writes")
+    args = ap.parse_args()
+
+    if args.db and not os.path.exists(args.db):
+        print(f"❌ DB not found: {args.db}", file=sys.stderr)
+        sys.exit(1)
+    engine = db.make_engine(db.database_url(args.db))
+    try:
+        with engine.begin() as conn:
+            migrations.upgrade(conn)     # catalog_price_applied
+            t0 = time.perf_counter()
+            m = load_price_matrix(conn)
+        print(f"💷 {len(m)} meals, {len(m.qty)} catalog-priced lines over {len(m.item_ids)} items "
+              f"in {time.perf_counter() - t0:.2f}s")
+
+        if args.set and not args.dry_run:
+            with engine.begin() as conn:
+                for spec in args.set:
+                    cid, _, price = spec.partition("=")
+                    try:
+                        cid, price = int(cid), float(price)
+                    except ValueError:
+                        print(f"❌ --set wants ID=PRICE, got {spec!r}", file=sys.stderr)
+                        sys.exit(2)
+                    n = conn.execute(sa.text("""
+                        UPDATE catalog_items SET price_per_pack = :p, updated_at = CURRENT_TIMESTAMP WHERE id = :i
+                    """), {"p": price, "i": cid}).rowcount
+                    print(f"🏷️ catalog item {cid} → £{price:.2f}" + ("" if n else " (no such item)"))
+
+        while True:
+            items, meals, secs = propagate(engine, m, full=args.full, dry_run=args.dry_run)
+            if items or args.full or not args.watch:
+                print(f"🧮 {items} changed item(s) → {meals} meal(s) repriced in {secs * 1000:.1f} ms"
+                      + (" (dry run, nothing written)" if args.dry_run else ""))
+            if not args.watch:
+                break
+            args.full = False
+            time.sleep(args.watch)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+# profiling.py
+"""
+Opt-in per-request profiling.
+
+A request is profiled when it carries `X-Profile: <PROFILE_TOKEN>` (admins), or
+is picked by PROFILE_SAMPLE_RATE. Profiled requests record:
+
+- a profile of the thread running the route, which covers the route function
+  and every builder it calls:
+    mode "stack" (default, and always for sampled requests): a sampler thread
+      snapshots the route thread's stack every PROFILE_INTERVAL_MS and writes
+      collapsed stacks (.folded: flamegraph.pl / speedscope / inferno);
+    mode "cprofile" (X-Profile-Mode: cprofile, admins only): deterministic
+      cProfile, written as .prof (snakeviz, flameprof, pstats);
+- every SQL statement with its time (before/after_cursor_execute);
+- a summary (.json): wall time, SQL totals, slowest statements, hottest frames.
+
+Files go to PROFILE_DIR. Admins can send `X-Profile-Inline: 1` to get the
+summary + folded stacks back as the response body instead. Every profiled
+response carries X-Profile-Id and a Server-Timing header.
+
+Cost: main.py only installs the middleware when PROFILE_TOKEN or a sample rate
+is set, so a disabled deployment runs none of this. Sampled profiles are capped
+at PROFILE_MAX_PER_MIN and one at a time; admin profiles at MAX_ADMIN_ACTIVE.
+"""
+
+import cProfile, functools, json, os, random, re, sys, threading, time, uuid
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import anyio
+import sqlalchemy as sa
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0") or 0)
+MAX_PER_MIN = int(os.getenv("PROFILE_MAX_PER_MIN", "6"))
+INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "profiles"))
+MAX_ADMIN_ACTIVE = 2
+MAX_SQL = 500          # statements kept per profile
+MAX_DEPTH = 128
+TOP_N = 15
+
+
+def enabled() -> bool:
+    return bool(PROFILE_TOKEN) or SAMPLE_RATE > 0
+
+
+@dataclass
+class Session:
+    id: str
+    method: str
+    path: str
+    mode: str                     # "stack" | "cprofile"
+    reason: str                   # "admin" | "sampled"
+    started: float = field(default_factory=time.perf_counter)
+    threads: set = field(default_factory=set)
+    stacks: Counter = field(default_factory=Counter)
+    sql: List[tuple] = field(default_factory=list)        # (statement, ms)
+    sql_dropped: int = 0
+    profiles: List[cProfile.Profile] = field(default_factory=list)
+    status: int = 0
+    wall_ms: float = 0.0
+    inline: bool = False
+
+    def sql_ms(self) -> float:
+        return sum(ms for _, ms in self.sql)
+
+
+_session: ContextVar[Optional[Session]] = ContextVar("profile_session", default=None)
+_counters = {"admin": 0, "sampled": 0, "skipped_cap": 0, "written": 0}
+_lock = threading.Lock()
+_window = {"start": 0.0, "n": 0, "sampled_active": 0, "admin_active": 0}
+
+
+def profiling_stats() -> dict:
+    with _lock:
+        return {**_counters, "sample_rate": SAMPLE_RATE, "max_per_min": MAX_PER_MIN}
+
+
+def _admit(reason: str) -> bool:
+    """Overhead cap: sampled → ≤ MAX_PER_MIN per minute, one at a time."""
+    now = time.monotonic()
+    with _lock:
+        if reason == "admin":
+            if _window["admin_active"] >= MAX_ADMIN_ACTIVE:
+                _counters["skipped_cap"] += 1
+                return False
+            _window["admin_active"] += 1
+            _counters["admin"] += 1
+            return True
+        if now - _window["start"] >= 60:
+            _window["start"], _window["n"] = now, 0
+        if _window["n"] >= MAX_PER_MIN or _window["sampled_active"]:
+            _counters["skipped_cap"] += 1
+            return False
+        _window["n"] += 1
+        _window["sampled_active"] += 1
+        _counters["sampled"] += 1
+        return True
+
+
+def _release(reason: str) -> None:
+    with _lock:
+        _window["admin_active" if reason == "admin" else "sampled_active"] -= 1
+
+
+# ---------- stack sampler ----------
+
+def _collapse(frame) -> str:
+    """Root-first "fn (file:line);..." up to (not including) the route wrapper."""
+    parts = []
+    while frame is not None and len(parts) < MAX_DEPTH:
+        co = frame.f_code
+        if co is _WRAPPER_CODE:
+            break
+        parts.append(f"{co.co_name} ({os.path.basename(co.co_filename)}:{co.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+class _Sampler(threading.Thread):
+    def __init__(self, sess: Session):
+        super().__init__(name=f"profile-{sess.id}", daemon=True)
+        self.sess = sess
+        self.stop = threading.Event()
+
+    def run(self):
+        interval = INTERVAL_MS / 1000.0
+        while not self.stop.wait(interval):
+            frames = sys._current_frames()
+            for tid in list(self.sess.threads):
+                f = frames.get(tid)
+                if f is not None:
+                    self.sess.stacks[_collapse(f)] += 1
+
+
+# ---------- route + SQL hooks ----------
+
+def _wrap_call(call):
+    """Runs in the route's thread; profiles it when the request has a session."""
+    @functools.wraps(call)
+    def wrapper(*args, **kwargs):
+        sess = _session.get()
+        if sess is None:
+            return call(*args, **kwargs)
+        tid = threading.get_ident()
+        if sess.mode == "cprofile":
+            prof = cProfile.Profile()
+            sess.profiles.append(prof)
+            prof.enable()
+            try:
+                return call(*args, **kwargs)
+            finally:
+                prof.disable()
+        sess.threads.add(tid)
+        try:
+            return call(*args, **kwargs)
+        finally:
+            sess.threads.discard(tid)
+    wrapper.__profiled__ = True
+    return wrapper
+
+
+_WRAPPER_CODE = _wrap_call(lambda: None).__code__
+
+
+def instrument_routes(app) -> int:
+    """Wrap every sync route's endpoint (FastAPI already chose to run it in the threadpool)."""
+    n = 0
+    for route in app.routes:
+        dep = getattr(route, "dependant", None)
+        call = getattr(dep, "call", None)
+        if call is None or getattr(call, "__profiled__", False) or not callable(call):
+            continue
+        if getattr(call, "__code__", None) is not None and call.__code__.co_flags & 0x80:   # async def
+            continue
+        dep.call = _wrap_call(call)
+        n += 1
+    return n
+
+
+def attach_sql(engine) -> None:
+    @sa.event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _session.get() is not None:
+            conn.info.setdefault("profile_t0", []).append(time.perf_counter())
+
+    @sa.event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        sess = _session.get()
+        if sess is None or not conn.info.get("profile_t0"):
+            return
+        ms = (time.perf_counter() - conn.info["profile_t0"].pop()) * 1000
+        if len(sess.sql) < MAX_SQL:
+            sess.sql.append((" ".join(statement.split()), ms))
+        else:
+            sess.sql_dropped += 1
+
+
+# ---------- output ----------
+
+def _slug(path: str) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "-", path).strip("-")[:60] or "root"
+
+
+def summary(sess: Session) -> dict:
+    by_stmt: Dict[str, List[float]] = {}
+    for stmt, ms in sess.sql:
+        by_stmt.setdefault(stmt, []).append(ms)
+    top_sql = sorted(by_stmt.items(), key=lambda kv: -sum(kv[1]))[:TOP_N]
+    out = {
+        "id": sess.id, "method": sess.method, "path": sess.path, "status": sess.status,
+        "reason": sess.reason, "mode": sess.mode, "wall_ms": round(sess.wall_ms, 2),
+        "sql": {
+            "count": len(sess.sql) + sess.sql_dropped, "total_ms": round(sess.sql_ms(), 2),
+            "top": [{"statement": s[:400], "count": len(t), "total_ms": round(sum(t), 2), "max_ms": round(max(t), 2)}
+                    for s, t in top_sql],
+        },
+    }
+    if sess.mode == "stack":
+        leaf = Counter()
+        for stack, n in sess.stacks.items():
+            leaf[stack.rsplit(";", 1)[-1]] += n
+        total = sum(sess.stacks.values()) or 1
+        out["samples"] = sum(sess.stacks.values())
+        out["interval_ms"] = INTERVAL_MS
+        out["top_frames"] = [{"frame": f, "samples": n, "pct": round(100 * n / total, 1)}
+                             for f, n in leaf.most_common(TOP_N)]
+    return out
+
+
+def folded(sess: Session) -> str:
+    return "".join(f"{stack} {n}\n" for stack, n in sess.stacks.most_common())
+
+
+def write(sess: Session) -> str:
+    """→ path prefix of the files written."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%dT%H%M%S')}-{sess.method}-{_slug(sess.path)}-{sess.id}")
+    if sess.mode == "cprofile" and sess.profiles:
+        import pstats
+        stats = pstats.Stats(sess.profiles[0])
+        for p in sess.profiles[1:]:
+            stats.add(p)
+        stats.dump_stats(base + ".prof")
+    else:
+        with open(base + ".folded", "w") as f:
+            f.write(folded(sess))
+    with open(base + ".json", "w") as f:
+        json.dump(summary(sess), f, indent=2)
+    with _lock:
+        _counters["written"] += 1
+    return base
+
+
+# ---------- middleware ----------
+
+class ProfilingMiddleware:
+    def __init__(self, app, engine=None):
+        self.app = app
+        self.instrumented = False
+        if engine is not None:
+            attach_sql(engine)
+
+    def _decide(self, scope) -> Optional[Session]:
+        hdrs = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+        admin = bool(PROFILE_TOKEN) and hdrs.get("x-profile") == PROFILE_TOKEN
+        if admin:
+            reason = "admin"
+        elif SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE:
+            reason = "sampled"
+        else:
+            return None
+        if not _admit(reason):
+            return None
+        mode = "cprofile" if admin and hdrs.get("x-profile-mode") == "cprofile" else "stack"
+        sess = Session(id=uuid.uuid4().hex[:12], method=scope["method"], path=scope["path"], mode=mode, reason=reason)
+        sess.inline = admin and hdrs.get("x-profile-inline") == "1"
+        return sess
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if not self.instrumented:
+            self.instrumented = True
+            n = instrument_routes(scope["app"])
+            print(f"🔬 profiling: {n} routes instrumented (sample rate {SAMPLE_RATE})")
+        sess = self._decide(scope)
+        if sess is None:
+            await self.app(scope, receive, send)
+            return
+
+        token = _session.set(sess)
+        sampler = _Sampler(sess) if sess.mode == "stack" else None
+        if sampler:
+            sampler.start()
+
+        async def wrapped_send(message):
+            if message["type"] == "http.response.start":
+                sess.status = message["status"]
+                if sess.inline:
+                    return
+                timing = (f'app;dur={(time.perf_counter() - sess.started) * 1000:.1f}, '
+                          f'sql;dur={sess.sql_ms():.1f};desc="{len(sess.sql)} statements"')
+                message = {**message, "headers": list(message["headers"]) + [
+                    (b"x-profile-id", sess.id.encode()), (b"server-timing", timing.encode())]}
+            elif sess.inline:
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, receive, wrapped_send)
+        finally:
+            sess.wall_ms = (time.perf_counter() - sess.started) * 1000
+            _session.reset(token)
+            if sampler:
+                sampler.stop.set()
+                sampler.join()
+            _release(sess.reason)
+        await anyio.to_thread.run_sync(write, sess)
+        if sess.inline:
+            body = json.dumps({"summary": summary(sess), "folded": folded(sess)}).encode()
+            await send({"type": "http.response.start", "status": 200, "headers": [
+                (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                (b"x-profile-id", sess.id.encode())]})
+            await send({"type": "http.response.body", "body": body})
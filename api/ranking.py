@@ -0,0 +1,181 @@
+# ranking.py
+"""
+Personalised Discover deck ranking.
+
+rank_for_user() scores the whole catalog for one user in a single NumPy pass over
+meal_features.MealFeatures, drops meals with the user's allergens via the bitmask,
+then re-ranks with an MMR-style cuisine penalty so the deck isn't ten curries in
+a row. The ranked id list is cached per user and catalog version for RANK_TTL_S,
+so deck pages are slices of one ranking instead of a re-score per swipe batch.
+A ranking holds RANK_DEPTH meals to start with; a page past its end re-ranks to
+the next multiple of RANK_DEPTH (the greedy pass is prefix-stable, so earlier
+pages don't move), and past the MMR pool the rest of the catalog follows in
+plain score order.
+"""
+
+import threading, time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import sqlalchemy as sa
+
+from meal_features import MealFeatures, parse_allergens
+
+RANK_TTL_S = 300
+RANK_DEPTH = 400          # how many meals a cached ranking holds before it's extended
+MMR_POOL = 1500           # candidates considered by the diversity pass
+CUISINE_PENALTY = 0.12    # score lost per already-picked meal of the same cuisine
+RECENT_DAYS = 14
+
+WEIGHTS = {
+    "calorie_fit": 0.35,
+    "protein": 0.20,
+    "rating": 0.15,
+    "cheap": 0.10,
+    "quick": 0.10,
+    "affinity": 0.30,
+    "recent": -0.40,
+}
+
+
+@dataclass
+class UserProfile:
+    user_id: str
+    goal_daily_calories: Optional[float] = None
+    allergens: List[str] = field(default_factory=list)
+    history: Dict[str, int] = field(default_factory=dict)   # meal_id → times planned
+    recent: List[str] = field(default_factory=list)         # meal_ids planned in the last RECENT_DAYS
+
+
+def load_profile(conn, user_id: str, today_iso: str, since_iso: str, allergens=None) -> UserProfile:
+    """users row (if any) + plans_by_date history. `allergens` overrides the stored list."""
+    prof = UserProfile(user_id=user_id)
+    insp = sa.inspect(conn)
+    cols = {c["name"] for c in insp.get_columns("users")} if insp.has_table("users") else set()
+    if cols:
+        want = ["goal_daily_calories"] + (["allergens"] if "allergens" in cols else [])
+        row = conn.execute(
+            sa.text(f"SELECT {', '.join(want)} FROM users WHERE user_id = :u"), {"u": user_id}
+        ).mappings().first()
+        if row:
+            prof.goal_daily_calories = float(row["goal_daily_calories"]) if row["goal_daily_calories"] else None
+            if "allergens" in row:
+                prof.allergens = parse_allergens(row["allergens"])
+    if allergens is not None:
+        prof.allergens = [a.strip().lower() for a in allergens if a.strip()]
+
+    for mid, cnt, last in conn.execute(sa.text("""
+        SELECT meal_id, COUNT(*), MAX(date)
+        FROM plans_by_date
+        WHERE user_id = :u AND date <= :t
+        GROUP BY meal_id
+    """), {"u": user_id, "t": today_iso}):
+        prof.history[str(mid)] = int(cnt)
+        if str(last) >= since_iso:
+            prof.recent.append(str(mid))
+    return prof
+
+
+def _unit(x: np.ndarray) -> np.ndarray:
+    """Min-max scale to [0, 1]; NaN → 0.5 (neutral)."""
+    x = x.astype(np.float32, copy=True)
+    finite = np.isfinite(x)
+    if not finite.any():
+        return np.full_like(x, 0.5)
+    lo, hi = float(x[finite].min()), float(x[finite].max())
+    out = (x - lo) / (hi - lo) if hi > lo else np.full_like(x, 0.5)
+    out[~finite] = 0.5
+    return out
+
+
+def score_catalog(f: MealFeatures, prof: UserProfile) -> np.ndarray:
+    """One score per meal (higher is better); -inf for meals the user must not see."""
+    per_meal = (prof.goal_daily_calories or 2000.0) / 3.0
+    calorie_fit = 1.0 - np.minimum(1.0, np.abs(f.cals - per_meal) / per_meal)
+    protein = _unit(np.where(f.cals > 0, f.protein * 4.0 / np.maximum(f.cals, 1.0), np.nan))
+    rating = _unit(f.rating)
+    cheap = 1.0 - _unit(f.price)
+    quick = 1.0 - _unit(np.where(f.minutes > 0, f.minutes, np.nan))
+
+    # cuisine affinity from what the user has planned before
+    affinity = np.zeros(len(f), dtype=np.float32)
+    recent = np.zeros(len(f), dtype=np.float32)
+    if prof.history:
+        hist_idx = f.indices(prof.history.keys())
+        weights = np.array([prof.history[f.ids[i]] for i in hist_idx], dtype=np.float32)
+        per_cuisine = np.bincount(f.cuisine[hist_idx], weights=weights, minlength=len(f.cuisines))
+        if per_cuisine.max() > 0:
+            affinity = (per_cuisine / per_cuisine.max())[f.cuisine].astype(np.float32)
+        recent[f.indices(prof.recent)] = 1.0
+
+    s = (WEIGHTS["calorie_fit"] * calorie_fit + WEIGHTS["protein"] * protein
+         + WEIGHTS["rating"] * rating + WEIGHTS["cheap"] * cheap + WEIGHTS["quick"] * quick
+         + WEIGHTS["affinity"] * affinity + WEIGHTS["recent"] * recent)
+    s = s.astype(np.float32)
+    s[~f.safe_for(prof.allergens)] = -np.inf
+    return s
+
+
+def diversify(f: MealFeatures, scores: np.ndarray, depth: int) -> List[int]:
+    """
+    Greedy MMR over the top MMR_POOL: each pick costs its cuisine CUISINE_PENALTY
+    for later picks. Past the pool, the remaining allowed meals by score.
+    """
+    allowed = np.flatnonzero(np.isfinite(scores))
+    if not len(allowed):
+        return []
+    pool_n = min(MMR_POOL, len(allowed))
+    pool = allowed[np.argpartition(-scores[allowed], pool_n - 1)[:pool_n]]
+    base = scores[pool].astype(np.float64)
+    codes = f.cuisine[pool]
+    picked_per_cuisine = np.zeros(len(f.cuisines), dtype=np.float64)
+    taken = np.zeros(len(pool), dtype=bool)
+
+    order: List[int] = []
+    for _ in range(min(depth, len(pool))):
+        adj = base - CUISINE_PENALTY * picked_per_cuisine[codes]
+        adj[taken] = -np.inf
+        j = int(np.argmax(adj))
+        taken[j] = True
+        picked_per_cuisine[codes[j]] += 1
+        order.append(int(pool[j]))
+    if depth > len(pool) and len(allowed) > len(pool):
+        rest = np.setdiff1d(allowed, pool, assume_unique=True)
+        rest = rest[np.argsort(-scores[rest], kind="stable")][:depth - len(pool)]
+        order.extend(int(i) for i in rest)
+    return order
+
+
+def rank_for_user(f: MealFeatures, prof: UserProfile, depth: int = RANK_DEPTH) -> List[str]:
+    return [f.ids[i] for i in diversify(f, score_catalog(f, prof), depth)]
+
+
+# ---------- per-user ranking cache ----------
+_lock = threading.Lock()
+RankKey = Tuple[str, Tuple[str, ...], int]     # (user_id, allergens, MealFeatures.version)
+_cache: Dict[RankKey, Tuple[float, List[str], bool]] = {}
+
+
+def rank_depth(need: int) -> int:
+    """Depth to rank to so the first `need` meals are covered: a multiple of RANK_DEPTH."""
+    return RANK_DEPTH * max(1, -(-need // RANK_DEPTH))
+
+
+def cached_ranking(key: RankKey) -> Optional[Tuple[List[str], bool]]:
+    """(ranked ids, whether that's every allowed meal) if cached and fresh."""
+    with _lock:
+        hit = _cache.get(key)
+        if hit and hit[0] > time.monotonic():
+            return hit[1], hit[2]
+        _cache.pop(key, None)
+    return None
+
+
+def store_ranking(key: RankKey, ranked: List[str], complete: bool) -> None:
+    with _lock:
+        if len(_cache) > 10_000:
+            now = time.monotonic()
+            for k in [k for k, (exp, _, _) in _cache.items() if exp <= now]:
+                del _cache[k]
+        _cache[key] = (time.monotonic() + RANK_TTL_S, ranked, complete)
@@ -0,0 +1,78 @@
+# result_cache.py
+"""
+Serialised query results (e.g. /v1/recipes pages) in a byte-bounded LRU,
+stamped with the catalog version they were computed at.
+
+    body = RECIPE_PAGES.get(key, version)          # None → run the query
+    RECIPE_PAGES.put(key, version, body)
+
+The caller passes the current catalog_version() (it already reads it for the
+ETag). The cache keeps the one version it holds entries for; the first lookup
+with a newer version drops everything at once, so a change to `meals` is
+never served stale and nothing depends on a TTL. Hits skip the COUNT, the
+SELECT and the JSON encoding. recipe_cache_stats() is served at /v1/metrics.
+"""
+
+import os, threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+CACHE_BYTES = int(float(os.getenv("RECIPE_CACHE_MB", "32")) * 1024 * 1024)
+
+
+class ResultCache:
+    def __init__(self, max_bytes: int = CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.version: Optional[int] = None
+        self.data: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "too_large": 0}
+
+    def _sync(self, version: int) -> bool:
+        """Drop everything if the catalog moved past our version; False if `version` is older than ours."""
+        if self.version is None or version > self.version:
+            if self.data:
+                self.stats["invalidations"] += 1
+            self.data.clear()
+            self.size = 0
+            self.version = version
+        return version == self.version
+
+    def get(self, key: Hashable, version: int) -> Optional[bytes]:
+        with self.lock:
+            v = self.data.get(key) if self._sync(version) else None
+            if v is not None:
+                self.data.move_to_end(key)
+                self.stats["hits"] += 1
+            else:
+                self.stats["misses"] += 1
+            return v
+
+    def put(self, key: Hashable, version: int, body: bytes) -> None:
+        with self.lock:
+            if len(body) > self.max_bytes // 8:
+                self.stats["too_large"] += 1
+                return
+            if not self._sync(version):
+                return          # computed against a catalog that has since moved on
+            old = self.data.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.data[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, ev = self.data.popitem(last=False)
+                self.size -= len(ev)
+                self.stats["evictions"] += 1
+
+
+RECIPE_PAGES = ResultCache()
+
+
+def recipe_cache_stats() -> dict:
+    c = RECIPE_PAGES
+    with c.lock:
+        lookups = c.stats["hits"] + c.stats["misses"]
+        return {**c.stats, "entries": len(c.data), "cached_bytes": c.size, "max_bytes": c.max_bytes,
+                "version": c.version, "hit_rate": round(c.stats["hits"] / lookups, 4) if lookups else 0.0}
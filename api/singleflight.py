@@ -0,0 +1,148 @@
+# singleflight.py
+"""
+Request coalescing for expensive, idempotent computations.
+
+    @single_flight("stats", ttl=2.0)
+    def stats_summary(user_id: str): ...
+
+Calls are keyed by the function's bound arguments (defaults applied, `ignore`d
+ones such as a DB connection left out). While one call for a key is running,
+identical calls wait for it and get the same result (or exception) instead of
+recomputing. With ttl > 0 the finished result is also served for ttl seconds;
+expired results are swept by the next leader (at most once per ttl), so keys
+that are never asked for again don't pile up.
+
+Results are shared between callers: treat them as read-only. Writers call
+forget() on the readers they affect so the next read starts fresh rather than
+joining a computation that began before the write.
+
+Works for sync functions (FastAPI runs those in worker threads); stats at
+flight_stats().
+"""
+
+import functools, inspect, threading, time
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+_registry: Dict[str, "SingleFlight"] = {}
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "expires")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.expires = 0.0
+
+
+class SingleFlight:
+    def __init__(self, name: str, fn: Callable, ttl: float, ignore: Iterable[str]):
+        self.name, self.fn, self.ttl = name, fn, ttl
+        self.ignore = set(ignore)
+        self.sig = inspect.signature(fn)
+        self.lock = threading.Lock()
+        self.calls: Dict[Hashable, _Call] = {}
+        self.swept = 0.0
+        self.stats = {"leaders": 0, "joined": 0, "cached": 0, "errors": 0, "expired": 0}
+
+    def key(self, args, kwargs) -> Hashable:
+        bound = self.sig.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return tuple((k, _freeze(v)) for k, v in bound.arguments.items() if k not in self.ignore)
+
+    def __call__(self, *args, **kwargs):
+        key = self.key(args, kwargs)
+        now = time.monotonic()
+        with self.lock:
+            call = self.calls.get(key)
+            if call is not None and call.done.is_set() and call.expires <= now:
+                del self.calls[key]
+                call = None
+            if call is None:
+                if now - self.swept >= max(self.ttl, 1.0):
+                    self._sweep(now)
+                call = self.calls[key] = _Call()
+                leader = True
+                self.stats["leaders"] += 1
+            else:
+                leader = False
+                self.stats["cached" if call.done.is_set() else "joined"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self.fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            with self.lock:
+                self.stats["errors"] += 1
+            raise
+        finally:
+            with self.lock:
+                # errors are never cached; results only for ttl
+                call.expires = time.monotonic() + (self.ttl if call.error is None else 0.0)
+                if call.expires <= time.monotonic() and self.calls.get(key) is call:
+                    del self.calls[key]
+            call.done.set()
+        return call.result
+
+    def _sweep(self, now: float) -> None:
+        """Drop finished, expired results (caller holds the lock)."""
+        dead = [k for k, c in self.calls.items() if c.done.is_set() and c.expires <= now]
+        for k in dead:
+            del self.calls[k]
+        self.stats["expired"] += len(dead)
+        self.swept = now
+
+    def forget(self) -> None:
+        """Drop cached results and detach in-flight calls (their waiters still get them)."""
+        with self.lock:
+            self.calls.clear()
+
+
+def _freeze(v) -> Hashable:
+    if isinstance(v, (list, tuple)):
+        return tuple(_freeze(x) for x in v)
+    if isinstance(v, dict):
+        return tuple(sorted((k, _freeze(x)) for k, x in v.items()))
+    if isinstance(v, (set, frozenset)):
+        return tuple(sorted(_freeze(x) for x in v))
+    try:
+        hash(v)
+        return v
+    except TypeError:
+        return repr(v)
+
+
+def single_flight(name: str, ttl: float = 0.0, ignore: Tuple[str, ...] = ()):
+    """Decorator; keeps the wrapped signature so FastAPI still sees the route parameters."""
+    def deco(fn):
+        sf = SingleFlight(name, fn, ttl, ignore)
+        _registry[name] = sf
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return sf(*args, **kwargs)
+
+        wrapper.forget = sf.forget
+        return wrapper
+    return deco
+
+
+def forget(*names: str) -> None:
+    for n in names:
+        if n in _registry:
+            _registry[n].forget()
+
+
+def flight_stats() -> dict:
+    out = {}
+    for name, sf in _registry.items():
+        with sf.lock:
+            out[name] = {**sf.stats, "ttl": sf.ttl, "entries": len(sf.calls)}
+    return out
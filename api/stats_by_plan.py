@@ -1,81 +1,46 @@
 #!/usr/bin/env python3
-import os, json, sqlite3, argparse
+import argparse
 from datetime import date
 
-DB_PATH_DEFAULT = "/Users/lukeyp02/Desktop/scranly/api/data/scranly.db"
+import sqlalchemy as sa
 
-def get_conn(db_path: str):
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def table_has_column(conn, table: str, col: str) -> bool:
-    cur = conn.execute(f"PRAGMA table_info({table})")
-    return any(row["name"] == col for row in cur.fetchall())
-
-def ensure_columns(conn):
-    # Add columns to plans if they don't exist
-    alters = []
-    if not table_has_column(conn, "plans", "meals_count"):
-        alters.append("ALTER TABLE plans ADD COLUMN meals_count INTEGER DEFAULT 0")
-    if not table_has_column(conn, "plans", "money_saved"):
-        alters.append("ALTER TABLE plans ADD COLUMN money_saved REAL DEFAULT 0.0")
-    if not table_has_column(conn, "plans", "time_saved_min"):
-        alters.append("ALTER TABLE plans ADD COLUMN time_saved_min INTEGER DEFAULT 0")
-
-    for ddl in alters:
-        conn.execute(ddl)
-    if alters:
-        conn.commit()
+import db
+import migrations
 
 def find_current_plan(conn, user_id: str):
     today = date.today().isoformat()
-    cur = conn.execute("""
-        SELECT id, user_id, start_date, end_date, length_days, plan_json
+    return conn.execute(sa.text("""
+        SELECT id, user_id, start_date, end_date, length_days
         FROM plans
-        WHERE user_id = ?
-          AND start_date <= ?
-          AND end_date   >= ?
+        WHERE user_id = :u
+          AND start_date <= :t
+          AND end_date   >= :t
         ORDER BY start_date DESC
         LIMIT 1
-    """, (user_id, today, today))
-    return cur.fetchone()
-
-def count_meals_in_plan_json(raw_json: str | None) -> int:
-    if not raw_json:
-        return 0
-    try:
-        obj = json.loads(raw_json)
-    except Exception:
-        return 0
+    """), {"u": user_id, "t": today}).mappings().first()
 
-    days = obj.get("days", [])
-    total = 0
-    for d in days:
-        for slot in ("breakfast", "lunch", "dinner"):
-            items = d.get(slot) or []
-            # Count each entry in the slot as a planned meal
-            total += sum(1 for _ in items)
-    return total
+def count_meals_in_plan(conn, plan_id: int) -> int:
+    # plans_by_date is the source of truth; plans.plan_json is no longer maintained
+    return int(conn.execute(
+        sa.text("SELECT COUNT(*) FROM plans_by_date WHERE plan_id = :p"), {"p": plan_id}
+    ).scalar_one() or 0)
 
 def annotate_plan(conn, plan_id: int, meals_count: int, money_saved: float, time_saved_min: int):
-    conn.execute("""
+    conn.execute(sa.text("""
         UPDATE plans
-        SET meals_count = ?, money_saved = ?, time_saved_min = ?
-        WHERE id = ?
-    """, (meals_count, money_saved, time_saved_min, plan_id))
-    conn.commit()
+        SET meals_count = :n, money_saved = :m, time_saved_min = :t
+        WHERE id = :p
+    """), {"n": meals_count, "m": money_saved, "t": time_saved_min, "p": plan_id})
 
 def verify_print(conn, plan_id: int):
-    cur = conn.execute("""
+    row = conn.execute(sa.text("""
         SELECT id, user_id, start_date, end_date, length_days,
                COALESCE(meals_count,0) AS meals_count,
                COALESCE(money_saved,0.0) AS money_saved,
                COALESCE(time_saved_min,0) AS time_saved_min
         FROM plans
-        WHERE id = ?
-    """, (plan_id,))
-    row = cur.fetchone()
+        WHERE id = :p
+    """), {"p": plan_id}).mappings().first()
     if not row:
         print("❌ Verification failed: plan not found after update.")
         return
@@ -92,22 +57,22 @@ def verify_print(conn, plan_id: int):
 
 def main():
     parser = argparse.ArgumentParser(description="Annotate CURRENT plan with meals_count, money_saved, time_saved_min.")
-    parser.add_argument("--db", default=os.getenv("DB_PATH", DB_PATH_DEFAULT), help="Path to SQLite DB")
+    parser.add_argument("--db", help="Path to a SQLite DB (default: $DATABASE_URL, else $DB_PATH)")
     parser.add_argument("--user", default="testing", help="User ID to target")
     parser.add_argument("--money", type=float, default=11.89, help="Money saved to write (e.g., 11.89)")
     parser.add_argument("--time", type=int, default=67, help="Time saved (minutes) to write (e.g., 67)")
     args = parser.parse_args()
 
-    conn = get_conn(args.db)
-    try:
-        ensure_columns(conn)
+    engine = db.make_engine(db.database_url(args.db))
+    with engine.begin() as conn:
+        migrations.upgrade(conn)   # plans.meals_count / money_saved / time_saved_min
 
         plan = find_current_plan(conn, args.user)
         if not plan:
             print(f"⚠️ No current plan for user '{args.user}'. Nothing to annotate.")
             return
 
-        meals_count = count_meals_in_plan_json(plan["plan_json"])
+        meals_count = count_meals_in_plan(conn, plan["id"])
 
         # Write values
         annotate_plan(conn, plan_id=plan["id"],
@@ -122,8 +87,7 @@ def main():
         print(f"   • time_saved_min= {args.time} min")
 
         verify_print(conn, plan_id=plan["id"])
-    finally:
-        conn.close()
+    engine.dispose()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,143 @@
+# suggest.py
+"""
+Search-as-you-type completions for the Discover box (GET /v1/recipes/suggest).
+
+Terms are recipe titles, cuisines, tags and (normalised) ingredient names. Every
+word start of a term is a key ("lemon chicken" → "lemon chicken", "chicken"),
+and the keys live in one sorted list, so a prefix is two bisects to a
+contiguous range. Terms are weighted by popularity:
+
+    meal weight = 1 + log1p(times planned in plans_by_date) + user_rating / 5
+    term weight = Σ weight of the meals it appears in (a title: its own meal)
+
+Short prefixes match most of the list, so the top completions for every 1- and
+2-character prefix are computed at build time; longer prefixes scan their
+(small) range. Either way no SQL runs per keystroke.
+
+The index is held in a catalog_changes.CatalogCache, so it is rebuilt when
+catalog_version() moves, without blocking requests on the old one.
+"""
+
+import bisect, heapq, json, math, re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import sqlalchemy as sa
+
+from catalog_changes import CatalogCache, catalog_version
+from catalog_matcher import normalise_ingredient
+
+TOP_K = 10
+PRECOMPUTE_LEN = 2
+KINDS = ("recipe", "cuisine", "tag", "ingredient")
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+@dataclass
+class Term:
+    text: str                  # as shown
+    kind: str                  # one of KINDS
+    weight: float
+    meal_id: Optional[str] = None   # recipes only
+
+
+@dataclass
+class SuggestIndex:
+    version: int
+    terms: List[Term]
+    keys: List[str]            # sorted, lowercase word-start keys
+    key_term: List[int]        # term id per key
+    top: Dict[str, List[int]]  # prefix (≤ PRECOMPUTE_LEN chars) → best term ids
+
+    def suggest(self, prefix: str, k: int = TOP_K) -> List[Term]:
+        p = " ".join(_WORD.findall(prefix.lower()))
+        if not p:
+            return []
+        if len(p) <= PRECOMPUTE_LEN and k <= TOP_K:
+            return [self.terms[t] for t in self.top.get(p, ())[:k]]
+        lo = bisect.bisect_left(self.keys, p)
+        hi = bisect.bisect_right(self.keys, p + "\uffff", lo)
+        ids = set(self.key_term[lo:hi])
+        return [self.terms[t] for t in heapq.nlargest(k, ids, key=lambda t: (self.terms[t].weight, -t))]
+
+
+def _listish(raw) -> List[str]:
+    s = str(raw or "").strip()
+    if s.startswith("["):
+        try:
+            return [str(t).strip() for t in json.loads(s) if str(t).strip()]
+        except (ValueError, TypeError):
+            pass
+    return [t.strip(" '\"") for t in s.strip("[]").split(",") if t.strip(" '\"")]
+
+
+def build_suggest_index(version: int, meals: List[Tuple[str, str, Optional[str], List[str], List[str], float]]
+                        ) -> SuggestIndex:
+    """meals: (meal_id, title, cuisine, tags, ingredient names, meal weight)."""
+    terms: List[Term] = []
+    shared: Dict[Tuple[str, str], int] = {}     # (kind, lowercase text) → term id
+
+    def add(kind: str, text: str, w: float) -> None:
+        j = shared.get((kind, text.lower()))
+        if j is None:
+            shared[(kind, text.lower())] = len(terms)
+            terms.append(Term(text=text, kind=kind, weight=w))
+        else:
+            terms[j].weight += w
+
+    for mid, title, cuisine, tags, ings, w in meals:
+        if title:
+            terms.append(Term(text=title, kind="recipe", weight=w, meal_id=mid))
+        if cuisine:
+            add("cuisine", cuisine, w)
+        for t in set(tags):
+            add("tag", t, w)
+        for i in set(ings):
+            add("ingredient", i, w)
+
+    pairs: List[Tuple[str, int]] = []
+    for j, t in enumerate(terms):
+        words = _WORD.findall(t.text.lower())
+        for s in range(len(words)):
+            pairs.append((" ".join(words[s:]), j))
+    pairs.sort()
+
+    top: Dict[str, List[int]] = {}
+    best: Dict[str, Dict[int, float]] = {}
+    for key, j in pairs:
+        for n in range(1, min(PRECOMPUTE_LEN, len(key)) + 1):
+            best.setdefault(key[:n], {})[j] = terms[j].weight
+    for p, cand in best.items():
+        top[p] = heapq.nlargest(TOP_K, cand, key=lambda j: (cand[j], -j))
+    for t in terms:
+        t.weight = round(t.weight, 3)
+    return SuggestIndex(version=version, terms=terms, keys=[k for k, _ in pairs],
+                        key_term=[j for _, j in pairs], top=top)
+
+
+def load_suggest_index(conn) -> SuggestIndex:
+    version = catalog_version(conn)
+    planned = {str(m): int(n) for m, n in conn.execute(sa.text(
+        "SELECT meal_id, COUNT(*) FROM plans_by_date GROUP BY meal_id"))}
+    meals = []
+    for mid, title, cuisine, tags, raw, rating in conn.execute(sa.text(
+        "SELECT CAST(id AS TEXT), title, cuisine, tags, ingredients_json, user_rating FROM meals"
+    )):
+        try:
+            parsed = json.loads(raw) if raw else []
+        except (TypeError, ValueError):
+            parsed = []
+        ings = [normalise_ingredient(str(i.get("ingredient") or i.get("name") or ""))
+                for i in parsed if isinstance(i, dict)]
+        w = 1.0 + math.log1p(planned.get(str(mid), 0)) + float(rating or 0.0) / 5.0
+        meals.append((str(mid), str(title or "").strip(), (str(cuisine).strip() or None) if cuisine else None,
+                      _listish(tags), [i for i in ings if i], w))
+    return build_suggest_index(version, meals)
+
+
+_CACHE = CatalogCache("suggest index", load_suggest_index)
+
+
+def get_suggest_index(engine) -> SuggestIndex:
+    return _CACHE.get(engine)
@@ -0,0 +1,94 @@
+# swaps.py
+"""
+"Swap this meal" suggestions for one plan cell, ranked by what the swap does to
+the week's shopping bill and to that day's macros.
+
+The week's basket is held as per-ingredient use counts (IngredientIndex.basket_counts).
+Taking the current meal out is one decrement of its ingredients; every candidate's
+marginal cost against what's left is then a single gather + bincount over the
+index (ingredients already bought are free), so no basket is rebuilt per candidate.
+"""
+
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ingredient_index import IngredientIndex
+from meal_features import MealFeatures
+from plan_generator import MacroBounds, DEFAULT_KCAL, day_cost, slot_candidates
+
+SWAP_FIT_GBP = 5.0   # £ a candidate may cost extra per unit of day_cost it fixes
+
+Cell = Tuple[str, str, str]   # (date, slot, meal_id)
+
+
+@dataclass
+class Swap:
+    meal_id: str
+    marginal_cost: float      # £ of new ingredients this meal adds to the week
+    saving: float             # £ no longer needed once the current meal is removed
+    net_cost: float           # marginal_cost - saving
+    day_kcal: float           # the day's kcal after the swap
+    delta_kcal: float
+    shared_ingredients: int   # ingredients it shares with the rest of the week
+    score: float              # lower is better
+
+
+def suggest_swaps(f: MealFeatures, idx: IngredientIndex, cells: Sequence[Cell], date: str, slot: str,
+                  goal_kcal: Optional[float] = None, allergens=None, k: int = 10,
+                  macros: Optional[MacroBounds] = None) -> List[Swap]:
+    """cells: every (date, slot, meal_id) in the plan; the first one at (date, slot) is replaced."""
+    current = next((mid for d, s, mid in cells if d == date and s == slot), None)
+    if current is None or current not in f.row_of:
+        return []
+    cur = f.row_of[current]
+    goal = float(goal_kcal or DEFAULT_KCAL)
+    macros = macros or MacroBounds()
+
+    # week basket without the current meal
+    week_rows = [f.row_of[mid] for _, _, mid in cells if mid in f.row_of]
+    have = idx.basket_counts(week_rows)
+    cur_ings = idx.ingredients_of(cur)
+    have[cur_ings] -= 1
+    freed = (have[cur_ings] == 0) & ~idx.staple[cur_ings]
+    saving = float(idx.meal_cost[idx.meal_ptr[cur]:idx.meal_ptr[cur + 1]][freed].sum())
+    added = idx.marginal_costs(have)
+
+    # the day without the current meal, then every candidate's day in one pass
+    day_rows = [f.row_of[mid] for d, _, mid in cells if d == date and mid in f.row_of]
+    base = np.array([f.cals[day_rows].sum(), f.protein[day_rows].sum(),
+                     f.carbs[day_rows].sum(), f.fat[day_rows].sum()], dtype=np.float64)
+    fit_now = float(day_cost(*base, goal, macros))
+    base -= (f.cals[cur], f.protein[cur], f.carbs[cur], f.fat[cur])
+    day_kcal = base[0] + f.cals
+    fit = day_cost(day_kcal, base[1] + f.protein, base[2] + f.carbs, base[3] + f.fat, goal, macros)
+
+    net = added - saving
+    score = net + SWAP_FIT_GBP * (fit - fit_now)
+
+    ok = np.zeros(len(f), dtype=bool)
+    ok[slot_candidates(f, f.safe_for(allergens), slot, need=k)] = True
+    ok[f.indices({mid for _, _, mid in cells})] = False
+    rows = np.flatnonzero(ok)
+    if not len(rows):
+        return []
+    k = min(k, len(rows))
+    top = rows[np.argpartition(score[rows], k - 1)[:k]]
+    top = top[np.argsort(score[top])]
+
+    in_week = np.flatnonzero((have > 0) & ~idx.staple)
+    shared = idx.shared_counts(in_week)
+    return [
+        Swap(
+            meal_id=f.ids[r],
+            marginal_cost=round(float(added[r]), 2),
+            saving=round(saving, 2),
+            net_cost=round(float(net[r]), 2),
+            day_kcal=round(float(day_kcal[r]), 1),
+            delta_kcal=round(float(f.cals[r] - f.cals[cur]), 1),
+            shared_ingredients=int(shared[r]),
+            score=round(float(score[r]), 4),
+        )
+        for r in top
+    ]
@@ -0,0 +1,46 @@
+# conftest.py
+"""
+Backend fixtures for the data-layer tests (pip install pytest; run from api/):
+
+    python -m pytest -q tests
+    TEST_DATABASE_URL=postgresql+psycopg://scranly@localhost/scranly_test python -m pytest -q tests
+
+Every test taking `db_url` runs once on a fresh SQLite file and, when
+TEST_DATABASE_URL is set, once more on that Postgres database. It must be a
+scratch database: its public schema is dropped before each test.
+"""
+
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+BACKENDS = ["sqlite"] + (["postgresql"] if os.getenv("TEST_DATABASE_URL") else [])
+
+
+@pytest.fixture(params=BACKENDS)
+def db_url(request, tmp_path):
+    db.forget_tables()
+    if request.param == "sqlite":
+        yield db.database_url(str(tmp_path / "scranly.db"))
+    else:
+        url = os.environ["TEST_DATABASE_URL"]
+        engine = db.make_engine(url)
+        with engine.begin() as conn:
+            conn.exec_driver_sql("DROP SCHEMA public CASCADE")
+            conn.exec_driver_sql("CREATE SCHEMA public")
+        engine.dispose()
+        yield url
+    db.forget_tables()
+
+
+@pytest.fixture
+def engine(db_url):
+    import migrations
+    migrations.migrate(db_url)
+    eng = db.make_engine(db_url)
+    yield eng
+    eng.dispose()
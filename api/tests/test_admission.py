@@ -0,0 +1,113 @@
+# test_admission.py
+"""Admission queue: slot handover, timeouts that race a handover, and cancelled waiters."""
+
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, ClassLimits
+
+
+def _controller(max_inflight=1, max_queue=4, max_queue_ms=1000):
+    return AdmissionController({"c": ClassLimits(max_inflight, max_queue, max_queue_ms)})
+
+
+def _state(ctrl):
+    st = ctrl.classes["c"]
+    return st.inflight, len(st.waiters)
+
+
+def test_released_slot_goes_to_the_oldest_waiter():
+    ctrl = _controller()
+
+    async def run():
+        assert await ctrl.acquire("c") is None
+        first = asyncio.ensure_future(ctrl.acquire("c"))
+        second = asyncio.ensure_future(ctrl.acquire("c"))
+        await asyncio.sleep(0.01)
+        assert _state(ctrl) == (1, 2) and not first.done()
+        ctrl.release("c")
+        assert await first is None and not second.done()
+        assert _state(ctrl) == (1, 1)                   # handed over, never freed
+        ctrl.release("c")
+        assert await second is None
+        ctrl.release("c")
+        assert _state(ctrl) == (0, 0)
+
+    asyncio.run(run())
+    assert ctrl.classes["c"].counters["admitted"] == 3
+
+
+def test_queue_full_and_timeout_shed_without_leaking_slots():
+    ctrl = _controller(max_queue=1, max_queue_ms=30)
+
+    async def run():
+        assert await ctrl.acquire("c") is None
+        waiting = asyncio.ensure_future(ctrl.acquire("c"))
+        await asyncio.sleep(0)
+        assert await ctrl.acquire("c") == "queue_full"
+        assert await waiting == "timeout"
+        assert _state(ctrl) == (1, 0)
+        ctrl.release("c")
+        assert _state(ctrl) == (0, 0)
+
+    asyncio.run(run())
+    counters = ctrl.classes["c"].counters
+    assert (counters["shed_queue_full"], counters["shed_timeout"]) == (1, 1)
+
+
+def test_slot_handed_over_as_the_wait_times_out_is_kept(monkeypatch):
+    ctrl = _controller()
+    real_wait_for = asyncio.wait_for
+
+    async def handover_then_timeout(aw, timeout):
+        ctrl.release("c")                               # the holder finishes at the deadline
+        aw.cancel()
+        raise asyncio.TimeoutError
+
+    async def run():
+        assert await ctrl.acquire("c") is None
+        monkeypatch.setattr(asyncio, "wait_for", handover_then_timeout)
+        try:
+            assert await ctrl.acquire("c") is None
+        finally:
+            monkeypatch.setattr(asyncio, "wait_for", real_wait_for)
+        assert _state(ctrl) == (1, 0)
+        ctrl.release("c")
+        assert _state(ctrl) == (0, 0)
+
+    asyncio.run(run())
+    assert ctrl.classes["c"].counters["shed_timeout"] == 0
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    ctrl = _controller()
+
+    async def run():
+        assert await ctrl.acquire("c") is None
+        gone = asyncio.ensure_future(ctrl.acquire("c"))
+        await asyncio.sleep(0.01)
+        gone.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await gone
+        assert _state(ctrl) == (1, 0)
+        ctrl.release("c")                               # nobody left to hand it to
+        assert _state(ctrl) == (0, 0)
+
+    asyncio.run(run())
+
+
+def test_cancel_racing_a_handover_gives_the_slot_back():
+    ctrl = _controller()
+
+    async def run():
+        assert await ctrl.acquire("c") is None
+        waiter = asyncio.ensure_future(ctrl.acquire("c"))
+        await asyncio.sleep(0.01)
+        waiter.cancel()                                 # the client goes away …
+        ctrl.release("c")                               # … as the slot is handed to it
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert _state(ctrl) == (0, 0)
+
+    asyncio.run(run())
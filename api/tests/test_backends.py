@@ -0,0 +1,89 @@
+# test_backends.py
+"""The same data-layer checks on every backend in conftest.BACKENDS."""
+
+import json
+
+import sqlalchemy as sa
+
+import catalog_matcher
+import db
+import embeddings
+import ingest_meals
+import migrations
+from catalog_changes import catalog_version
+
+FEED = [
+    {"id": "m1", "title": "Lemon chicken traybake", "meal_type": "dinner", "cuisine": "British",
+     "tags": ["Quick"], "ingredients_json": [{"ingredient": "chicken breasts", "quantity": "400 g"},
+                                             {"ingredient": "lemon", "quantity": "1"}],
+     "nutrition_json": {"totals": {"kcal": 500, "protein_g": 40, "carbs_g": 20, "fat_g": 10}},
+     "price_json": {"items": [{"ingredient": "lemon", "line_cost_gbp": 0.3}]}},
+    {"id": "m2", "title": "Chicken fajitas", "meal_type": "dinner", "cuisine": "Mexican",
+     "ingredients_json": [{"ingredient": "chicken breasts", "quantity": "300 g"},
+                          {"ingredient": "tortillas", "quantity": "4"}]},
+    {"id": "bad", "title": "List price", "price_json": [1, 2]},
+]
+
+
+def _ingest(db_url, tmp_path, feed=FEED):
+    path = tmp_path / "feed.jsonl"
+    path.write_text("\n".join(json.dumps(r) for r in feed) + "\n")
+    return ingest_meals.run(db_url, str(path), workers=1, batch_size=100, dry_run=False, force=False)
+
+
+def test_migrations_apply_once(engine):
+    with engine.begin() as conn:
+        assert migrations.pending(conn) == []
+        assert migrations.mismatched(conn) == []
+        assert migrations.upgrade(conn) == []
+
+
+def test_upsert_and_returning_id(engine):
+    item = {"aisle": "Meat", "emoji": "🍗", "price_per_pack": 3.5, "pack_amount": 500, "pack_unit": "grams"}
+    with engine.begin() as conn:
+        a = db.insert_returning_id(conn, "catalog_items", {"name": "Chicken breast", **item})
+        b = db.insert_returning_id(conn, "catalog_items", {"name": "Lemons", **item})
+        assert a != b
+        for kcal in (1000.0, 1234.0):
+            db.upsert(conn, "track", [{"user_id": "u1", "date": "2026-01-01", "calories": kcal,
+                                       "protein": 1.0, "carbs": 2.0, "fat": 3.0}], key=("user_id", "date"))
+        rows = conn.execute(sa.text("SELECT calories FROM track WHERE user_id = 'u1'")).scalars().all()
+    assert rows == [1234.0]
+
+
+def test_ingest_is_idempotent(engine, db_url, tmp_path):
+    stats = _ingest(db_url, tmp_path)
+    assert (stats["upserted"], stats["invalid"]) == (2, 1)
+    assert _ingest(db_url, tmp_path)["unchanged"] == 2
+    with engine.connect() as conn:
+        cals = conn.execute(sa.text("SELECT cals FROM meals WHERE id = 'm1'")).scalar_one()
+        ings = conn.execute(sa.text(
+            "SELECT ingredient, amount, unit FROM meal_ingredients WHERE meal_id = 'm1' ORDER BY ingredient"
+        )).all()
+    assert cals == 500.0
+    assert [tuple(r) for r in ings] == [("chicken breast", 400.0, "grams"), ("lemon", 1.0, "count")]
+
+
+def test_embeddings_round_trip_without_catalog_change(engine, db_url, tmp_path):
+    _ingest(db_url, tmp_path)
+    with engine.connect() as conn:
+        before = catalog_version(conn)
+    assert embeddings.run(db_url, dry_run=False) == 2
+    with engine.connect() as conn:
+        index = embeddings.EmbeddingIndex.from_rows(conn.execute(sa.text(embeddings.SELECT_EMBEDDINGS)).all())
+        assert catalog_version(conn) == before      # embedding isn't a catalog column
+    assert len(index) == 2
+    assert index.similar("m1", k=1)[0][0] == "m2"
+
+
+def test_catalog_matcher_upserts(engine, db_url, tmp_path):
+    _ingest(db_url, tmp_path)
+    with engine.begin() as conn:
+        cid = db.insert_returning_id(conn, "catalog_items", {
+            "name": "Chicken breast", "aisle": "Meat", "emoji": "🍗",
+            "price_per_pack": 3.5, "pack_amount": 500, "pack_unit": "grams"})
+    assert catalog_matcher.run(db_url)["chicken breast"][0] == cid
+    with engine.connect() as conn:
+        mapped = conn.execute(sa.text(
+            "SELECT catalog_id FROM ingredient_catalog_map WHERE ingredient = 'chicken breast'")).scalar_one()
+    assert mapped == cid
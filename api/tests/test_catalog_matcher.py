@@ -0,0 +1,40 @@
+# test_catalog_matcher.py
+"""Ingredient → catalog item matching: the head-noun bonus must not cross products."""
+
+import pytest
+
+from catalog_matcher import MIN_CONFIDENCE, CatalogMatcher, normalise_ingredient
+
+CATALOG = [(1, "Milk"), (2, "Noodles"), (3, "Butter"), (4, "Potatoes"), (5, "Onion"),
+           (6, "Olive oil"), (7, "Chicken breast"), (8, "Rice")]
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    return CatalogMatcher(CATALOG)
+
+
+@pytest.mark.parametrize("raw, name", [
+    ("2 tablespoons olive oil", "Olive oil"),
+    ("red onion", "Onion"),
+    ("chicken breasts", "Chicken breast"),
+    ("whole milk", "Milk"),
+    ("baby potatoes", "Potatoes"),
+    ("jasmine rice", "Rice"),
+])
+def test_matches(matcher, raw, name):
+    cid, conf = matcher.match(raw)
+    assert matcher.names[cid] == name and conf >= MIN_CONFIDENCE
+
+
+@pytest.mark.parametrize("raw", [
+    "almond milk", "oat milk", "coconut milk", "zucchini noodles", "peanut butter",
+    "sweet potato", "cauliflower rice",
+])
+def test_other_products_stay_below_the_bar(matcher, raw):
+    assert matcher.match(raw)[1] < MIN_CONFIDENCE
+
+
+def test_normalise():
+    assert normalise_ingredient("1 can (400 g) Chickpeas, drained") == "chickpea"
+    assert normalise_ingredient("Tomato | hints: ~240 g") == "tomato"
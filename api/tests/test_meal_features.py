@@ -0,0 +1,22 @@
+# test_meal_features.py
+"""Allergen filters hold past the first 64-bit mask word."""
+
+import json
+
+import sqlalchemy as sa
+
+from meal_features import load_meal_features
+
+
+def test_allergens_past_bit_64_still_filter(engine):
+    rows = [{"id": f"m{i}", "t": f"Meal {i}", "a": json.dumps([f"a{i}", "shared"])} for i in range(70)]
+    with engine.begin() as conn:
+        conn.execute(sa.text("INSERT INTO meals (id, title, allergens) VALUES (:id, :t, :a)"), rows)
+        f = load_meal_features(conn)
+    assert f.allergen_bits.shape == (70, 2)
+    for name, meal in (("a3", "m3"), ("a69", "m69")):
+        ok = f.safe_for([name])
+        assert not ok[f.row_of[meal]] and ok.sum() == 69
+    assert f.safe_for(["A69 ", "nonexistent"]).sum() == 69
+    assert not f.safe_for(["shared"]).any()
+    assert f.safe_for([]).all()
@@ -0,0 +1,50 @@
+# test_nutrition.py
+"""nutrition.recompute rewrites only what an override or a manual reference changes."""
+
+import json
+
+import sqlalchemy as sa
+
+import nutrition
+
+
+def _entry(name, fdc, grams, kcal, label):
+    return {"ingredient": name, "fdcId": fdc, "fdcLabel": label, "grams_est": grams,
+            "kcal": kcal, "protein_g": 1.0, "carbs_g": 2.0, "fat_g": 0.5}
+
+
+MEALS = {   # per-100 g kcal differs between entries of fdc 1, so the median row fits neither exactly
+    "a": [_entry("tomato", 1, 100, 18.0, "Tomatoes, raw"), _entry("salt", 2, 5, 35.1, "Pecans, salted")],
+    "b": [_entry("tomato", 1, 200, 38.0, "Tomatoes, raw"), _entry("salt", 2, 2, 14.0, "Pecans, salted")],
+    "c": [_entry("tomato", 1, 150, 26.0, "Tomatoes, raw")],
+}
+
+
+def _load(engine):
+    with engine.begin() as conn:
+        for mid, parts in MEALS.items():
+            totals = {n: round(sum(p[n] for p in parts), 2) for n in nutrition.NUTRIENTS}
+            conn.execute(sa.text("INSERT INTO meals (id, title, nutrition_json) VALUES (:i, :t, :n)"),
+                         {"i": mid, "t": mid, "n": json.dumps({"by_ingredient": parts, "totals": totals})})
+        m = nutrition.load_matrix(conn)
+        nutrition.seed_reference(conn, m)
+        return m, nutrition.load_reference(conn)
+
+
+def test_derived_reference_changes_nothing(engine):
+    m, ref = _load(engine)
+    assert not nutrition.recompute(m, ref, {}).changed.any()
+
+
+def test_override_rewrites_only_its_entries(engine):
+    m, ref = _load(engine)
+    ref[9] = ("Salt, table", "manual", (0.0, 0.0, 0.0, 0.0))
+    r = nutrition.recompute(m, ref, {"salt": 9})
+    assert [m.ids[i] for i in r.changed.nonzero()[0]] == ["a", "b"]
+    a = m.ids.index("a")
+    assert r.totals[a].tolist() == [18.0, 1.0, 2.0, 0.5]      # tomato entry kept as stored
+
+
+def test_suspects_singularise_labels(engine):
+    m, _ = _load(engine)
+    assert [(k, lab) for k, lab, _ in nutrition.suspects(m)] == [("salt", "Pecans, salted")]
@@ -0,0 +1,44 @@
+# test_pack_optimiser.py
+"""cheapest_packs against brute force over pack counts."""
+
+import itertools, math, random
+
+import pytest
+
+from pack_optimiser import PackOption, cheapest_packs
+
+
+def _packs(*sizes_prices):
+    return [PackOption(catalog_id=i, name=f"p{i}", aisle="", emoji="", pack_amount=a, pack_unit="grams",
+                       price_per_pack=p, size_label="") for i, (a, p) in enumerate(sizes_prices)]
+
+
+def _brute(need, options):
+    ranges = [range(math.ceil(need / o.pack_amount) + 1) for o in options]
+    return min(sum(o.price_per_pack * n for o, n in zip(options, ns))
+               for ns in itertools.product(*ranges)
+               if sum(o.pack_amount * n for o, n in zip(options, ns)) >= need - 1e-9)
+
+
+@pytest.mark.parametrize("need, options, cost", [
+    (2999, _packs((397, 1.55), (500, 1.79), (750, 2.75)), 10.74),     # 6 × 500 g
+    (740, _packs((2.5, 3.75), (1.5, 2.50)), 1110.0),
+    (1, _packs((400, 1.0), (1000, 2.0)), 1.0),
+])
+def test_known_cases(need, options, cost):
+    chosen, got, bought = cheapest_packs(need, options)
+    assert got == pytest.approx(cost)
+    assert bought >= need
+
+
+def test_matches_brute_force():
+    rng = random.Random(7)
+    for _ in range(400):
+        options = _packs(*[(rng.choice([rng.randint(1, 12) * 50, round(rng.uniform(0.3, 9), 2), rng.randint(1, 6)]),
+                            round(rng.uniform(0.5, 6), 2)) for _ in range(rng.randint(2, 3))])
+        need = rng.choice([rng.uniform(0.1, 40), rng.uniform(50, 3000)])
+        if math.prod(math.ceil(need / o.pack_amount) + 1 for o in options) > 20_000:
+            continue
+        chosen, cost, bought = cheapest_packs(need, options)
+        assert bought >= need - 1e-9
+        assert cost == pytest.approx(_brute(need, options)), (need, options)
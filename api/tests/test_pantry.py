@@ -0,0 +1,40 @@
+# test_pantry.py
+"""Pantry names that aren't exact vocabulary keys still resolve, without crossing products."""
+
+import pytest
+
+from ingredient_index import build_ingredient_index
+from pantry import pantry_match, resolve_pantry
+
+MEALS = {
+    "m1": ["chicken breast", "jasmine rice", "lemon"],
+    "m2": ["chicken thigh", "basmati rice", "green onion"],
+    "m3": ["chicken broth", "cauliflower rice", "rice vinegar"],
+    "m4": ["olive oil", "salt", "tomato"],
+}
+
+
+@pytest.fixture(scope="module")
+def idx():
+    return build_ingredient_index(list(MEALS), {m: [{"ingredient": i} for i in ings] for m, ings in MEALS.items()})
+
+
+def _resolve(idx, names):
+    ids, unknown = resolve_pantry(idx, names)
+    return sorted(idx.names[j] for j in ids), unknown
+
+
+def test_chicken_and_rice_resolve_to_their_kinds_and_cuts(idx):
+    names, unknown = _resolve(idx, ["chicken", "Rice"])
+    assert unknown == []
+    assert names == ["basmati rice", "chicken breast", "chicken thigh", "jasmine rice"]
+    assert [h.meal_id for h in pantry_match(idx, resolve_pantry(idx, ["chicken", "rice"])[0])][:2] == ["m1", "m2"]
+
+
+def test_exact_and_synonym_names(idx):
+    assert _resolve(idx, ["2 tomatoes", "scallions"]) == (["green onion", "tomato"], [])
+
+
+def test_staples_and_unknowns(idx):
+    assert _resolve(idx, ["olive oil", "salt", "unobtainium"]) == ([], ["unobtainium"])
+    assert _resolve(idx, ["broth"]) == (["chicken broth"], [])        # a kind of broth
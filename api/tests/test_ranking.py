@@ -0,0 +1,32 @@
+# test_ranking.py
+"""Deeper rankings extend shallower ones and reach past the MMR pool."""
+
+import json
+
+import sqlalchemy as sa
+
+import ranking
+from meal_features import load_meal_features
+from ranking import UserProfile, rank_depth, rank_for_user
+
+
+def test_deeper_ranking_is_an_extension(engine, monkeypatch):
+    monkeypatch.setattr(ranking, "MMR_POOL", 8)
+    rows = [{"id": f"m{i:02d}", "t": f"Meal {i}", "c": ("thai", "greek", "mexican")[i % 3],
+             "cals": 300 + 10 * i, "r": 3 + (i % 5) / 2, "a": json.dumps(["fish"] if i % 7 == 0 else [])}
+            for i in range(30)]
+    with engine.begin() as conn:
+        conn.execute(sa.text("INSERT INTO meals (id, title, cuisine, cals, user_rating, allergens) "
+                             "VALUES (:id, :t, :c, :cals, :r, :a)"), rows)
+        f = load_meal_features(conn)
+    prof = UserProfile(user_id="u1", goal_daily_calories=1800, allergens=["fish"])
+
+    short, full = rank_for_user(f, prof, 5), rank_for_user(f, prof, 100)
+    assert full[:5] == short
+    assert sorted(full) == sorted(r["id"] for r in rows if r["a"] == "[]")     # all 25, past the pool of 8
+    assert rank_for_user(f, prof, 12) == full[:12]
+
+
+def test_rank_depth_rounds_up_to_whole_chunks():
+    d = ranking.RANK_DEPTH
+    assert [rank_depth(n) for n in (0, 1, d, d + 1)] == [d, d, d, 2 * d]
@@ -0,0 +1,168 @@
+# test_singleflight.py
+"""Coalescing: shared results, uncached errors, TTL expiry, and forget() mid-flight."""
+
+import threading
+import time
+
+import pytest
+
+import singleflight
+from singleflight import SingleFlight
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Gated:
+    """fn(x) that blocks each call on its own gate and counts calls."""
+
+    def __init__(self):
+        self.calls = 0
+        self.started = [threading.Event() for _ in range(4)]
+        self.gates = [threading.Event() for _ in range(4)]
+
+    def __call__(self, x):
+        n = self.calls
+        self.calls += 1
+        self.started[n].set()
+        assert self.gates[n].wait(5)
+        return (x, n)
+
+
+def _spawn(fn, *args):
+    out = {}
+    t = threading.Thread(target=lambda: out.setdefault("r", fn(*args)))
+    t.start()
+    return t, out
+
+
+def _wait_joined(sf, n):
+    deadline = time.monotonic() + 5
+    while sf.stats["joined"] < n:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_concurrent_calls_share_one_result():
+    fn = Gated()
+    sf = SingleFlight("t-share", fn, ttl=0.0, ignore=())
+    a, ra = _spawn(sf, 1)
+    assert fn.started[0].wait(5)
+    b, rb = _spawn(sf, 1)
+    _wait_joined(sf, 1)
+    fn.gates[0].set()
+    a.join(5), b.join(5)
+    assert ra["r"] is rb["r"] and fn.calls == 1
+    assert sf.calls == {}                           # ttl 0: nothing kept
+
+
+def test_errors_reach_waiters_but_are_not_cached():
+    gate, calls = threading.Event(), []
+
+    def flaky(x):
+        calls.append(x)
+        if len(calls) == 1:
+            assert gate.wait(5)
+            raise ValueError("boom")
+        return x
+
+    sf = SingleFlight("t-errors", flaky, ttl=60.0, ignore=())
+    errors = []
+
+    def call():
+        try:
+            sf(7)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(2)]
+    threads[0].start()
+    while not calls:
+        time.sleep(0.001)
+    threads[1].start()
+    _wait_joined(sf, 1)
+    gate.set()
+    for t in threads:
+        t.join(5)
+    assert len(errors) == 2 and errors[0] is errors[1]
+    assert sf(7) == 7 and len(calls) == 2           # the retry recomputes
+    assert sf.stats["errors"] == 1
+
+
+def test_results_expire_after_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(singleflight.time, "monotonic", clock)
+    calls = []
+    sf = SingleFlight("t-ttl", lambda x: calls.append(x) or len(calls), ttl=2.0, ignore=())
+
+    assert sf(1) == 1 and sf(2) == 2
+    clock.now += 1.5
+    assert sf(1) == 1 and sf.stats["cached"] == 1
+    clock.now += 1.0
+    assert sf(1) == 3                               # expired: recomputed
+    assert set(sf.calls) == {(("x", 1),)}           # the leader swept the stale x=2
+    assert sf.stats["expired"] == 1
+
+
+def test_forget_detaches_an_in_flight_call():
+    fn = Gated()
+    sf = SingleFlight("t-forget", fn, ttl=60.0, ignore=())
+    old, r_old = _spawn(sf, 1)
+    assert fn.started[0].wait(5)
+    joined, r_joined = _spawn(sf, 1)
+    _wait_joined(sf, 1)
+
+    sf.forget()                                     # a write lands mid-computation
+    new, r_new = _spawn(sf, 1)
+    assert fn.started[1].wait(5)                    # starts fresh instead of joining
+    fn.gates[0].set()
+    old.join(5), joined.join(5)
+    assert r_old["r"] == r_joined["r"] == (1, 0)
+
+    fn.gates[1].set()
+    new.join(5)
+    assert r_new["r"] == (1, 1)
+    assert sf(1) == (1, 1) and fn.calls == 2        # cached from the fresh call, not the stale one
+
+
+def test_detached_leader_finishing_leaves_the_new_flight_joinable():
+    fn = Gated()
+    sf = SingleFlight("t-forget-ttl0", fn, ttl=0.0, ignore=())
+    old, _ = _spawn(sf, 1)
+    assert fn.started[0].wait(5)
+    sf.forget()
+    new, r_new = _spawn(sf, 1)
+    assert fn.started[1].wait(5)
+    fn.gates[0].set()
+    old.join(5)                                     # must not drop the new call's entry
+    late, r_late = _spawn(sf, 1)
+    _wait_joined(sf, 1)
+    fn.gates[1].set()
+    new.join(5), late.join(5)
+    assert r_late["r"] is r_new["r"] and fn.calls == 2
+
+
+def test_forget_by_name_and_keys_ignore_arguments():
+    calls = []
+
+    @singleflight.single_flight("t-named", ttl=60.0, ignore=("conn",))
+    def total(conn, user_id, days=7):
+        calls.append((conn, user_id, days))
+        return len(calls)
+
+    assert total("c1", "u1") == total("c2", "u1", days=7) == 1
+    assert total("c1", "u1", 30) == 2
+    singleflight.forget("t-named")
+    assert total("c1", "u1") == 3
+    assert singleflight.flight_stats()["t-named"]["entries"] == 1
+
+
+@pytest.fixture(autouse=True)
+def _unregister():
+    yield
+    singleflight._registry.pop("t-named", None)
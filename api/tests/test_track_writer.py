@@ -0,0 +1,90 @@
+# test_track_writer.py
+"""Group commit: coalescing, error fan-out, and callers that give up early."""
+
+import asyncio
+
+import pytest
+import sqlalchemy as sa
+
+import db
+from track_writer import TrackWriter
+
+
+def _row(user="u1", day="2026-01-01", kcal=100.0):
+    return {"user_id": user, "date": day, "calories": kcal, "protein": 1.0, "carbs": 2.0, "fat": 3.0}
+
+
+def _stored(engine):
+    with engine.connect() as conn:
+        return {(u, d): c for u, d, c in conn.execute(sa.text("SELECT user_id, date, calories FROM track"))}
+
+
+def test_same_day_writes_coalesce_into_one_commit(engine):
+    w = TrackWriter(engine, flush_ms=100)
+    try:
+        futs = [w.submit(_row(kcal=1.0)), w.submit(_row(kcal=2.0)), w.submit(_row(user="u2"))]
+        results = [f.result(timeout=5) for f in futs]
+        assert results[0] is results[2]                 # one batch
+        assert w.counters["coalesced"] == 1
+        assert (w.counters["batches"], w.counters["rows_written"]) == (1, 2)
+        assert _stored(engine) == {("u1", "2026-01-01"): 2.0, ("u2", "2026-01-01"): 100.0}
+    finally:
+        w.close()
+
+
+def test_flush_error_reaches_every_waiter(tmp_path):
+    engine = db.make_engine(db.database_url(str(tmp_path / "empty.db")))   # no track table
+    w = TrackWriter(engine, flush_ms=50)
+
+    async def both():
+        return await asyncio.gather(w.upsert(_row()), w.upsert(_row(user="u2")), return_exceptions=True)
+
+    try:
+        results = asyncio.run(both())
+        assert all(isinstance(r, sa.exc.NoSuchTableError) for r in results)
+        assert w.counters["errors"] == 1
+        assert w.thread.is_alive()
+    finally:
+        w.close()
+        engine.dispose()
+
+
+def test_timeout_does_not_cancel_the_rest_of_the_batch(engine):
+    w = TrackWriter(engine, flush_ms=300)
+
+    async def run():
+        early = w.upsert(_row(kcal=1.0), timeout=0.05)
+        patient = w.upsert(_row(user="u2", kcal=2.0), timeout=5)
+        return await asyncio.gather(early, patient, return_exceptions=True)
+
+    try:
+        early, patient = asyncio.run(run())
+        assert isinstance(early, asyncio.TimeoutError)
+        assert patient["calories"] == 2.0
+        assert w.thread.is_alive()
+        assert _stored(engine) == {("u1", "2026-01-01"): 1.0, ("u2", "2026-01-01"): 2.0}
+        assert asyncio.run(w.upsert(_row(day="2026-01-02"), timeout=5))["date"] == "2026-01-02"
+    finally:
+        w.close()
+
+
+def test_cancelled_caller_leaves_the_batch_and_writer_intact(engine):
+    w = TrackWriter(engine, flush_ms=200)
+
+    async def run():
+        gone = asyncio.ensure_future(w.upsert(_row(kcal=1.0)))
+        stays = asyncio.ensure_future(w.upsert(_row(user="u2", kcal=2.0)))
+        await asyncio.sleep(0.02)
+        gone.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await gone
+        return await stays
+
+    try:
+        assert asyncio.run(run())["calories"] == 2.0
+        # a Future cancelled from outside affects only its own caller
+        w.submit(_row(day="2026-01-03")).cancel()
+        assert asyncio.run(w.upsert(_row(day="2026-01-04"), timeout=5))["date"] == "2026-01-04"
+        assert w.thread.is_alive()
+    finally:
+        w.close()
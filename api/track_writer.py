@@ -0,0 +1,183 @@
+# track_writer.py
+"""
+Write-behind group commit for track logging (POST /v1/track).
+
+    TRACK_WRITER = TrackWriter(engine)
+    saved = await TRACK_WRITER.upsert(row)      # returns once the row is committed
+    TRACK_WRITER.stats()                        # served at /v1/metrics
+
+Upserts go into an in-memory buffer keyed by (user_id, date); a second write to
+the same day before the flush replaces the first (last write wins). One writer
+thread flushes the buffer in a single transaction when it holds TRACK_FLUSH_ROWS
+rows or TRACK_FLUSH_MS after the first row arrived, so N concurrent loggers cost
+one commit per window rather than N: at most ~1000/TRACK_FLUSH_MS commits a
+second whatever the load, for up to TRACK_FLUSH_MS of extra latency per write.
+
+Durability: upsert() resolves only after the transaction holding the row has
+committed (SQLite in WAL mode, synchronous=FULL by default, so the commit is on
+disk), and returns the row as written. If the flush fails every waiter in that
+batch gets the error; nothing is retried behind the client's back. submit()
+is the fire-and-forget variant: the row is in the buffer, not yet on disk, and
+is lost if the process dies before the next flush (close() flushes on shutdown).
+
+Each submit() gets its own Future, resolved when its batch commits or fails,
+so a caller that times out or is cancelled gives up only its own wait; the
+rest of the batch still gets its result. The writer thread survives any error
+in a flush.
+
+Batches are flushed in order by the one thread, so a later write to a day never
+lands before an earlier one. on_commit() (if given) runs on that thread after
+each committed batch, before any waiter is woken — main.py drops the track /
+stats / home micro-caches there, so a confirmed write is read back at once.
+"""
+
+import asyncio, os, threading, time
+from concurrent.futures import Future, InvalidStateError
+from typing import Callable, Dict, List, Optional, Tuple
+
+import db
+
+FLUSH_MS = float(os.getenv("TRACK_FLUSH_MS", "20"))
+FLUSH_ROWS = int(os.getenv("TRACK_FLUSH_ROWS", "256"))
+TABLE = "track"
+KEY = ("user_id", "date")
+
+Key = Tuple[str, str]
+
+
+class _Batch:
+    __slots__ = ("rows", "waiters", "opened")
+
+    def __init__(self):
+        self.rows: Dict[Key, dict] = {}
+        self.waiters: List[Future] = []    # one per submit(): → rows as committed, or the flush error
+        self.opened = 0.0
+
+    def resolve(self, result=None, error: Optional[BaseException] = None) -> None:
+        for fut in self.waiters:
+            _resolve(fut, result, error)
+
+
+def _resolve(fut: Future, result=None, error: Optional[BaseException] = None) -> None:
+    """Set a waiter's result; a no-op if it was already cancelled."""
+    if fut.done():
+        return
+    try:
+        if error is not None:
+            fut.set_exception(error)
+        else:
+            fut.set_result(result)
+    except InvalidStateError:   # cancelled or resolved in between
+        pass
+
+
+class TrackWriter:
+    def __init__(self, engine, flush_ms: float = FLUSH_MS, max_rows: int = FLUSH_ROWS,
+                 on_commit: Optional[Callable[[], None]] = None):
+        self.engine = engine
+        self.on_commit = on_commit
+        self.flush_s = flush_ms / 1000.0
+        self.max_rows = max_rows
+        self.cond = threading.Condition()
+        self.batch = _Batch()
+        self.closed = False
+        self.thread: Optional[threading.Thread] = None
+        self.counters = {"queued": 0, "coalesced": 0, "batches": 0, "rows_written": 0, "errors": 0, "max_batch": 0}
+        self.commit_ms_total = 0.0
+
+    def submit(self, row: dict) -> Future:
+        """Buffer one upsert; the Future resolves to {key: row} for its batch once committed."""
+        key = (row["user_id"], row["date"])
+        with self.cond:
+            if self.closed:
+                raise RuntimeError("track writer is closed")
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="track-writer", daemon=True)
+                self.thread.start()
+            b = self.batch
+            if not b.rows:
+                b.opened = time.monotonic()
+            self.counters["queued"] += 1
+            if key in b.rows:
+                self.counters["coalesced"] += 1
+            b.rows[key] = row
+            fut: Future = Future()
+            b.waiters.append(fut)
+            self.cond.notify()
+            return fut
+
+    async def upsert(self, row: dict, timeout: float = 10.0) -> dict:
+        """submit() and wait (without holding a worker thread) for the commit; the saved row."""
+        rows = await asyncio.wait_for(asyncio.wrap_future(self.submit(row)), timeout)
+        return rows[(row["user_id"], row["date"])]
+
+    def _take(self) -> Optional[_Batch]:
+        """Wait until the open batch is due (full, old enough, or closing) and swap in a fresh one."""
+        with self.cond:
+            while True:
+                b = self.batch
+                if b.rows:
+                    left = b.opened + self.flush_s - time.monotonic()
+                    if len(b.rows) >= self.max_rows or left <= 0 or self.closed:
+                        self.batch = _Batch()
+                        return b
+                    self.cond.wait(left)
+                elif self.closed:
+                    return None
+                else:
+                    self.cond.wait()
+
+    def _run(self) -> None:
+        while True:
+            b = self._take()
+            if b is None:
+                return
+            try:
+                self._flush(b)
+            except Exception as e:      # never let the writer thread die
+                print(f"❌ track writer: {e!r}")
+                b.resolve(error=e)
+
+    def _flush(self, b: _Batch) -> None:
+        rows: List[dict] = list(b.rows.values())
+        t0 = time.perf_counter()
+        try:
+            with self.engine.begin() as conn:
+                db.upsert(conn, TABLE, rows, key=KEY)
+        except Exception as e:
+            print(f"❌ track flush of {len(rows)} row(s) failed: {e!r}")
+            self.counters["errors"] += 1
+            b.resolve(error=e)
+            return
+        self.commit_ms_total += (time.perf_counter() - t0) * 1000.0
+        self.counters["batches"] += 1
+        self.counters["rows_written"] += len(rows)
+        self.counters["max_batch"] = max(self.counters["max_batch"], len(rows))
+        if self.on_commit is not None:
+            try:
+                self.on_commit()
+            except Exception as e:
+                print(f"⚠️ track on_commit failed: {e!r}")
+        b.resolve(result=b.rows)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Flush what's buffered and stop the writer thread."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self.cond:
+            pending = len(self.batch.rows)
+        batches = self.counters["batches"] or 1
+        return {
+            **self.counters,
+            "pending": pending,
+            "avg_batch": round(self.counters["rows_written"] / batches, 2),
+            "avg_commit_ms": round(self.commit_ms_total / batches, 2),
+            "flush_ms": self.flush_s * 1000.0,
+            "flush_rows": self.max_rows,
+        }
+
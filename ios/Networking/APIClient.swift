@@ -320,6 +320,75 @@ extension APIClient {
     }
 }
 
+// Everything Home needs in one round trip (GET /v1/home)
+struct HomeDTO: Decodable {
+    struct Basket: Decodable {
+        let week_start: String
+        let source_plan_id: Int?
+        let item_count: Int
+        let estimated_total: Double
+    }
+    let user_id: String
+    let stats: StatsSummaryDTO
+    let plan: HomePlanDTO          // recipes also carry id + image_url
+    let track: [TrackEntryDTO]     // last 7 days, oldest first
+    let basket: Basket
+}
+
+extension APIClient {
+    /// GET /v1/home?user_id= (replaces stats + current plan + track + basket on Home)
+    func fetchHome(userId: String) async throws -> HomeDTO {
+        try await get("v1/home", query: [.init(name: "user_id", value: userId)])
+    }
+}
+
+// Search-as-you-type (GET /v1/recipes/suggest)
+struct SuggestionDTO: Decodable, Hashable {
+    let text: String
+    let kind: String           // recipe | cuisine | tag | ingredient
+    let meal_id: String?       // recipes only
+    let weight: Double
+}
+
+extension APIClient {
+    /// GET /v1/recipes/suggest?prefix= → up to 10 completions, most popular first
+    func fetchSuggestions(prefix: String, k: Int = 10) async throws -> [SuggestionDTO] {
+        try await get("v1/recipes/suggest", query: [
+            .init(name: "prefix", value: prefix),
+            .init(name: "k", value: String(k))
+        ])
+    }
+}
+
+// "Cook with what I have" (POST /v1/recipes/pantry-match)
+struct PantryMatchRequest: Encodable {
+    let ingredients: [String]
+    var k: Int = 20
+    var min_coverage: Double = 0
+}
+
+struct PantryMatchDTO: Decodable {
+    struct Hit: Decodable, Identifiable {
+        var id: String { meal_id }
+        let meal_id: String
+        let coverage: Double       // 0...1, staples excluded
+        let have: Int
+        let required: Int
+        let missing: [String]
+        let recipe: Recipe?
+    }
+    let matched: [String]
+    let unknown: [String]
+    let results: [Hit]
+}
+
+extension APIClient {
+    /// POST /v1/recipes/pantry-match → recipes ranked by ingredients on hand
+    func pantryMatch(_ ingredients: [String], k: Int = 20) async throws -> PantryMatchDTO {
+        try await post("v1/recipes/pantry-match", body: PantryMatchRequest(ingredients: ingredients, k: k))
+    }
+}
+
 // MARK: - Image DTO
 
 struct ImageOnlyDTO: Decodable {